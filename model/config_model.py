@@ -16,6 +16,7 @@ class MaskConfig(BaseModel):
     feathering: int = Field(default=2, ge=0, description="Mask feathering level")
     mouth_tracking: bool = Field(default=False, description="Enable mouth tracking")
     debug_mask: bool = Field(default=False, description="Enable debug mask visualization")
+    downscale: int = Field(default=0, ge=0, description="Factor the mask feathering is computed at reduced resolution by, 0 for automatic, 1 for exact")
 
 
 class OtherConfig(BaseModel):
@@ -27,9 +28,29 @@ class OtherConfig(BaseModel):
     frame_to_preview: int = Field(default=100, ge=1, description="Frame number to preview")
 
 
+class PerformanceConfig(BaseModel):
+    """Throughput settings for the inference pipeline."""
+    queue_size: int = Field(default=8, ge=1, description="Maximum number of items waiting between two pipeline stages")
+    blend_workers: int = Field(default=4, ge=1, description="Number of threads compositing faces back into frames")
+    detect_every: int = Field(default=1, ge=1, description="Detect faces on at most every Nth frame and track them in between, 1 detects every frame")
+    detect_height: int = Field(default=0, ge=-1, description="Frame height faces are detected at, 0 picks one from the frame size, -1 detects at full resolution")
+    detect_workers: int = Field(default=1, ge=1, description="Number of processes detecting faces of a video in parallel, only used when detecting every frame")
+    device: Literal["auto", "cuda", "mps", "cpu"] = Field(default="auto", description="Device to render on, auto picks the GPU when there is one")
+    cpu_threads: int = Field(default=0, ge=0, description="Torch threads when rendering on the CPU, 0 for one per available CPU")
+    precision: Literal["fp32", "half", "bf16", "fp16", "int8"] = Field(default="fp32", description="Precision of Wav2Lip; half is bf16 on the CPU and fp16 on a GPU, falling back to fp32 when the first batch differs; int8 renders on the CPU with a model made by python -m wav2lip.quantize")
+    backend: Literal["eager", "trace", "compile"] = Field(default="eager", description="How Wav2Lip runs; trace and compile compile it once per batch size bucket and cache it in wav2lip/checkpoints/compiled")
+    silence: Literal["off", "original", "closed"] = Field(default="off", description="Skip Wav2Lip on silent stretches of the audio: original shows the face unchanged, closed shows a closed mouth, predicted once for a still image and on every frame of a video")
+    silence_threshold: float = Field(default=40.0, gt=0, description="How many dB below the loudest part of the audio counts as silence")
+    silence_min_duration: float = Field(default=0.5, ge=0, description="Shortest pause in seconds that counts as silence")
+    silence_fade: int = Field(default=3, ge=0, description="Frames of the crossfade into and out of silence")
+    enhance_batch_size: int = Field(default=8, ge=1, description="Faces GFPGAN restores at once in Enhanced renders")
+    memory_budget: int = Field(default=0, ge=0, description="MB the models kept loaded between renders may take, least recently used ones are dropped beyond it, 0 for no limit")
+    idle_seconds: float = Field(default=0, ge=0, description="Seconds after which a model no render used is dropped, 0 to keep it loaded")
+
+
 class OptionsConfig(BaseModel):
     """Main options configuration."""
-    quality: Literal["Fast", "Improved", "Enhanced", "Experimental"] = Field(
+    quality: Literal["Fast", "Improved", "Enhanced-Lite", "Enhanced", "Experimental"] = Field(
         default="Improved", 
         description="Processing quality level"
     )
@@ -49,6 +70,10 @@ class OptionsConfig(BaseModel):
         default=True,
         description="Disable smoothing"
     )
+    smoothing: Literal["window", "ema", "one_euro"] = Field(
+        default="window",
+        description="Smoothing of face detections: a window over the next frames, or a causal exponential or One-Euro filter"
+    )
     preview_window: Literal["Full"] = Field(
         default="Full",
         description="Preview window mode"
@@ -61,6 +86,7 @@ class Wav2LipConfig(BaseModel):
     PADDING: PaddingConfig = Field(default_factory=PaddingConfig)
     MASK: MaskConfig = Field(default_factory=MaskConfig)
     OTHER: OtherConfig = Field(default_factory=OtherConfig)
+    PERFORMANCE: PerformanceConfig = Field(default_factory=PerformanceConfig)
 
     class Config:
         """Pydantic model configuration."""
@@ -72,6 +98,7 @@ class Wav2LipConfig(BaseModel):
         descriptions = {
             "Fast": "Wav2Lip only",
             "Improved": "Wav2Lip with a feathered mask around the mouth to remove the square around the face",
+            "Enhanced-Lite": "Wav2Lip + mask + bicubic upsampling and sharpening of the mouth, at video rate on a CPU",
             "Enhanced": "Wav2Lip + mask + GFPGAN upscaling done on the face",
             "Experimental": "Test version of applying gfpgan - see release notes"
         }
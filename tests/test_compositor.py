@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from wav2lip.compositor import AlphaCompositor, prepare_alpha
+
+
+def pil_paste(frame, src, mask, x, y):
+    # the blend the compositor replaced: paste the crop at (x, y) through an "L" mask
+    image = Image.fromarray(frame)
+    image.paste(Image.fromarray(src), (x, y), Image.fromarray(mask, "L"))
+    return np.asarray(image)
+
+
+def random_box(rng, h, w):
+    # may reach past every edge of the frame, like a padded face box
+    bh, bw = rng.integers(8, h // 2), rng.integers(8, w // 2)
+    return rng.integers(-bh // 2, h - bh // 2), rng.integers(-bw // 2, w - bw // 2), bh, bw
+
+
+def clipped(frame, y, x, bh, bw):
+    """Slices of the frame and of the crop where a box at (y, x) overlaps the frame."""
+    h, w = frame.shape[:2]
+    y1, y2, x1, x2 = max(0, y), min(h, y + bh), max(0, x), min(w, x + bw)
+    return (slice(y1, y2), slice(x1, x2)), (slice(y1 - y, y2 - y), slice(x1 - x, x2 - x))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_composite_matches_pil_paste(seed):
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 256, (72, 96, 3), np.uint8)
+    y, x, bh, bw = random_box(rng, 72, 96)
+    src = rng.integers(0, 256, (bh, bw, 3), np.uint8)
+    mask = rng.integers(0, 256, (bh, bw), np.uint8)
+    mask[0, 0], mask[-1, -1] = 0, 255
+
+    expected = pil_paste(frame, src, mask, x, y)
+
+    (fy, fx), (cy, cx) = clipped(frame, y, x, bh, bw)
+    out = frame.copy()
+    AlphaCompositor().composite(src[cy, cx], out[fy, fx], prepare_alpha(mask[cy, cx]), out=out[fy, fx])
+    np.testing.assert_array_equal(out, expected)
+
+
+@pytest.mark.parametrize(
+    "boxes, shared",
+    [
+        ([(10, 12), (0, 0), (28, 36), (5, 30)], True),
+        ([(10, 12), (0, 0), (28, 36), (5, 30)], False),
+        # every box hangs 6 px over the left or the right edge, so the clipped crops share a shape
+        ([(10, -6), (0, 42), (28, -6), (5, 42)], False),
+    ],
+)
+def test_composite_batch_matches_pil_paste(boxes, shared):
+    rng = np.random.default_rng(1)
+    n, bh, bw = len(boxes), 20, 28
+    frames = rng.integers(0, 256, (n, 48, 64, 3), np.uint8)
+    srcs = rng.integers(0, 256, (n, bh, bw, 3), np.uint8)
+    masks = rng.integers(0, 256, (n, bh, bw), np.uint8)
+    if shared:
+        masks[:] = masks[0]
+
+    regions = [clipped(frame, y, x, bh, bw) for frame, (y, x) in zip(frames, boxes)]
+    out = frames.copy()
+    crops = np.stack([src[cy, cx] for src, (_, (cy, cx)) in zip(srcs, regions)])
+    dsts = np.stack([frame[fy, fx] for frame, ((fy, fx), _) in zip(out, regions)])
+    if shared:
+        alpha = prepare_alpha(masks[0])
+    else:
+        alpha = prepare_alpha(np.stack([mask[cy, cx] for mask, (_, (cy, cx)) in zip(masks, regions)]))
+    blended = AlphaCompositor().composite_batch(crops, dsts, alpha)
+    for frame, crop, ((fy, fx), _) in zip(out, blended, regions):
+        frame[fy, fx] = crop
+
+    for frame, expected, src, mask, (y, x) in zip(out, frames, srcs, masks, boxes):
+        np.testing.assert_array_equal(frame, pil_paste(expected, src, mask, x, y))
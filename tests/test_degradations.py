@@ -0,0 +1,113 @@
+import math
+import random
+
+import numpy as np
+import pytest
+import torch
+from scipy.stats import ks_2samp
+
+from wav2lip.degradations import (
+    KernelBank,
+    _poisson_vals_pt,
+    generate_gaussian_noise_pt,
+    generate_poisson_noise_pt,
+    mesh_grid,
+    random_mixed_kernels,
+)
+
+KERNEL_SIZE = 21
+# the blur settings Real-ESRGAN degrades its training data with, as in benchmark kernels
+OPTIONS = dict(
+    kernel_list=["iso", "aniso", "generalized_iso", "generalized_aniso", "plateau_iso", "plateau_aniso"],
+    kernel_prob=[0.45, 0.25, 0.12, 0.03, 0.12, 0.03],
+    kernel_size=KERNEL_SIZE,
+    sigma_x_range=(0.2, 3),
+    sigma_y_range=(0.2, 3),
+    rotation_range=(-math.pi, math.pi),
+    betag_range=(0.5, 4),
+    betap_range=(1, 2),
+)
+
+
+def summary(kernels):
+    # spread (second moment about the centre) and peak summarize the shape of a kernel
+    _, xx, yy = mesh_grid(KERNEL_SIZE)
+    return (kernels * (xx**2 + yy**2)).sum(axis=(1, 2)), kernels.max(axis=(1, 2))
+
+
+@pytest.mark.parametrize("noise_range", [None, (0.75, 1.25)])
+@pytest.mark.parametrize("generator", ["sample", "sample_pt"])
+def test_kernel_bank_matches_random_mixed_kernels_in_distribution(generator, noise_range):
+    n = 2000
+    options = dict(OPTIONS, noise_range=noise_range)
+    random.seed(0)
+    np.random.seed(0)
+    expected = np.stack([random_mixed_kernels(**options) for _ in range(n)])
+
+    np.random.seed(1)
+    torch.manual_seed(1)
+    kernels = getattr(KernelBank(**options), generator)(n)
+    if generator == "sample_pt":
+        kernels = kernels.double().numpy()
+
+    assert kernels.shape == (n, KERNEL_SIZE, KERNEL_SIZE)
+    np.testing.assert_allclose(kernels.sum(axis=(1, 2)), 1, atol=1e-5)
+    for stat, bank_stat in zip(summary(expected), summary(kernels)):
+        assert ks_2samp(stat, bank_stat).pvalue > 0.01
+        assert bank_stat.mean() == pytest.approx(stat.mean(), rel=0.05)
+        assert bank_stat.std() == pytest.approx(stat.std(), rel=0.1)
+
+
+@pytest.mark.parametrize("kernel_type", OPTIONS["kernel_list"])
+def test_kernel_bank_matches_random_mixed_kernels_per_type(kernel_type):
+    # the mixture hides a wrong shape parameter of a rare type, so every type is checked on its own
+    n = 1000
+    options = dict(OPTIONS, kernel_list=[kernel_type], kernel_prob=[1])
+    random.seed(0)
+    np.random.seed(0)
+    expected = np.stack([random_mixed_kernels(**options) for _ in range(n)])
+    np.random.seed(1)
+    kernels = KernelBank(**options).sample(n)
+
+    for stat, bank_stat in zip(summary(expected), summary(kernels)):
+        assert ks_2samp(stat, bank_stat).pvalue > 0.01
+
+
+def test_gaussian_noise_of_a_batch_is_gray_per_image():
+    torch.manual_seed(0)
+    img = torch.rand(4, 3, 64, 64)
+    sigma = torch.tensor([5.0, 10.0, 20.0, 40.0])
+    gray = torch.tensor([1.0, 0.0, 1.0, 0.0])
+
+    noise = generate_gaussian_noise_pt(img, sigma, gray)
+
+    assert noise.shape == img.shape
+    for i in range(4):
+        channels_equal = torch.equal(noise[i, 0], noise[i, 1]) and torch.equal(noise[i, 1], noise[i, 2])
+        assert channels_equal == bool(gray[i])
+        assert noise[i].std().item() * 255 == pytest.approx(sigma[i].item(), rel=0.05)
+    # every gray image gets its own map
+    assert not torch.equal(noise[0, 0] / sigma[0], noise[2, 0] / sigma[2])
+
+
+def test_poisson_vals_match_unique_counts_per_image():
+    torch.manual_seed(0)
+    # images with 1 up to 256 distinct levels, including exact powers of two
+    levels = [1, 2, 3, 17, 64, 65, 200, 256]
+    img = torch.stack(
+        [(torch.randint(0, count, (3, 32, 32)) * (255 // max(count - 1, 1))).clamp(max=255) for count in levels]
+    ).float() / 255.0
+
+    vals = _poisson_vals_pt(img)
+
+    expected = [2 ** math.ceil(math.log2(len(torch.unique(image)))) for image in img]
+    assert vals.shape == (len(levels), 1, 1, 1) and vals.dtype == img.dtype
+    assert vals.flatten().tolist() == expected
+
+
+def test_poisson_noise_of_a_batch_with_gray_images():
+    torch.manual_seed(0)
+    img = torch.rand(3, 3, 32, 32)
+    noise = generate_poisson_noise_pt(img, torch.tensor([1.0, 0.5, 1.0]), torch.tensor([1.0, 0.0, 0.0]))
+    assert noise.shape == img.shape
+    assert torch.equal(noise[0, 0], noise[0, 1]) and not torch.equal(noise[1, 0], noise[1, 1])
@@ -0,0 +1,53 @@
+import cv2
+import numpy as np
+import pytest
+
+from wav2lip import detection
+from wav2lip.detection import open_at
+
+
+@pytest.fixture
+def numbered_video(tmp_path):
+    # frame i is uniformly 8 * i, so a decoded frame tells its index
+    path = str(tmp_path / "numbered.avi")
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (64, 48))
+    for i in range(30):
+        out.write(np.full((48, 64, 3), 8 * i, np.uint8))
+    out.release()
+    return path
+
+
+def frame_index(video_stream):
+    ok, frame = video_stream.read()
+    assert ok
+    return int(round(frame.mean() / 8))
+
+
+@pytest.mark.parametrize("start", [0, 1, 13, 29])
+def test_open_at_reads_from_start(numbered_video, start):
+    video_stream = open_at(numbered_video, start)
+    assert frame_index(video_stream) == start
+    video_stream.release()
+
+
+_VideoCapture = cv2.VideoCapture
+
+
+class _InexactCapture:
+    """VideoCapture whose seeks land a few frames off, like on some inter-coded streams."""
+
+    def __init__(self, path):
+        self.capture = _VideoCapture(path)
+
+    def set(self, prop, value):
+        return self.capture.set(prop, max(0, value - 3))
+
+    def __getattr__(self, name):
+        return getattr(self.capture, name)
+
+
+def test_open_at_decodes_up_to_start_when_the_seek_misses(numbered_video, monkeypatch):
+    monkeypatch.setattr(detection.cv2, "VideoCapture", _InexactCapture)
+    video_stream = open_at(numbered_video, 13)
+    assert frame_index(video_stream) == 13
+    video_stream.release()
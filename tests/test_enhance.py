@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+import torch
+
+from wav2lip.enhance import FACE_SIZE, FACE_TEMPLATE, align_face, paste_face, restore_faces
+
+
+class StubGFPGAN(torch.nn.Module):
+    """Stands in for the GFPGAN network: mixes the channels, so RGB and BGR
+    mix-ups show, scales by ``weight`` and overshoots [-1, 1] so the clamp
+    matters. Elementwise, so a batch gives the same numbers as single faces."""
+
+    def forward(self, x, return_rgb=False, weight=0.5):
+        r, g, b = x.unbind(1)
+        out = torch.stack([0.9 * r + 0.6 * b, g - 0.3 * r, 1.4 * b], 1) * (0.5 + weight)
+        return out, None
+
+
+class FaceHelper:
+    # the part of facexlib's FaceRestoreHelper enhance(has_aligned=True) uses
+    def clean_all(self):
+        self.cropped_faces, self.restored_faces = [], []
+
+    def add_restored_face(self, face):
+        self.restored_faces.append(face)
+
+
+def gfpganer(GFPGANer):
+    # GFPGANer.__init__ loads the weights and the detection model, skip it
+    properties = GFPGANer.__new__(GFPGANer)
+    properties.gfpgan = StubGFPGAN()
+    properties.device = torch.device("cpu")
+    properties.face_helper = FaceHelper()
+    return properties
+
+
+@pytest.mark.parametrize("weight", [0.5, 1.0])
+def test_restore_faces_matches_gfpganer_enhance(weight):
+    GFPGANer = pytest.importorskip("gfpgan").GFPGANer
+    properties = gfpganer(GFPGANer)
+    rng = np.random.default_rng(0)
+    faces = list(rng.integers(0, 256, (3, FACE_SIZE, FACE_SIZE, 3), np.uint8))
+
+    restored = restore_faces(properties, faces, weight)
+
+    assert restored.shape == (3, FACE_SIZE, FACE_SIZE, 3) and restored.dtype == np.uint8
+    for face, batched in zip(faces, restored):
+        _, (expected,), _ = properties.enhance(face, has_aligned=True, paste_back=False, weight=weight)
+        np.testing.assert_array_equal(batched, expected)
+
+
+def face_image(h=256, w=224):
+    # smooth, so warping there and back only loses interpolation error
+    y, x = np.mgrid[:h, :w].astype(np.float32)
+    image = np.stack([x / w * 200 + 20, y / h * 180 + 40, (x + y) / (h + w) * 120 + 60], -1)
+    return image.round().astype(np.uint8), FACE_TEMPLATE * 0.35 + (22, 30)
+
+
+def test_align_and_paste_round_trip():
+    image, landmarks = face_image()
+    face, affine = align_face(image, landmarks)
+    assert face.shape == (FACE_SIZE, FACE_SIZE, 3)
+    # the landmarks land on the template
+    moved = np.hstack([landmarks, np.ones((5, 1), np.float32)]) @ affine.T
+    np.testing.assert_allclose(moved, FACE_TEMPLATE, atol=0.5)
+
+    out = paste_face(image, face, affine)
+    diff = np.abs(out.astype(int) - image)
+    # inside the face the unchanged face comes back, outside the image is untouched
+    x1, y1 = landmarks.min(0).astype(int)
+    x2, y2 = landmarks.max(0).astype(int)
+    assert diff[y1:y2, x1:x2].max() <= 1
+    assert diff.max() <= 2
+    # the 512 px face is 179 px here, placed at (22, 30)
+    assert (diff[215:] == 0).all() and (diff[:, 205:] == 0).all()
+
+
+# brighter faces pick up the black border of the inverse warp where the soft
+# edge is almost 0, as in facexlib, and would fail this for that reason
+@pytest.mark.parametrize("value", [37, 100, 150])
+def test_paste_face_rounds_the_blend(value):
+    image, landmarks = face_image()
+    image[:] = value
+    face, affine = align_face(image, landmarks)
+    face[:] = value
+    # a blend of a colour with itself is that colour, also under the soft edge
+    np.testing.assert_array_equal(paste_face(image, face, affine), image)
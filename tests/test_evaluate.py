@@ -0,0 +1,59 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pytest
+
+from wav2lip import evaluate
+from wav2lip.registry import ModelRegistry
+
+inference = pytest.importorskip("wav2lip.inference")
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    frames = [np.full((48, 64, 3), 10 * i, np.uint8) for i in range(10)]
+    corpus_dir = tmp_path / "evaluation"
+    corpus_dir.mkdir()
+    clip = {"name": "real", "face": evaluate._write_video(str(corpus_dir / "real.mp4"), frames, 25), "audio": "a.wav"}
+    with open(corpus_dir / "corpus.json", "w") as f:
+        json.dump([clip], f)
+    return str(corpus_dir)
+
+
+def test_evaluate_reuses_the_reference_in_a_new_process(corpus, monkeypatch):
+    renders = []
+
+    def render(inference, checkpoint_path, clip, config, out_dir):
+        renders.append(config)
+        os.makedirs(out_dir, exist_ok=True)
+        evaluate._write_video(os.path.join(out_dir, "result.mp4"), [np.zeros((48, 64, 3), np.uint8)] * 10, 25)
+        result = {"config": config, "frames": 10, "seconds": 1.0}
+        with open(os.path.join(out_dir, "render.json"), "w") as f:
+            json.dump(result, f)
+        return result
+
+    detectors = []
+    monkeypatch.setattr(evaluate, "render", render)
+    monkeypatch.setattr(evaluate, "mel_windows", lambda wav_path, fps, frames: np.zeros((frames, 80, 16)))
+
+    def face_boxes(detector, frames):
+        detectors.append(detector)
+        return [(0, 0, 64, 48)] * len(frames)
+
+    monkeypatch.setattr(evaluate, "face_boxes", face_boxes)
+    monkeypatch.setattr(inference, "_load_retinaface", lambda device: "retinaface")
+    args = argparse.Namespace(
+        checkpoint_path="Wav2Lip.pth", face="face.mp4", audio="a.wav", syncnet=None, corpus_dir=corpus, seconds=1.0,
+        render_args="", refresh_reference=False, warmup=False, min_psnr=30.0, max_sync_drop=0.5,
+    )
+
+    for _ in range(2):
+        # nothing is registered yet in a new process
+        monkeypatch.setattr(inference, "registry", ModelRegistry())
+        report = evaluate.evaluate(args, {})
+
+    assert renders == [evaluate.REFERENCE]
+    assert detectors == ["retinaface", "retinaface"]
+    assert [row["config"] for row in report["configs"]] == ["reference"]
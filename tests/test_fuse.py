@@ -0,0 +1,44 @@
+import copy
+
+import pytest
+import torch
+
+from wav2lip.benchmark import _randomize_batchnorm
+from wav2lip.easy_functions import load_model
+from wav2lip.models import SyncNet_color, Wav2Lip, fuse_conv_bn
+
+ATOL = 1e-4
+
+
+def inputs(name, n=4):
+    generator = torch.Generator().manual_seed(1)
+    faces = (n, 6, 96, 96) if name == "Wav2Lip" else (n, 15, 48, 96)
+    return torch.randn(n, 1, 80, 16, generator=generator), torch.rand(*faces, generator=generator)
+
+
+@pytest.mark.parametrize("cls", [Wav2Lip, SyncNet_color], ids=lambda cls: cls.__name__)
+def test_fused_model_matches_unfused(cls):
+    torch.manual_seed(0)
+    model = _randomize_batchnorm(cls().eval())
+    fused = fuse_conv_bn(copy.deepcopy(model))
+    assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in fused.modules())
+
+    with torch.inference_mode():
+        expected, actual = model(*inputs(cls.__name__)), fused(*inputs(cls.__name__))
+    if isinstance(expected, tuple):  # SyncNet returns the audio and face embeddings
+        for e, a in zip(expected, actual):
+            torch.testing.assert_close(a, e, atol=ATOL, rtol=0)
+    else:
+        torch.testing.assert_close(actual, expected, atol=ATOL, rtol=0)
+
+
+def test_load_model_folds_batchnorm_within_tolerance(tmp_path):
+    torch.manual_seed(0)
+    path = str(tmp_path / "Wav2Lip.pth")
+    torch.save({"state_dict": _randomize_batchnorm(Wav2Lip().eval()).state_dict()}, path)
+
+    fused, unfused = load_model(path, "cpu"), load_model(path, "cpu", fuse=False)
+    assert any(isinstance(m, torch.nn.BatchNorm2d) for m in unfused.modules())
+    assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in fused.modules())
+    with torch.inference_mode():
+        torch.testing.assert_close(fused(*inputs("Wav2Lip")), unfused(*inputs("Wav2Lip")), atol=ATOL, rtol=0)
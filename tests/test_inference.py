@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pytest
+
+inference = pytest.importorskip("wav2lip.inference")
+
+
+def session(tmp_path, face, *argv):
+    args = inference.parser.parse_args(["--checkpoint_path", "Wav2Lip.pth", "--face", str(face), "--audio", "a.wav", *argv])
+    return inference.InferenceSession(args, None, temp_dir=str(tmp_path))
+
+
+def test_face_cache_is_keyed_by_the_input_and_the_settings(tmp_path):
+    first, second, copy = tmp_path / "first.mp4", tmp_path / "second.mp4", tmp_path / "copy.mp4"
+    first.write_bytes(b"first video")
+    second.write_bytes(b"second video")
+    copy.write_bytes(b"first video")
+
+    path = session(tmp_path, first).face_cache_path()
+    assert session(tmp_path, copy).face_cache_path() == path
+    assert session(tmp_path, second).face_cache_path() != path
+    assert session(tmp_path, first, "--pads", "0", "20", "0", "0").face_cache_path() != path
+    # boxes are saved before smoothing, so the smoothing settings share them
+    assert session(tmp_path, first, "--nosmooth", "True").face_cache_path() == path
+
+
+def test_face_cache_given_explicitly_is_used_as_is(tmp_path):
+    face = tmp_path / "face.mp4"
+    face.write_bytes(b"video")
+    assert session(tmp_path, face, "--face_cache", "faces.pkl").face_cache_path() == "faces.pkl"
+
+
+@pytest.mark.parametrize("smoothing", ["window", "ema", "one_euro"])
+def test_cached_boxes_are_smoothed_like_detected_ones(tmp_path, monkeypatch, smoothing):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    face = tmp_path / "face.mp4"
+    face.write_bytes(b"video")
+    frames = [np.zeros((200, 300, 3), np.uint8) for _ in range(23)]
+    rects = np.cumsum(rng.integers(-6, 7, (len(frames), 4)), axis=0) + (80, 40, 200, 160)
+
+    def face_rect(images):
+        for image, rect in zip(images, rects):
+            yield tuple(int(v) for v in rect), np.zeros((5, 2), np.float32)
+
+    def boxes(session):
+        session.fps = 25.0
+        session.face_rect = face_rect
+        return [coords for _, coords, _ in session.face_detect(iter(frames))]
+
+    detected = boxes(session(tmp_path, face, "--smoothing", smoothing))
+    assert os.path.exists(session(tmp_path, face).face_cache_path())
+    assert boxes(session(tmp_path, face, "--smoothing", smoothing)) == detected
+    unsmoothed = boxes(session(tmp_path, face, "--nosmooth", "True"))
+    assert unsmoothed != detected
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from wav2lip.masks import MOUTH_TEMPLATE, auto_downscale, feather_params, mask_error
+
+
+def mouth(crop, width):
+    # mouth template with its corners ``width`` apart, low in a square crop
+    return np.round(MOUTH_TEMPLATE * width + (crop / 2, crop * 0.72)).astype(np.int32)
+
+
+@pytest.mark.parametrize("crop", [128, 192, 256, 384])
+@pytest.mark.parametrize("mouth_size", [0.25, 0.4])
+@pytest.mark.parametrize("dilation,feathering", [(1.0, 2), (1.5, 1), (2.5, 3)])
+def test_auto_downscale_stays_close_to_full_resolution(crop, mouth_size, dilation, feathering):
+    width = int(crop * mouth_size)
+    kernel_size, blur = feather_params(width, width // 2, dilation, feathering)
+    downscale = auto_downscale(blur)
+    assert downscale > 1
+
+    largest, mean = mask_error((crop, crop), mouth(crop, width), kernel_size, blur, downscale)
+
+    # the bounds documented in auto_downscale
+    assert largest <= 6
+    assert mean < 1
+
+
+def test_factor_one_is_the_reference():
+    kernel_size, blur = feather_params(64, 32, 2.5, 3)
+    assert mask_error((256, 256), mouth(256, 64), kernel_size, blur, 1) == (0, 0.0)
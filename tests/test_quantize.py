@@ -0,0 +1,50 @@
+import pytest
+import torch
+
+from wav2lip.benchmark import _randomize_batchnorm
+from wav2lip.easy_functions import load_model
+from wav2lip.models import Wav2Lip
+from wav2lip.quantize import load_quantized, quantize_static, quantized_path, save_quantized, split_batches
+
+
+def test_split_keeps_calibration_batches_out_of_evaluation():
+    batches = list(range(12))
+    calibration, evaluation = split_batches(batches, 256, 32)
+    assert calibration == list(range(8))
+    assert evaluation == list(range(8, 12))
+
+
+@pytest.mark.parametrize("count", [1, 8, 9])
+def test_split_refuses_too_few_held_out_batches(count):
+    with pytest.raises(ValueError, match="needed to evaluate on"):
+        split_batches(list(range(count)), 256, 32)
+
+
+def test_quantized_model_round_trips_within_tolerance(tmp_path):
+    torch.manual_seed(0)
+    path = str(tmp_path / "Wav2Lip.pth")
+    torch.save({"state_dict": _randomize_batchnorm(Wav2Lip().eval()).state_dict()}, path)
+    model = load_model(path, "cpu")
+
+    generator = torch.Generator().manual_seed(1)
+    batches = [
+        (torch.randn(4, 1, 80, 16, generator=generator), torch.rand(4, 6, 96, 96, generator=generator))
+        for _ in range(3)
+    ]
+    qmodel = quantize_static(model, batches[:2])
+    save_quantized(qmodel, quantized_path(path), path)
+    loaded = load_quantized(path)
+
+    # held out from calibration, like the CLI's evaluation frames
+    mel, faces = batches[2]
+    with torch.inference_mode():
+        expected, quantized, reloaded = model(mel, faces), qmodel(mel, faces), loaded(mel, faces)
+    torch.testing.assert_close(reloaded, quantized, atol=0, rtol=0)
+    assert (reloaded - expected).abs().mean() < 0.005
+    assert (reloaded - expected).abs().max() < 0.02
+
+
+def test_load_quantized_says_how_to_make_a_missing_model(tmp_path):
+    path = str(tmp_path / "Wav2Lip.pth")
+    with pytest.raises(FileNotFoundError, match="python -m wav2lip.quantize"):
+        load_quantized(path)
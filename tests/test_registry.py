@@ -0,0 +1,54 @@
+import time
+
+import torch
+
+from wav2lip.registry import ModelRegistry
+
+
+def registry_with(names, **kwargs):
+    registry = ModelRegistry(**kwargs)
+    for name in names:
+        # 1 MB of float32 weights each
+        registry.register(name, lambda device: torch.nn.Linear(512, 512, bias=False))
+    return registry
+
+
+def test_a_model_is_loaded_once():
+    registry = registry_with(["a"])
+    assert registry.get("a") is registry.get("a")
+    assert registry.stats()[0]["loads"] == 1
+
+
+def test_over_the_budget_the_least_recently_used_is_dropped():
+    registry = registry_with(["a", "b", "c"], memory_budget=int(2.5 * 2**20))
+    registry.get("a")
+    registry.get("b")
+    registry.get("a")
+    registry.get("c")
+    assert [registry.loaded(name) for name in "abc"] == [True, False, True]
+
+
+def test_pinned_models_are_kept():
+    registry = registry_with(["b"], memory_budget=1)
+    registry.register("a", lambda device: torch.nn.Linear(512, 512), pinned=True)
+    registry.get("a")
+    registry.get("b")
+    assert registry.loaded("a") and registry.loaded("b")
+    registry.evict()
+    assert registry.loaded("a") and not registry.loaded("b")
+
+
+def test_idle_models_are_dropped_without_another_get():
+    registry = registry_with(["a"], idle_seconds=0.05)
+    registry.get("a")
+    registry.start_evicting(0.02)
+    try:
+        deadline = time.monotonic() + 5
+        while registry.loaded("a") and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        registry.stop_evicting()
+    assert not registry.loaded("a")
+    # dropped models are loaded again when asked for
+    registry.get("a")
+    assert registry.stats()[0]["loads"] == 2
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from wav2lip.smoothing import (
+    EmaFilter,
+    OneEuroFilter,
+    causal_filter,
+    get_smoothened_box,
+    get_smoothened_boxes,
+    moving_average,
+    smooth_track,
+)
+
+
+def per_box(boxes, T):
+    boxes = [list(box) for box in boxes]
+    for i in range(len(boxes)):
+        get_smoothened_box(boxes, i, T)
+    return boxes
+
+
+@pytest.mark.parametrize("n", [1, 2, 4, 5, 6, 17, 200])
+@pytest.mark.parametrize("T", [1, 3, 5])
+def test_moving_average_matches_the_per_box_loop(n, T):
+    rng = np.random.default_rng(n * 10 + T)
+    boxes = rng.integers(0, 1000, (n, 4)).tolist()
+    expected = per_box(boxes, T)
+    assert moving_average(boxes, T).tolist() == expected
+    assert get_smoothened_boxes([list(b) for b in boxes], T) == expected
+
+
+def test_moving_average_matches_on_a_track_with_drift():
+    rng = np.random.default_rng(0)
+    track = np.cumsum(rng.integers(-7, 8, (500, 4)), axis=0) + 500
+    assert moving_average(track, 5).tolist() == per_box(track.tolist(), 5)
+
+
+def test_ema_passes_the_first_box_and_converges():
+    ema = EmaFilter(0.5)
+    assert ema([0, 0, 100, 100]) == [0, 0, 100, 100]
+    assert ema([10, 10, 110, 110]) == [5, 5, 105, 105]
+    for _ in range(40):
+        box = ema([10, 10, 110, 110])
+    assert box == [10, 10, 110, 110]
+    ema.reset()
+    assert ema([1, 2, 3, 4]) == [1, 2, 3, 4]
+
+
+def test_ema_with_alpha_one_does_not_smooth():
+    ema = EmaFilter(1.0)
+    ema([0, 0, 10, 10])
+    assert ema([7, 8, 9, 10]) == [7, 8, 9, 10]
+
+
+def test_one_euro_keeps_a_still_box():
+    f = OneEuroFilter(25)
+    for _ in range(10):
+        assert f([20, 30, 120, 130]) == [20, 30, 120, 130]
+
+
+def test_one_euro_follows_fast_motion_closer_with_a_higher_beta():
+    def lag(beta):
+        f = OneEuroFilter(25, beta=beta)
+        f([0, 0, 100, 100])
+        for step in range(1, 11):
+            box = f([20 * step, 0, 100 + 20 * step, 100])
+        return 200 - box[0]
+
+    assert lag(0.5) <= lag(0.05) < lag(0.0)
+
+
+def test_one_euro_uses_timestamps():
+    # a later timestamp means more time to catch up, so less lag
+    near, far = OneEuroFilter(25), OneEuroFilter(25)
+    near([0, 0, 10, 10], t=0.0)
+    far([0, 0, 10, 10], t=0.0)
+    assert near([50, 0, 60, 10], t=0.01)[0] < far([50, 0, 60, 10], t=1.0)[0]
+
+
+def test_causal_filter_modes():
+    assert isinstance(causal_filter("ema", 25), EmaFilter)
+    assert isinstance(causal_filter("one_euro", 25), OneEuroFilter)
+    with pytest.raises(ValueError):
+        causal_filter("window", 25)
+
+
+@pytest.mark.parametrize("mode", ["ema", "one_euro"])
+def test_smooth_track_runs_the_causal_filter_over_the_track(mode):
+    rng = np.random.default_rng(3)
+    track = rng.integers(0, 300, (30, 4)).tolist()
+    box_filter = causal_filter(mode, 25)
+    assert smooth_track(track, mode, 25) == [box_filter(box) for box in track]
+
+
+def test_smooth_track_window_matches_the_per_box_loop():
+    track = np.random.default_rng(4).integers(0, 300, (30, 4)).tolist()
+    assert smooth_track(track) == per_box(track, 5)
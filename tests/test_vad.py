@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from wav2lip.vad import fade_weights, silent_frames, window_loudness
+
+
+def test_window_loudness_of_constant_windows():
+    hop = 4
+    # two mel frames of a full scale square wave, one at -20 dB, one of digital silence
+    wav = np.concatenate([np.tile([1.0, -1.0], hop), np.full(2 * hop, 0.1), np.zeros(2 * hop)])
+    loudness = window_loudness(wav, [0, 2, 4], hop, 2)
+    np.testing.assert_allclose(loudness[:2], [0.0, -20.0], atol=1e-9)
+    assert loudness[2] == -np.inf
+
+
+def test_window_loudness_clips_windows_past_the_end():
+    wav = np.full(10, 0.5)
+    # the last window only has 2 samples left, the one after none
+    loudness = window_loudness(wav, [0, 2, 3], 4, 2)
+    np.testing.assert_allclose(loudness[:2], 20 * np.log10(0.5))
+    assert loudness[2] == -np.inf
+
+
+def test_silent_frames_is_relative_to_the_loudest_window():
+    loudness = np.array([0.0, -10.0, -45.0, -np.inf, -39.0, -3.0])
+    np.testing.assert_array_equal(silent_frames(loudness, 40.0), [0, 0, 1, 1, 0, 0])
+
+
+def test_silent_frames_drops_runs_shorter_than_min_frames():
+    loudness = np.where(np.array([1, 0, 1, 1, 0, 0, 1, 0, 0, 0, 1, 0, 0]), 0.0, -60.0)
+    # runs of 1, 2, 3 and, at the end, 2 silent frames
+    np.testing.assert_array_equal(silent_frames(loudness, 40.0, 1), loudness < -40)
+    np.testing.assert_array_equal(silent_frames(loudness, 40.0, 2), [0, 0, 0, 0, 1, 1, 0, 1, 1, 1, 0, 1, 1])
+    np.testing.assert_array_equal(silent_frames(loudness, 40.0, 3), [0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 0, 0, 0])
+
+
+def test_silent_frames_of_all_silent_audio():
+    assert silent_frames(np.full(4, -np.inf)).all()
+    assert silent_frames(np.array([])).shape == (0,)
+
+
+def test_fade_weights_ramp_into_and_out_of_a_pause():
+    silent = np.array([0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 0], bool)
+    np.testing.assert_allclose(
+        fade_weights(silent, 3), [1, 1, 0.75, 0.5, 0.25, 0, 0, 0.25, 0.5, 0.75, 1], atol=1e-7
+    )
+
+
+def test_fade_weights_of_a_short_pause_meet_in_the_middle():
+    silent = np.array([0, 1, 1, 1, 0], bool)
+    np.testing.assert_allclose(fade_weights(silent, 3), [1, 0.75, 0.5, 0.75, 1])
+
+
+def test_fade_weights_of_runs_at_the_ends_only_ramp_towards_the_voice():
+    silent = np.array([1, 1, 1, 0, 0, 1, 1, 1], bool)
+    np.testing.assert_allclose(fade_weights(silent, 2), [0, 1 / 3, 2 / 3, 1, 1, 2 / 3, 1 / 3, 0], atol=1e-7)
+    np.testing.assert_array_equal(fade_weights(np.ones(5, bool), 2), 0)
+
+
+def test_fade_weights_without_fade_are_hard_cuts():
+    silent = np.array([0, 1, 1, 0], bool)
+    weights = fade_weights(silent, 0)
+    assert weights.dtype == np.float32
+    np.testing.assert_array_equal(weights, [1, 0, 0, 1])
+
+
+def _silent_frames_loop(loudness, threshold_db, min_frames):
+    silent = loudness < np.max(loudness[np.isfinite(loudness)]) - threshold_db
+    start = None
+    for i, s in enumerate(np.append(silent, False)):
+        if s and start is None:
+            start = i
+        elif not s and start is not None:
+            if i - start < min_frames:
+                silent[start:i] = False
+            start = None
+    return silent
+
+
+def _fade_weights_loop(silent, fade_frames):
+    n = len(silent)
+    weights = np.where(silent, 0.0, 1.0)
+    distance = np.full(n, np.inf)
+    last = None
+    for i in range(n):
+        last = i if not silent[i] else last
+        if silent[i] and last is not None:
+            distance[i] = i - last
+    last = None
+    for i in reversed(range(n)):
+        last = i if not silent[i] else last
+        if silent[i] and last is not None:
+            distance[i] = min(distance[i], last - i)
+    ramp = silent & (distance <= fade_frames)
+    weights[ramp] = 1 - distance[ramp] / (fade_frames + 1)
+    return weights.astype(np.float32)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_vectorized_runs_match_the_frame_loops(seed):
+    rng = np.random.default_rng(seed)
+    # sticky states so there are runs of every length
+    loudness = np.where(np.cumsum(rng.random(300) < 0.3) % 2 == 0, 0.0, -60.0) + rng.normal(0, 1, 300)
+    for min_frames in (1, 2, 5):
+        silent = silent_frames(loudness, 40.0, min_frames)
+        np.testing.assert_array_equal(silent, _silent_frames_loop(loudness, 40.0, min_frames))
+        for fade in (1, 3):
+            np.testing.assert_array_equal(fade_weights(silent, fade), _fade_weights_loop(silent, fade))
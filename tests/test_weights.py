@@ -0,0 +1,42 @@
+import os
+
+import torch
+
+from wav2lip.easy_functions import fused_weights_path, load_model
+from wav2lip.models import Wav2Lip
+from wav2lip.weights import convert_checkpoint, read_metadata, weights_path
+
+
+def save_checkpoint(path, seed):
+    torch.manual_seed(seed)
+    torch.save({"state_dict": Wav2Lip().state_dict()}, path)
+
+
+def test_fused_weights_are_mapped_from_their_file(tmp_path):
+    path = str(tmp_path / "Wav2Lip.pth")
+    save_checkpoint(path, 0)
+    model = load_model(path, "cpu")
+
+    # every parameter points into the one mapping of the fused file, instead of a copy of its own
+    pointers = [p.data_ptr() for p in model.parameters()]
+    assert max(pointers) - min(pointers) < os.path.getsize(fused_weights_path(path))
+    assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in model.modules())
+
+
+def test_converted_weights_follow_their_checkpoint(tmp_path):
+    path = str(tmp_path / "Wav2Lip.pth")
+    save_checkpoint(path, 0)
+    converted = convert_checkpoint(path)
+    written = os.stat(converted).st_mtime_ns
+
+    # the same contents with a new modification time keep the converted file
+    os.utime(path, ns=(written + 10**9, written + 10**9))
+    assert convert_checkpoint(path) == converted
+    assert os.stat(converted).st_mtime_ns == written
+
+    save_checkpoint(path, 1)
+    convert_checkpoint(path)
+    assert read_metadata(weights_path(path))["source_size"] == str(os.path.getsize(path))
+    weights = load_model(path, "cpu", fuse=False).state_dict()
+    expected = torch.load(path, weights_only=True)["state_dict"]
+    assert all(torch.equal(weights[k], v) for k, v in expected.items())
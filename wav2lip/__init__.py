@@ -1,10 +1,7 @@
-import sys
 import os
-import torch
-import subprocess
 import traceback
 
-from wav2lip.install import setup
+from wav2lip.assets import prepare_assets
 from wav2lip.easy_functions import (format_time,
                             get_input_length,
                             get_video_details)
@@ -13,14 +10,12 @@ from model.config_model import Wav2LipConfig
 import logging
 logger = logging.getLogger(__name__)
 
-if not torch.cuda.is_available():
-  sys.exit('No GPU in runtime. Please go to the "Runtime" menu, "Change runtime type" and select "GPU".')
-
-setup()
-
 def run(video_path, audio_path, output_path, config: Wav2LipConfig):
     print("Starting Wav2Lip processing...")
     try:
+        # only compares file sizes once the assets were prepared
+        prepare_assets()
+
         video_file = video_path
         vocal_file = audio_path
 
@@ -30,6 +25,7 @@ def run(video_path, audio_path, output_path, config: Wav2LipConfig):
         wav2lip_version = config.OPTIONS.wav2lip_version
         use_previous_tracking_data = config.OPTIONS.use_previous_tracking_data
         nosmooth = config.OPTIONS.nosmooth
+        smoothing = config.OPTIONS.smoothing
         
         # Padding settings
         U = config.PADDING.u
@@ -42,6 +38,7 @@ def run(video_path, audio_path, output_path, config: Wav2LipConfig):
         feathering = config.MASK.feathering
         mouth_tracking = config.MASK.mouth_tracking
         debug_mask = config.MASK.debug_mask
+        mask_downscale = config.MASK.downscale
         
         # Other settings
         batch_process = config.OTHER.batch_process
@@ -50,6 +47,24 @@ def run(video_path, audio_path, output_path, config: Wav2LipConfig):
         preview_settings = config.OTHER.preview_settings
         frame_to_preview = config.OTHER.frame_to_preview
 
+        # Performance settings
+        queue_size = config.PERFORMANCE.queue_size
+        blend_workers = config.PERFORMANCE.blend_workers
+        detect_every = config.PERFORMANCE.detect_every
+        detect_height = config.PERFORMANCE.detect_height
+        detect_workers = config.PERFORMANCE.detect_workers
+        render_device = config.PERFORMANCE.device
+        cpu_threads = config.PERFORMANCE.cpu_threads
+        precision = config.PERFORMANCE.precision
+        backend = config.PERFORMANCE.backend
+        silence = config.PERFORMANCE.silence
+        silence_threshold = config.PERFORMANCE.silence_threshold
+        silence_min_duration = config.PERFORMANCE.silence_min_duration
+        silence_fade = config.PERFORMANCE.silence_fade
+        enhance_batch_size = config.PERFORMANCE.enhance_batch_size
+        memory_budget = config.PERFORMANCE.memory_budget
+        idle_seconds = config.PERFORMANCE.idle_seconds
+
         working_directory = os.getcwd()
 
         if wav2lip_version == "Wav2Lip_GAN":
@@ -118,9 +133,7 @@ def run(video_path, audio_path, output_path, config: Wav2LipConfig):
         pad_left = str(round(L * resolution_scale))
         pad_right = str(round(R * resolution_scale))
 
-        cmd = [
-            sys.executable,
-            "-m", "wav2lip.inference",
+        argv = [
             "--face",
             video_file,
             "--audio",
@@ -144,18 +157,56 @@ def run(video_path, audio_path, output_path, config: Wav2LipConfig):
             str(size),
             "--mask_feathering",
             str(feathering),
+            "--mask_downscale",
+            str(mask_downscale),
             "--nosmooth",
             str(nosmooth),
+            "--smoothing",
+            smoothing,
             "--debug_mask",
             str(debug_mask),
             "--preview_settings",
             str(preview_settings),
             "--mouth_tracking",
             str(mouth_tracking),
+            "--queue_size",
+            str(queue_size),
+            "--blend_workers",
+            str(blend_workers),
+            "--detect_every",
+            str(detect_every),
+            "--detect_height",
+            str(detect_height),
+            "--detect_workers",
+            str(detect_workers),
+            "--device",
+            render_device,
+            "--cpu_threads",
+            str(cpu_threads),
+            "--precision",
+            precision,
+            "--backend",
+            backend,
+            "--silence",
+            silence,
+            "--silence_threshold",
+            str(silence_threshold),
+            "--silence_min_duration",
+            str(silence_min_duration),
+            "--silence_fade",
+            str(silence_fade),
+            "--enhance_batch_size",
+            str(enhance_batch_size),
+            "--memory_budget",
+            str(memory_budget),
+            "--idle_seconds",
+            str(idle_seconds),
         ]
 
-        # Run the command
-        subprocess.run(cmd)
+        # render in this process, so the models loaded by earlier renders are reused
+        import wav2lip.inference as inference
+
+        inference.render(inference.parser.parse_args(argv))
     except Exception as e:
         logger.error(f"Error during processing: {str(e)}")
         traceback.print_exception(e)
@@ -0,0 +1,179 @@
+"""One-time preparation of the model files inference loads.
+
+Run ``python -m wav2lip.assets`` after downloading the checkpoints, or let the
+first render do it. Every prepared file is recorded in
+``wav2lip/checkpoints/assets.json`` with its sha256 and size and the size of
+the file it was made from, so later runs only compare file sizes and redo the
+files whose source changed.
+"""
+import argparse
+import json
+import os
+import pickle
+
+from wav2lip.easy_functions import fold_batchnorm, fused_weights_path
+from wav2lip.weights import convert_checkpoint, file_sha256, weights_path
+
+CHECKPOINT_DIR = os.path.join("wav2lip", "checkpoints")
+MANIFEST = os.path.join(CHECKPOINT_DIR, "assets.json")
+MANIFEST_VERSION = 1
+
+WAV2LIP_CHECKPOINTS = ("Wav2Lip_GAN.pth", "Wav2Lip.pth")
+LANDMARKS = "shape_predictor_68_face_landmarks_GTX.dat"
+
+
+def _convert_wav2lip(source):
+    return [convert_checkpoint(source), convert_checkpoint(source, fused_weights_path(source), fold_batchnorm)]
+
+
+def _pickle_dlib(source):
+    import dlib
+
+    predictor_path = os.path.join(CHECKPOINT_DIR, "predictor.pkl")
+    detector_path = os.path.join(CHECKPOINT_DIR, "mouth_detector.pkl")
+    with open(predictor_path, "wb") as f:
+        pickle.dump(dlib.shape_predictor(source), f)
+    with open(detector_path, "wb") as f:
+        pickle.dump(dlib.get_frontal_face_detector(), f)
+    return [predictor_path, detector_path]
+
+
+def asset_sources():
+    """``(source, outputs, build)`` of every asset, paths under ``CHECKPOINT_DIR``.
+
+    ``build(source)`` writes the outputs and returns their paths.
+    """
+    sources = [
+        (
+            os.path.join(CHECKPOINT_DIR, name),
+            [
+                weights_path(os.path.join(CHECKPOINT_DIR, name)),
+                fused_weights_path(os.path.join(CHECKPOINT_DIR, name)),
+            ],
+            _convert_wav2lip,
+        )
+        for name in WAV2LIP_CHECKPOINTS
+    ]
+    sources.append(
+        (
+            os.path.join(CHECKPOINT_DIR, LANDMARKS),
+            [os.path.join(CHECKPOINT_DIR, "predictor.pkl"), os.path.join(CHECKPOINT_DIR, "mouth_detector.pkl")],
+            _pickle_dlib,
+        )
+    )
+    return sources
+
+
+def read_manifest():
+    try:
+        with open(MANIFEST) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("assets", {})
+
+
+def _up_to_date(entry, source, outputs, verify):
+    if entry is None or not all(name in entry["outputs"] for name in map(os.path.basename, outputs)):
+        return False
+    if os.path.exists(source) and os.path.getsize(source) != entry["source_size"]:
+        return False
+    for path in outputs:
+        record = entry["outputs"][os.path.basename(path)]
+        if not os.path.exists(path) or os.path.getsize(path) != record["size"]:
+            return False
+        if verify and file_sha256(path) != record["sha256"]:
+            return False
+    return True
+
+
+def stale_assets(verify=False):
+    """Sources whose prepared files are missing, changed or never recorded.
+
+    Sources that are not on disk are left out when their files were prepared
+    before, and when they were not, since there is nothing to prepare them from.
+
+    Args:
+        verify (bool): Compare the sha256 of every prepared file instead of
+            only its size. Default: False.
+
+    Returns:
+        list: ``(source, outputs, build)`` like :func:`asset_sources`.
+    """
+    manifest = read_manifest()
+    stale = []
+    for source, outputs, build in asset_sources():
+        entry = manifest.get(os.path.basename(source))
+        if _up_to_date(entry, source, outputs, verify):
+            continue
+        if os.path.exists(source):
+            stale.append((source, outputs, build))
+    return stale
+
+
+def assets_ready(verify=False):
+    return not stale_assets(verify)
+
+
+def prepare_assets(verify=False, force=False):
+    """Prepare every asset that is stale and record it in the manifest.
+
+    Args:
+        verify (bool): See :func:`stale_assets`. Default: False.
+        force (bool): Prepare every asset whose source is on disk. Default: False.
+
+    Returns:
+        list[str]: Paths of the files written.
+    """
+    todo = [s for s in asset_sources() if os.path.exists(s[0])] if force else stale_assets(verify)
+    if not todo:
+        return []
+
+    manifest = read_manifest()
+    written = []
+    for source, outputs, build in todo:
+        print(f"Preparing {os.path.basename(source)}")
+        if force:
+            # convert_checkpoint keeps a converted file with a matching checksum
+            for path in outputs:
+                if os.path.exists(path + ".sha256"):
+                    os.remove(path + ".sha256")
+        outputs = build(source)
+        manifest[os.path.basename(source)] = {
+            "source_size": os.path.getsize(source),
+            "outputs": {
+                os.path.basename(path): {"sha256": file_sha256(path), "size": os.path.getsize(path)}
+                for path in outputs
+            },
+        }
+        written += outputs
+
+    partial = MANIFEST + ".partial"
+    with open(partial, "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "assets": manifest}, f, indent=2)
+    os.replace(partial, MANIFEST)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prepare the model files used by Wav2Lip inference")
+    parser.add_argument("--verify", action="store_true", help="Check the sha256 of prepared files, not only their size")
+    parser.add_argument("--force", action="store_true", help="Prepare every asset again")
+    parser.add_argument("--check", action="store_true", help="Only report whether any asset is stale")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        stale = stale_assets(args.verify)
+        for source, _, _ in stale:
+            print(f"stale: {source}")
+        return 1 if stale else 0
+
+    written = prepare_assets(args.verify, args.force)
+    print(f"{len(written)} files prepared" if written else "All assets are up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
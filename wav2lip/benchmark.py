@@ -0,0 +1,730 @@
+"""Benchmarks for the speed/accuracy trade-offs of the inference pipeline.
+
+Run ``python -m wav2lip.benchmark <command> --help`` for the options of each
+command.
+"""
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from wav2lip.detection import detect_faces
+from wav2lip.tracking import KeyframeTracker, compare_boxes
+
+
+def read_video(path, max_frames=None, out_height=None):
+    """Read the frames of a video, resized to ``out_height`` if given."""
+    video_stream = cv2.VideoCapture(path)
+    frames = []
+    while max_frames is None or len(frames) < max_frames:
+        still_reading, frame = video_stream.read()
+        if not still_reading:
+            break
+        if out_height:
+            aspect_ratio = frame.shape[1] / frame.shape[0]
+            frame = cv2.resize(frame, (int(out_height * aspect_ratio), out_height))
+        frames.append(frame)
+    video_stream.release()
+    return frames
+
+
+def load_detector(gpu_id=None):
+    from batch_face import RetinaFace
+    import torch
+
+    if gpu_id is None:
+        gpu_id = 0 if torch.cuda.is_available() else -1
+    return RetinaFace(gpu_id=gpu_id, model_path="checkpoints/mobilenet.pth", network="mobilenet")
+
+
+def detect_all(detector, frames, detect_height=-1):
+    """Per-frame detection in batches of 8, carrying a face over frames without one."""
+    detections = []
+    for i in range(0, len(frames), 8):
+        for detection in detect_faces(detector, frames[i : i + 8], detect_height):
+            detections.append(detection if detection is not None else (detections[-1] if detections else None))
+    return detections
+
+
+def _both_detected(reference, detections):
+    """Detection pairs of the frames with a face in both lists, and the number of frames without.
+
+    Raises:
+        ValueError: When no frame has a face in both.
+    """
+    pairs = [(a, b) for a, b in zip(reference, detections) if a is not None and b is not None]
+    if not pairs:
+        raise ValueError("No frame has a face in both the reference and the compared detections")
+    return pairs, min(len(reference), len(detections)) - len(pairs)
+
+
+def bench_detect(args):
+    """Keyframe detection against full per-frame detection."""
+    frames = read_video(args.face, args.max_frames, args.out_height)
+    detector = load_detector()
+
+    start = time.perf_counter()
+    reference = detect_all(detector, frames, args.detect_height)
+    full_time = time.perf_counter() - start
+
+    report = {"frames": len(frames), "full_s": round(full_time, 3), "keyframe": []}
+    for interval in args.detect_every:
+        tracker = KeyframeTracker(
+            lambda frame: detect_faces(detector, [frame], args.detect_height)[0], interval
+        )
+        start = time.perf_counter()
+        tracked = list(tracker.track(frames))
+        elapsed = time.perf_counter() - start
+        # a lost track or a scene cut leaves frames without a face
+        pairs, missed = _both_detected(reference, tracked)
+        accuracy = compare_boxes([a[0] for a, _ in pairs], [b[0] for _, b in pairs])
+        report["keyframe"].append(
+            {"detect_every": interval, "seconds": round(elapsed, 3), "missed": missed, **tracker.stats(), **accuracy}
+        )
+    return report
+
+
+def print_detect(report):
+    print(f"{report['frames']} frames, per-frame detection {report['full_s']:.2f}s")
+    print(
+        f"{'every':>6}{'seconds':>9}{'detected':>10}{'early':>7}{'cuts':>6}{'mean IoU':>10}{'min IoU':>9}"
+        f"{'center px':>11}{'missed':>8}"
+    )
+    for r in report["keyframe"]:
+        print(
+            f"{r['detect_every']:>6}{r['seconds']:>9.2f}{r['detections']:>10}{r['redetections']:>7}"
+            f"{r['scene_cuts']:>6}{r['mean_iou']:>10.3f}{r['min_iou']:>9.3f}{r['mean_center_px']:>11.1f}{r['missed']:>8}"
+        )
+
+
+def bench_downscale(args):
+    """Detection on shrunk frames against detection at full resolution."""
+    frames = read_video(args.face, args.max_frames, args.out_height)
+    detector = load_detector()
+    detect_all(detector, frames[:8])  # warm up
+
+    start = time.perf_counter()
+    reference = detect_all(detector, frames)
+    full_time = time.perf_counter() - start
+
+    report = {
+        "frames": len(frames),
+        "frame_height": frames[0].shape[0],
+        "full_s": round(full_time, 3),
+        "downscaled": [],
+    }
+    for detect_height in args.detect_height:
+        start = time.perf_counter()
+        detections = detect_all(detector, frames, detect_height)
+        elapsed = time.perf_counter() - start
+        pairs, missed = _both_detected(reference, detections)
+        accuracy = compare_boxes([a[0] for a, _ in pairs], [b[0] for _, b in pairs])
+        landmark_px = np.mean([np.abs(a[1] - b[1]).max() for a, b in pairs])
+        report["downscaled"].append(
+            {
+                "detect_height": detect_height,
+                "seconds": round(elapsed, 3),
+                "speedup": round(full_time / elapsed, 2) if elapsed else None,
+                "mean_landmark_px": round(float(landmark_px), 2),
+                "missed": missed,
+                **accuracy,
+            }
+        )
+    return report
+
+
+def print_downscale(report):
+    print(f"{report['frames']} frames of height {report['frame_height']}, full resolution {report['full_s']:.2f}s")
+    print(
+        f"{'height':>7}{'seconds':>9}{'speedup':>9}{'mean IoU':>10}{'min IoU':>9}{'center px':>11}"
+        f"{'landmark px':>13}{'missed':>8}"
+    )
+    for r in report["downscaled"]:
+        print(
+            f"{r['detect_height']:>7}{r['seconds']:>9.2f}{r['speedup']:>8.1f}x{r['mean_iou']:>10.3f}"
+            f"{r['min_iou']:>9.3f}{r['mean_center_px']:>11.1f}{r['mean_landmark_px']:>13.1f}{r['missed']:>8}"
+        )
+
+
+def _time_model(model, mel, faces, context, batches):
+    with context():
+        model(mel, faces)  # warm up
+        start = time.perf_counter()
+        for _ in range(batches):
+            out = model(mel, faces)
+    return (time.perf_counter() - start) / batches, out
+
+
+def bench_cpu(args):
+    """Wav2Lip on the CPU as it ran before the CPU mode against the CPU mode."""
+    import torch
+
+    from wav2lip.models import Wav2Lip
+    from wav2lip.runtime import configure_cpu, prepare_model, to_input
+
+    if args.checkpoint:
+        from wav2lip.easy_functions import load_model
+
+        model = load_model(args.checkpoint, "cpu")
+    else:
+        model = Wav2Lip().eval()  # random weights time the same
+    rng = np.random.default_rng(0)
+    faces = rng.random((args.batch_size, 96, 96, 6))
+    mel = rng.standard_normal((args.batch_size, 80, 16, 1))
+
+    default_threads = torch.get_num_threads()
+    baseline, expected = _time_model(
+        model,
+        torch.FloatTensor(np.transpose(mel, (0, 3, 1, 2))),
+        torch.FloatTensor(np.transpose(faces, (0, 3, 1, 2))),
+        torch.no_grad,
+        args.batches,
+    )
+
+    threads, interop_threads = configure_cpu(args.cpu_threads)
+    tuned, out = _time_model(
+        prepare_model(model, "cpu"), to_input(mel, "cpu"), to_input(faces, "cpu"), torch.inference_mode, args.batches
+    )
+    return {
+        "batch_size": args.batch_size,
+        "baseline": {"threads": default_threads, "batch_s": round(baseline, 3), "fps": round(args.batch_size / baseline, 1)},
+        "cpu_mode": {
+            "threads": threads,
+            "interop_threads": interop_threads,
+            "batch_s": round(tuned, 3),
+            "fps": round(args.batch_size / tuned, 1),
+        },
+        "speedup": round(baseline / tuned, 2),
+        "max_abs_diff": float((out - expected).abs().max()),
+    }
+
+
+def print_cpu(report):
+    print(f"Wav2Lip on the CPU, batches of {report['batch_size']} faces")
+    print(f"{'':<10}{'threads':>8}{'s/batch':>9}{'fps':>7}")
+    for name in ("baseline", "cpu_mode"):
+        r = report[name]
+        print(f"{name:<10}{r['threads']:>8}{r['batch_s']:>9.3f}{r['fps']:>7.1f}")
+    print(f"speedup {report['speedup']:.2f}x, largest output difference {report['max_abs_diff']:.1e}")
+
+
+def _randomize_batchnorm(model, seed=0):
+    # freshly built BatchNorm layers are identities, which would fold trivially
+    import torch
+
+    generator = torch.Generator().manual_seed(seed)
+    for module in model.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            n = module.num_features
+            module.running_mean.copy_(torch.randn(n, generator=generator) * 0.1)
+            module.running_var.copy_(torch.rand(n, generator=generator) + 0.5)
+            module.weight.data.copy_(torch.rand(n, generator=generator) + 0.5)
+            module.bias.data.copy_(torch.randn(n, generator=generator) * 0.1)
+    return model
+
+
+def bench_fuse(args):
+    """Models with BatchNorm folded into the convolutions against the unfused models."""
+    import copy
+
+    import torch
+
+    from wav2lip.models import SyncNet_color, Wav2Lip, fuse_conv_bn
+
+    torch.manual_seed(0)
+    if args.checkpoint:
+        from wav2lip.easy_functions import load_model
+
+        wav2lip = load_model(args.checkpoint, "cpu", fuse=False)
+    else:
+        wav2lip = _randomize_batchnorm(Wav2Lip().eval())
+    n = args.batch_size
+    models = {
+        "Wav2Lip": (wav2lip, (torch.randn(n, 1, 80, 16), torch.rand(n, 6, 96, 96))),
+        "SyncNet_color": (
+            _randomize_batchnorm(SyncNet_color().eval()),
+            (torch.randn(n, 1, 80, 16), torch.rand(n, 15, 48, 96)),
+        ),
+    }
+
+    report = {"batch_size": n, "atol": args.atol, "models": []}
+    for name, (model, inputs) in models.items():
+        fused = fuse_conv_bn(copy.deepcopy(model))
+        # alternate the two and keep the best round, the gain is small next to timing noise
+        unfused_s = fused_s = float("inf")
+        for _ in range(args.rounds):
+            seconds, expected = _time_model(model, *inputs, torch.inference_mode, args.batches)
+            unfused_s = min(unfused_s, seconds)
+            seconds, out = _time_model(fused, *inputs, torch.inference_mode, args.batches)
+            fused_s = min(fused_s, seconds)
+        if isinstance(out, tuple):
+            diff = max(float((a - b).abs().max()) for a, b in zip(out, expected))
+        else:
+            diff = float((out - expected).abs().max())
+        report["models"].append(
+            {
+                "model": name,
+                "batchnorms": sum(isinstance(m, torch.nn.BatchNorm2d) for m in model.modules()),
+                "unfused_s": round(unfused_s, 3),
+                "fused_s": round(fused_s, 3),
+                "speedup": round(unfused_s / fused_s, 2),
+                "max_abs_diff": diff,
+                "within_atol": diff <= args.atol,
+            }
+        )
+    return report
+
+
+def print_fuse(report):
+    print(f"BatchNorm folding, batches of {report['batch_size']}, tolerance {report['atol']:.0e}")
+    print(f"{'model':<15}{'BN':>5}{'unfused s':>11}{'fused s':>9}{'speedup':>9}{'max diff':>10}")
+    for r in report["models"]:
+        ok = "" if r["within_atol"] else "  OUT OF TOLERANCE"
+        print(
+            f"{r['model']:<15}{r['batchnorms']:>5}{r['unfused_s']:>11.3f}{r['fused_s']:>9.3f}"
+            f"{r['speedup']:>8.2f}x{r['max_abs_diff']:>10.1e}{ok}"
+        )
+
+
+def bench_precision(args):
+    """Wav2Lip in bfloat16 or float16 against FP32, as --precision runs it."""
+    import copy
+
+    import torch
+
+    from wav2lip.models import Wav2Lip
+    from wav2lip.runtime import (
+        HALF_DTYPES,
+        ParityGuard,
+        configure_cpu,
+        prepare_model,
+        resolve_precision,
+        select_device,
+        to_input,
+    )
+
+    device = select_device(args.device)
+    precision = resolve_precision(args.precision, device)
+    if device == "cpu":
+        configure_cpu(args.cpu_threads)
+    if args.checkpoint:
+        from wav2lip.easy_functions import load_model
+
+        model = load_model(args.checkpoint, device)
+    else:
+        model = _randomize_batchnorm(Wav2Lip().eval()).to(device)
+    rng = np.random.default_rng(0)
+    faces = to_input(rng.integers(0, 256, (args.batch_size, 96, 96, 6), dtype=np.uint8), device)
+    mel = to_input(rng.standard_normal((args.batch_size, 80, 16, 1)), device)
+
+    fp32 = prepare_model(model, device)
+    half = prepare_model(copy.deepcopy(model).to(HALF_DTYPES[precision]), device)
+    guard = ParityGuard(half, lambda: fp32, HALF_DTYPES[precision], atol=args.atol, check_batches=0)
+
+    def on_host(m):
+        # the render copies every batch back, which also waits for the GPU
+        return lambda *inputs: m(*inputs).float().cpu()
+
+    fp32_s = half_s = float("inf")
+    for _ in range(args.rounds):
+        seconds, expected = _time_model(on_host(fp32), mel, faces, torch.inference_mode, args.batches)
+        fp32_s = min(fp32_s, seconds)
+        seconds, out = _time_model(on_host(guard), mel, faces, torch.inference_mode, args.batches)
+        half_s = min(half_s, seconds)
+    diff = (out - expected).abs()
+    return {
+        "device": device,
+        "precision": precision,
+        "batch_size": args.batch_size,
+        "fp32_s": round(fp32_s, 3),
+        "half_s": round(half_s, 3),
+        "speedup": round(fp32_s / half_s, 2),
+        "max_abs_diff": float(diff.max()),
+        "mean_abs_diff": float(diff.mean()),
+        "fallback": guard.fallback_reason,
+        "within_atol": guard.fallback_reason is None and float(diff.max()) <= args.atol,
+    }
+
+
+def print_precision(report):
+    print(f"Wav2Lip on {report['device']}, batches of {report['batch_size']} faces")
+    print(f"fp32 {report['fp32_s']:.3f}s, {report['precision']} {report['half_s']:.3f}s per batch ({report['speedup']:.2f}x)")
+    print(f"output difference largest {report['max_abs_diff'] * 255:.2f}, mean {report['mean_abs_diff'] * 255:.3f} (of 255)")
+    if report["fallback"]:
+        print(f"{report['precision']} falls back to FP32: {report['fallback']}")
+    elif not report["within_atol"]:
+        print("OUT OF TOLERANCE, a render would fall back to FP32")
+
+
+def bench_compile(args):
+    """Wav2Lip compiled with --backend against eager, steady state and first call."""
+    import tempfile
+
+    import torch
+
+    from wav2lip.compiled import CompiledModel
+    from wav2lip.models import Wav2Lip
+    from wav2lip.runtime import configure_cpu, prepare_model, select_device, to_input
+
+    device = select_device(args.device)
+    if device == "cpu":
+        configure_cpu(args.cpu_threads)
+    if args.checkpoint:
+        from wav2lip.easy_functions import load_model
+
+        model = load_model(args.checkpoint, device)
+    else:
+        model = _randomize_batchnorm(Wav2Lip().eval()).to(device)
+    model = prepare_model(model, device)
+    rng = np.random.default_rng(0)
+    faces = to_input(rng.integers(0, 256, (args.batch_size, 96, 96, 6), dtype=np.uint8), device)
+    mel = to_input(rng.standard_normal((args.batch_size, 80, 16, 1)), device)
+
+    def on_host(m):
+        return lambda *inputs: m(*inputs).cpu()
+
+    def first_call(compiled):
+        with torch.inference_mode():
+            start = time.perf_counter()
+            compiled(mel, faces).cpu()
+        return time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # a fresh cache, then a new model reading it as a restarted process would
+        cold = CompiledModel(model, args.backend, device, "bench", cache_dir)
+        cold_s = first_call(cold)
+        compiled = CompiledModel(model, args.backend, device, "bench", cache_dir)
+        warm_s = first_call(compiled)
+
+        eager_s = compiled_s = float("inf")
+        for _ in range(args.rounds):
+            seconds, expected = _time_model(on_host(model), mel, faces, torch.inference_mode, args.batches)
+            eager_s = min(eager_s, seconds)
+            seconds, out = _time_model(on_host(compiled), mel, faces, torch.inference_mode, args.batches)
+            compiled_s = min(compiled_s, seconds)
+    return {
+        "device": device,
+        "backend": args.backend,
+        "batch_size": args.batch_size,
+        "eager_s": round(eager_s, 3),
+        "compiled_s": round(compiled_s, 3),
+        "speedup": round(eager_s / compiled_s, 2),
+        "first_call_cold_s": round(cold_s, 2),
+        "first_call_cached_s": round(warm_s, 2),
+        "max_abs_diff": float((out - expected).abs().max()),
+        "failed": compiled.failed,
+    }
+
+
+def print_compile(report):
+    print(f"Wav2Lip on {report['device']}, batches of {report['batch_size']} faces")
+    if report["failed"]:
+        print(f"{report['backend']} failed, the numbers are eager: {report['failed']}")
+    print(
+        f"eager {report['eager_s']:.3f}s, {report['backend']} {report['compiled_s']:.3f}s per batch "
+        f"({report['speedup']:.2f}x), largest output difference {report['max_abs_diff']:.1e}"
+    )
+    print(
+        f"first call {report['first_call_cold_s']:.2f}s compiling, "
+        f"{report['first_call_cached_s']:.2f}s from the cache"
+    )
+
+
+def bench_tiers(args):
+    """Mouth detail and speed of the Improved, Enhanced-Lite and Enhanced upsampling."""
+    from wav2lip.enhance import enhance_faces, load_sr, mouth_roi, sharpen_mouth
+    from wav2lip.metrics import psnr, ssim
+
+    frames = read_video(args.face, args.max_frames, args.out_height)
+    crops, points = [], []
+    for frame, detection in zip(frames, detect_all(load_detector(), frames)):
+        if detection is None:
+            continue
+        (x1, y1, x2, y2), landmarks = detection
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(frame.shape[1], x2), min(frame.shape[0], y2)
+        crops.append(frame[y1:y2, x1:x2])
+        points.append(landmarks - (x1, y1))
+    if not crops:
+        raise ValueError(f"No face found in {args.face}")
+    # the detail a 96x96 Wav2Lip face can hold, the crop is the reference
+    faces = [cv2.resize(crop, (96, 96), interpolation=cv2.INTER_AREA).astype(np.float32) for crop in crops]
+    sizes = [(crop.shape[1], crop.shape[0]) for crop in crops]
+
+    def improved():
+        return [cv2.resize(face.astype(np.uint8), size) for face, size in zip(faces, sizes)]
+
+    tiers = {
+        "Improved": improved,
+        "Enhanced-Lite": lambda: [sharpen_mouth(f, size, lm) for f, size, lm in zip(faces, sizes, points)],
+    }
+    if args.gfpgan:
+        sr = load_sr()
+        tiers["Enhanced"] = lambda: enhance_faces(sr, improved(), points, args.batch_size)
+
+    report = {"faces": len(crops), "tiers": []}
+    for quality, upsample in tiers.items():
+        start = time.perf_counter()
+        outputs = upsample()
+        seconds = time.perf_counter() - start
+        psnrs, ssims = [], []
+        for crop, output, landmarks in zip(crops, outputs, points):
+            x1, y1, x2, y2 = mouth_roi((crop.shape[1], crop.shape[0]), landmarks)
+            psnrs.append(psnr(crop[y1:y2, x1:x2], output[y1:y2, x1:x2]))
+            ssims.append(ssim(crop[y1:y2, x1:x2], output[y1:y2, x1:x2]))
+        report["tiers"].append(
+            {
+                "quality": quality,
+                "ms_per_face": round(1000 * seconds / len(crops), 2),
+                "fps": round(len(crops) / seconds, 1),
+                "mouth_psnr": round(float(np.mean(psnrs)), 2),
+                "mouth_ssim": round(float(np.mean(ssims)), 4),
+            }
+        )
+    return report
+
+
+def print_tiers(report):
+    print(f"{report['faces']} faces, mouth detail against the full resolution face")
+    print(f"{'quality':<15}{'ms/face':>9}{'fps':>8}{'PSNR':>8}{'SSIM':>8}")
+    for r in report["tiers"]:
+        print(f"{r['quality']:<15}{r['ms_per_face']:>9.2f}{r['fps']:>8.1f}{r['mouth_psnr']:>8.2f}{r['mouth_ssim']:>8.4f}")
+
+
+def bench_kernels(args):
+    """Blur kernels of KernelBank in batches against random_mixed_kernels one at a time."""
+    import math
+
+    from scipy.stats import ks_2samp
+    import torch
+
+    from wav2lip.degradations import KernelBank, mesh_grid, random_mixed_kernels
+    from wav2lip.runtime import select_device
+
+    # the blur settings Real-ESRGAN degrades its training data with
+    options = dict(
+        kernel_list=["iso", "aniso", "generalized_iso", "generalized_aniso", "plateau_iso", "plateau_aniso"],
+        kernel_prob=[0.45, 0.25, 0.12, 0.03, 0.12, 0.03],
+        kernel_size=args.kernel_size,
+        sigma_x_range=(0.2, 3),
+        sigma_y_range=(0.2, 3),
+        rotation_range=(-math.pi, math.pi),
+        betag_range=(0.5, 4),
+        betap_range=(1, 2),
+        noise_range=(0.75, 1.25) if args.noise else None,
+    )
+    device = select_device(args.device)
+    bank = KernelBank(**options)
+    np.random.seed(0)
+
+    def timed(generate):
+        start = time.perf_counter()
+        kernels = generate()
+        if isinstance(kernels, torch.Tensor):
+            kernels = kernels.cpu().double().numpy()
+        return time.perf_counter() - start, kernels
+
+    loop_s, expected = timed(lambda: np.stack([random_mixed_kernels(**options) for _ in range(args.kernels)]))
+    bank.sample_pt(args.batch_size, device)  # moves the grid to the device before timing
+    results = {"loop": (loop_s, expected)}
+    batches = range(0, args.kernels, args.batch_size)
+    for name, sample in (("numpy", bank.sample), ("torch", lambda n: bank.sample_pt(n, device))):
+        results[name] = timed(lambda: np.concatenate([sample(min(args.batch_size, args.kernels - i)) for i in batches]))
+
+    # spread and peak of every kernel summarize its shape, their distributions must match the loop's
+    _, xx, yy = mesh_grid(args.kernel_size)
+    radius = xx**2 + yy**2
+
+    def summary(kernels):
+        return (kernels * radius).sum(axis=(1, 2)), kernels.max(axis=(1, 2))
+
+    spread, peak = summary(expected)
+    report = {"device": device, "kernels": args.kernels, "kernel_size": args.kernel_size, "generators": []}
+    for name, (seconds, kernels) in results.items():
+        bank_spread, bank_peak = summary(kernels)
+        report["generators"].append(
+            {
+                "generator": name,
+                "kernels_per_s": round(args.kernels / seconds),
+                "speedup": round(loop_s / seconds, 1),
+                "spread_ks_p": round(float(ks_2samp(spread, bank_spread).pvalue), 3),
+                "peak_ks_p": round(float(ks_2samp(peak, bank_peak).pvalue), 3),
+                "mean_kernel_diff": float(np.abs(kernels.mean(0) - expected.mean(0)).max()),
+            }
+        )
+    return report
+
+
+def print_kernels(report):
+    print(f"{report['kernels']} kernels of {report['kernel_size']}x{report['kernel_size']}, torch on {report['device']}")
+    print("KS p-values compare every generator with the loop, small values would mean other distributions")
+    print(f"{'generator':<11}{'kernels/s':>11}{'speedup':>9}{'spread p':>10}{'peak p':>8}{'mean diff':>11}")
+    for r in report["generators"]:
+        print(
+            f"{r['generator']:<11}{r['kernels_per_s']:>11}{r['speedup']:>8.1f}x{r['spread_ks_p']:>10.3f}"
+            f"{r['peak_ks_p']:>8.3f}{r['mean_kernel_diff']:>11.1e}"
+        )
+
+
+def bench_degrade(args):
+    """Noise and JPEG degradations on a whole batch against one image at a time."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    import torch
+
+    from wav2lip.degradations import (
+        _poisson_vals_pt,
+        add_jpg_compression,
+        add_jpg_compression_batch,
+        generate_poisson_noise_pt,
+    )
+    from wav2lip.runtime import host_cpus
+
+    rng = np.random.default_rng(0)
+    images = rng.random((args.batch_size, args.size, args.size, 3), dtype=np.float32)
+    tensor = torch.from_numpy(images).permute(0, 3, 1, 2).contiguous()
+    scale = torch.full((args.batch_size,), 0.5)
+    gray = (torch.arange(args.batch_size) % 2).float()
+    quality = list(rng.uniform(30, 95, args.batch_size))
+
+    def timed(fn):
+        best = float("inf")
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    # Poisson noise scales by the distinct values of every image, counted with torch.unique per image before
+    rounded = (tensor * 255).round() / 255
+    count_loop_s = timed(lambda: [len(torch.unique(img)) for img in rounded])
+    count_batch_s = timed(lambda: _poisson_vals_pt(rounded))
+    poisson_s = timed(lambda: generate_poisson_noise_pt(tensor, scale, gray))
+    jpeg_loop_s = timed(lambda: [add_jpg_compression(img, q) for img, q in zip(images, quality)])
+    workers = args.workers if args.workers > 0 else host_cpus()
+    with ThreadPoolExecutor(workers) as executor:
+        jpeg_batch_s = timed(lambda: add_jpg_compression_batch(images, quality, executor))
+    return {
+        "batch_size": args.batch_size,
+        "size": args.size,
+        "workers": workers,
+        "count_loop_s": round(count_loop_s, 4),
+        "count_batch_s": round(count_batch_s, 4),
+        "count_speedup": round(count_loop_s / count_batch_s, 2),
+        "poisson_s": round(poisson_s, 4),
+        "jpeg_loop_s": round(jpeg_loop_s, 4),
+        "jpeg_batch_s": round(jpeg_batch_s, 4),
+        "jpeg_speedup": round(jpeg_loop_s / jpeg_batch_s, 2),
+    }
+
+
+def print_degrade(report):
+    print(f"batches of {report['batch_size']} images of {report['size']}x{report['size']}, {report['workers']} JPEG workers")
+    for op, name in (("count", "Poisson value count"), ("jpeg", "JPEG")):
+        print(
+            f"{name:<20} one at a time {report[op + '_loop_s']:.4f}s, batched {report[op + '_batch_s']:.4f}s "
+            f"({report[op + '_speedup']:.2f}x)"
+        )
+    print(f"{'Poisson noise':<20} {report['poisson_s']:.4f}s per batch, half of it gray")
+
+
+parser = argparse.ArgumentParser(description="Benchmarks for the Wav2Lip inference pipeline")
+parser.add_argument("--json", default=False, action="store_true", help="Print the raw report as JSON")
+commands = parser.add_subparsers(dest="command", required=True)
+
+detect_parser = commands.add_parser("detect", help=bench_detect.__doc__)
+detect_parser.add_argument("--face", type=str, required=True, help="Video to detect faces in")
+detect_parser.add_argument(
+    "--detect_every", type=int, nargs="+", default=[2, 4, 8, 16], help="Keyframe intervals to compare"
+)
+detect_parser.add_argument("--max_frames", type=int, default=None, help="Only use the first frames of the video")
+detect_parser.add_argument("--out_height", type=int, default=None, help="Resize frames to this height first")
+detect_parser.add_argument(
+    "--detect_height", type=int, default=-1, help="Frame height to detect at, -1 for full resolution"
+)
+detect_parser.set_defaults(run=bench_detect, show=print_detect)
+
+downscale_parser = commands.add_parser("downscale", help=bench_downscale.__doc__)
+downscale_parser.add_argument("--face", type=str, required=True, help="Video to detect faces in")
+downscale_parser.add_argument(
+    "--detect_height", type=int, nargs="+", default=[240, 360, 480, 720], help="Frame heights to compare"
+)
+downscale_parser.add_argument("--max_frames", type=int, default=None, help="Only use the first frames of the video")
+downscale_parser.add_argument("--out_height", type=int, default=None, help="Resize frames to this height first")
+downscale_parser.set_defaults(run=bench_downscale, show=print_downscale)
+
+cpu_parser = commands.add_parser("cpu", help=bench_cpu.__doc__)
+cpu_parser.add_argument("--checkpoint", type=str, default=None, help="Wav2Lip checkpoint, random weights if not given")
+cpu_parser.add_argument("--batch_size", type=int, default=16, help="Faces per batch")
+cpu_parser.add_argument("--batches", type=int, default=3, help="Batches to time per setting")
+cpu_parser.add_argument("--cpu_threads", type=int, default=0, help="Threads of the CPU mode, 0 for one per CPU")
+cpu_parser.set_defaults(run=bench_cpu, show=print_cpu)
+
+fuse_parser = commands.add_parser("fuse", help=bench_fuse.__doc__)
+fuse_parser.add_argument("--checkpoint", type=str, default=None, help="Wav2Lip checkpoint, random weights if not given")
+fuse_parser.add_argument("--batch_size", type=int, default=16, help="Inputs per batch")
+fuse_parser.add_argument("--batches", type=int, default=3, help="Batches to time per round")
+fuse_parser.add_argument("--rounds", type=int, default=3, help="Rounds of timing both models")
+fuse_parser.add_argument("--atol", type=float, default=1e-4, help="Largest output difference accepted")
+fuse_parser.set_defaults(run=bench_fuse, show=print_fuse)
+
+precision_parser = commands.add_parser("precision", help=bench_precision.__doc__)
+precision_parser.add_argument("--checkpoint", type=str, default=None, help="Wav2Lip checkpoint, random weights if not given")
+precision_parser.add_argument("--device", type=str, default="auto", choices=["auto", "cuda", "mps", "cpu"], help="Device to run on")
+precision_parser.add_argument(
+    "--precision", type=str, default="half", choices=["half", "bf16", "fp16"], help="Reduced precision to compare"
+)
+precision_parser.add_argument("--batch_size", type=int, default=16, help="Faces per batch")
+precision_parser.add_argument("--batches", type=int, default=3, help="Batches to time per round")
+precision_parser.add_argument("--rounds", type=int, default=3, help="Rounds of timing both precisions")
+precision_parser.add_argument("--cpu_threads", type=int, default=0, help="Threads on the CPU, 0 for one per CPU")
+precision_parser.add_argument("--atol", type=float, default=4 / 255, help="Largest output difference accepted")
+precision_parser.set_defaults(run=bench_precision, show=print_precision)
+
+compile_parser = commands.add_parser("compile", help=bench_compile.__doc__)
+compile_parser.add_argument("--checkpoint", type=str, default=None, help="Wav2Lip checkpoint, random weights if not given")
+compile_parser.add_argument("--backend", type=str, default="trace", choices=["trace", "compile"], help="Backend to compare")
+compile_parser.add_argument("--device", type=str, default="auto", choices=["auto", "cuda", "mps", "cpu"], help="Device to run on")
+compile_parser.add_argument("--batch_size", type=int, default=16, help="Faces per batch")
+compile_parser.add_argument("--batches", type=int, default=3, help="Batches to time per round")
+compile_parser.add_argument("--rounds", type=int, default=3, help="Rounds of timing both models")
+compile_parser.add_argument("--cpu_threads", type=int, default=0, help="Threads on the CPU, 0 for one per CPU")
+compile_parser.set_defaults(run=bench_compile, show=print_compile)
+
+tiers_parser = commands.add_parser("tiers", help=bench_tiers.__doc__)
+tiers_parser.add_argument("--face", type=str, required=True, help="Video with a face, its frames are the reference")
+tiers_parser.add_argument("--max_frames", type=int, default=100, help="Only use the first frames of the video")
+tiers_parser.add_argument("--out_height", type=int, default=None, help="Resize frames to this height first")
+tiers_parser.add_argument("--gfpgan", default=False, action="store_true", help="Also run Enhanced, needs GFPGAN")
+tiers_parser.add_argument("--batch_size", type=int, default=8, help="Faces per GFPGAN batch")
+tiers_parser.set_defaults(run=bench_tiers, show=print_tiers)
+
+kernels_parser = commands.add_parser("kernels", help=bench_kernels.__doc__)
+kernels_parser.add_argument("--kernels", type=int, default=10000, help="Kernels to generate per generator")
+kernels_parser.add_argument("--kernel_size", type=int, default=21, help="Width and height of the kernels, odd")
+kernels_parser.add_argument("--batch_size", type=int, default=1000, help="Kernels per KernelBank call")
+kernels_parser.add_argument("--noise", default=False, action="store_true", help="Add multiplicative kernel noise")
+kernels_parser.add_argument("--device", type=str, default="cpu", choices=["auto", "cuda", "mps", "cpu"], help="Device of the torch kernels")
+kernels_parser.set_defaults(run=bench_kernels, show=print_kernels)
+
+degrade_parser = commands.add_parser("degrade", help=bench_degrade.__doc__)
+degrade_parser.add_argument("--batch_size", type=int, default=32, help="Images per batch")
+degrade_parser.add_argument("--size", type=int, default=256, help="Width and height of the images")
+degrade_parser.add_argument("--workers", type=int, default=0, help="JPEG threads, 0 for one per CPU")
+degrade_parser.add_argument("--rounds", type=int, default=3, help="Rounds of timing every variant")
+degrade_parser.set_defaults(run=bench_degrade, show=print_degrade)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    report = args.run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        args.show(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Wav2Lip compiled for the fixed shapes it renders with.
+
+Faces are always 6x96x96 and mels 1x80x16, only the batch size changes. Every
+batch is padded to the next power of two, its bucket, so a render compiles at
+most two graphs: one for the full batches and one for the last one.
+
+The ``trace`` backend saves every traced graph under ``CACHE_DIR``, so later
+processes load it instead of tracing again. The ``compile`` backend runs
+``torch.compile`` and keeps Inductor's compiled kernels in the same directory.
+"""
+import hashlib
+import os
+import threading
+import time
+
+import torch
+
+BACKENDS = ("eager", "trace", "compile")
+CACHE_DIR = os.path.join("wav2lip", "checkpoints", "compiled")
+MAX_BUCKET = 128
+
+
+def bucket_size(n, max_bucket=MAX_BUCKET):
+    """Smallest power of two that holds ``n`` items, at most ``max_bucket``."""
+    size = 1
+    while size < n:
+        size *= 2
+    return min(size, max_bucket)
+
+
+def pad_batch(tensor, size):
+    """``tensor`` with its last item repeated until it has ``size`` items."""
+    n = len(tensor)
+    if n == size:
+        return tensor
+    return torch.cat([tensor, tensor[-1:].expand(size - n, *tensor.shape[1:])])
+
+
+def cache_key(path, *parts):
+    """Short hash of the file at ``path``, the torch version and ``parts``.
+
+    The file is identified by its name, size and modification time, so a
+    converted or quantized checkpoint gets new compiled graphs.
+    """
+    stat = os.stat(path)
+    key = (os.path.basename(path), stat.st_size, stat.st_mtime_ns, torch.__version__) + parts
+    return hashlib.sha256(repr(key).encode()).hexdigest()[:16]
+
+
+class CompiledModel(torch.nn.Module):
+    """Wav2Lip run through compiled graphs, one per batch size bucket.
+
+    A bucket is compiled the first time a batch of its size comes in. When
+    compiling fails, e.g. because there is no C++ compiler for Inductor, the
+    eager model runs from then on.
+
+    Args:
+        model (Module): Wav2Lip in eval mode, on ``device``.
+        backend (str): ``"trace"`` or ``"compile"``.
+        device (str): Device of the model.
+        key (str): Identifies the weights, precision and device, see
+            :func:`cache_key`.
+        cache_dir (str): Directory of the compiled graphs. Default:
+            ``CACHE_DIR``.
+        max_bucket (int): Largest bucket, bigger batches run in parts.
+            Default: 128.
+    """
+
+    def __init__(self, model, backend, device, key, cache_dir=CACHE_DIR, max_bucket=MAX_BUCKET):
+        if backend not in ("trace", "compile"):
+            raise ValueError(f"Unknown backend {backend!r}")
+        super().__init__()
+        self.model = model
+        self.backend = backend
+        self.device = device
+        self.key = key
+        self.cache_dir = cache_dir
+        self.max_bucket = max_bucket
+        self.graphs = {}
+        self.compile_seconds = {}
+        self.failed = None
+        self.lock = threading.Lock()
+        self._compiled = None
+
+    def forward(self, mel, face):
+        n = len(face)
+        if n > self.max_bucket:
+            step = self.max_bucket
+            return torch.cat([self(mel[i : i + step], face[i : i + step]) for i in range(0, n, step)])
+        size = bucket_size(n, self.max_bucket)
+        mel, face = pad_batch(mel, size), pad_batch(face, size)
+        return self._graph(size, mel, face)(mel, face)[:n]
+
+    def _graph(self, size, mel, face):
+        with self.lock:
+            if self.failed is not None:
+                return self.model
+            if size not in self.graphs:
+                start = time.perf_counter()
+                try:
+                    self.graphs[size] = self._build(size, mel, face)
+                except Exception as e:
+                    self.failed = (str(e).splitlines() or [type(e).__name__])[0]
+                    print(f"\nCompiling Wav2Lip with {self.backend} failed, running it eagerly: {self.failed}")
+                    return self.model
+                self.compile_seconds[size] = time.perf_counter() - start
+            return self.graphs[size]
+
+    def _build(self, size, mel, face):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if self.backend == "trace":
+            return self._trace(size, mel, face)
+        return self._compile(mel, face)
+
+    def _trace(self, size, mel, face):
+        path = os.path.join(self.cache_dir, f"{self.key}-b{size}.pt")
+        if os.path.exists(path):
+            return torch.jit.load(path, map_location=self.device)
+        with torch.no_grad():
+            graph = torch.jit.freeze(torch.jit.trace(self.model, (mel, face)))
+        partial = path + ".partial"
+        torch.jit.save(graph, partial)
+        os.replace(partial, path)
+        return graph
+
+    def _compile(self, mel, face):
+        import torch._dynamo
+        import torch._inductor.config
+
+        if self._compiled is None:
+            os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.abspath(os.path.join(self.cache_dir, "inductor")))
+            torch._inductor.config.fx_graph_cache = True
+            # every bucket is its own graph of the same forward
+            torch._dynamo.config.cache_size_limit = max(
+                torch._dynamo.config.cache_size_limit, self.max_bucket.bit_length() + 1
+            )
+            self._compiled = torch.compile(self.model, dynamic=False)
+        self._compiled(mel, face)  # compiles for this shape now, not within a timed batch
+        return self._compiled
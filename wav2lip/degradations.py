@@ -1,10 +1,12 @@
 import cv2
+import functools
 import math
 import numpy as np
 import random
+import threading
 import torch
+from concurrent.futures import ThreadPoolExecutor
 from scipy import special
-from scipy.stats import multivariate_normal
 from torchvision.transforms.functional import rgb_to_grayscale
 
 # -------------------------------------------------------------------- #
@@ -29,9 +31,13 @@ def sigma_matrix2(sig_x, sig_y, theta):
     return np.dot(u_matrix, np.dot(d_matrix, u_matrix.T))
 
 
+@functools.lru_cache(maxsize=None)
 def mesh_grid(kernel_size):
     """Generate the mesh grid, centering at zero.
 
+    Grids are cached per kernel size and read-only, so they must not be
+    modified in place.
+
     Args:
         kernel_size (int):
 
@@ -44,6 +50,8 @@ def mesh_grid(kernel_size):
     xx, yy = np.meshgrid(ax, ax)
     xy = np.hstack((xx.reshape((kernel_size * kernel_size, 1)), yy.reshape(kernel_size * kernel_size,
                                                                            1))).reshape(kernel_size, kernel_size, 2)
+    for array in (xy, xx, yy):
+        array.setflags(write=False)
     return xy, xx, yy
 
 
@@ -75,9 +83,10 @@ def cdf2(d_matrix, grid):
     Returns:
         cdf (ndarray): skewed cdf.
     """
-    rv = multivariate_normal([0, 0], [[1, 0], [0, 1]])
     grid = np.dot(grid, d_matrix)
-    cdf = rv.cdf(grid)
+    # the two coordinates of the standard bivariate Gaussian are independent,
+    # so its CDF is the product of the univariate ones, exact and vectorized
+    cdf = special.ndtr(grid[..., 0]) * special.ndtr(grid[..., 1])
     return cdf
 
 
@@ -383,6 +392,149 @@ def random_mixed_kernels(kernel_list,
     return kernel
 
 
+class KernelBank:
+    """Generate batches of the kernels of :func:`random_mixed_kernels`.
+
+    The kernels follow the same distributions as ``random_mixed_kernels``
+    with the same arguments, but the types and parameters of a whole batch
+    are drawn at once and every kernel is evaluated on one cached grid, in
+    a single vectorized call instead of one NumPy call chain per kernel.
+
+    Parameters are drawn with ``np.random``, so ``np.random.seed`` makes a
+    bank reproducible. :meth:`sample_pt` draws its multiplicative noise with
+    ``torch.rand`` on the device.
+
+    Args:
+        kernel_list (tuple): a list name of kernel types,
+            support ['iso', 'aniso', 'generalized_iso', 'generalized_aniso',
+            'plateau_iso', 'plateau_aniso']
+        kernel_prob (tuple): corresponding kernel probability for each
+            kernel type
+        kernel_size (int):
+        sigma_x_range (tuple): [0.6, 5]
+        sigma_y_range (tuple): [0.6, 5]
+        rotation range (tuple): [-math.pi, math.pi]
+        betag_range (tuple): [0.5, 8]
+        betap_range (tuple): [0.5, 8]
+        noise_range(tuple, optional): multiplicative kernel noise,
+            [0.75, 1.25]. Plateau kernels get none, like in
+            ``random_mixed_kernels``. Default: None
+    """
+
+    KERNEL_TYPES = ('iso', 'aniso', 'generalized_iso', 'generalized_aniso', 'plateau_iso', 'plateau_aniso')
+
+    def __init__(self,
+                 kernel_list,
+                 kernel_prob,
+                 kernel_size=21,
+                 sigma_x_range=(0.6, 5),
+                 sigma_y_range=(0.6, 5),
+                 rotation_range=(-math.pi, math.pi),
+                 betag_range=(0.5, 8),
+                 betap_range=(0.5, 8),
+                 noise_range=None):
+        assert kernel_size % 2 == 1, 'Kernel size must be an odd number.'
+        unknown = set(kernel_list) - set(self.KERNEL_TYPES)
+        if unknown:
+            raise ValueError(f'Unsupported kernel types {sorted(unknown)}')
+        assert sigma_x_range[0] < sigma_x_range[1], 'Wrong sigma_x_range.'
+        if any(kernel_type.endswith('aniso') for kernel_type in kernel_list):
+            assert sigma_y_range[0] < sigma_y_range[1], 'Wrong sigma_y_range.'
+            assert rotation_range[0] < rotation_range[1], 'Wrong rotation_range.'
+        if noise_range is not None:
+            assert noise_range[0] < noise_range[1], 'Wrong noise range.'
+        kernel_prob = np.asarray(kernel_prob, dtype=np.float64)
+        self.kernel_list = np.asarray(kernel_list)
+        self.kernel_prob = kernel_prob / kernel_prob.sum()
+        self.kernel_size = kernel_size
+        self.sigma_x_range = sigma_x_range
+        self.sigma_y_range = sigma_y_range
+        self.rotation_range = rotation_range
+        self.betag_range = betag_range
+        self.betap_range = betap_range
+        self.noise_range = noise_range
+        # x^2, 2xy and y^2 of the grid, the quadratic form is their weighted sum
+        _, xx, yy = mesh_grid(kernel_size)
+        self.terms = np.stack([xx * xx, 2 * xx * yy, yy * yy])
+        self._terms_pt = {}
+
+    def _beta(self, beta_range, n):
+        # below or above 1 with equal chance, as the random_bivariate_* functions draw it
+        low = np.random.uniform(size=n) < 0.5
+        return np.where(low, np.random.uniform(beta_range[0], 1, n), np.random.uniform(1, beta_range[1], n))
+
+    def params(self, n):
+        """Draw the parameters of ``n`` kernels.
+
+        Returns:
+            inverse (ndarray): (n, 3) entries ``[0, 0]``, ``[0, 1]`` and
+                ``[1, 1]`` of the inverse sigma matrices.
+            beta (ndarray): (n,) shape parameters, 1 for Gaussian kernels.
+            plateau (ndarray): (n,) bool, True for plateau kernels.
+        """
+        types = self.kernel_list[np.random.choice(len(self.kernel_list), n, p=self.kernel_prob)]
+        isotropic = ~np.char.endswith(types, 'aniso')
+        generalized = np.char.startswith(types, 'generalized')
+        plateau = np.char.startswith(types, 'plateau')
+
+        sigma_x = np.random.uniform(self.sigma_x_range[0], self.sigma_x_range[1], n)
+        sigma_y = np.where(isotropic, sigma_x, np.random.uniform(self.sigma_y_range[0], self.sigma_y_range[1], n))
+        rotation = np.where(isotropic, 0, np.random.uniform(self.rotation_range[0], self.rotation_range[1], n))
+        beta = np.ones(n)
+        beta = np.where(generalized, self._beta(self.betag_range, n), beta)
+        beta = np.where(plateau, self._beta(self.betap_range, n), beta)
+
+        # inverse of the matrix of sigma_matrix2, U diag(1/sig_x^2, 1/sig_y^2) U^T
+        cos, sin = np.cos(rotation), np.sin(rotation)
+        inv_x, inv_y = sigma_x**-2, sigma_y**-2
+        inverse = np.stack([cos**2 * inv_x + sin**2 * inv_y, cos * sin * (inv_x - inv_y), sin**2 * inv_x + cos**2 * inv_y],
+                           axis=1)
+        return inverse, beta, plateau
+
+    def sample(self, n):
+        """Generate ``n`` kernels.
+
+        Returns:
+            kernels (ndarray): (n, K, K) float64, every kernel normalized.
+        """
+        inverse, beta, plateau = self.params(n)
+        kernels = np.einsum('nc,ckl->nkl', inverse, self.terms)
+        # most kernels are Gaussian, only the others are raised to their beta
+        shaped = beta != 1
+        kernels[shaped] **= beta[shaped, None, None]
+        kernels[plateau] = np.reciprocal(kernels[plateau] + 1)
+        kernels[~plateau] = np.exp(-0.5 * kernels[~plateau])
+        if self.noise_range is not None:
+            noisy = ~plateau
+            kernels[noisy] *= np.random.uniform(self.noise_range[0], self.noise_range[1], size=kernels[noisy].shape)
+        return kernels / np.sum(kernels, axis=(1, 2), keepdims=True)
+
+    def sample_pt(self, n, device='cpu', dtype=torch.float32):
+        """Generate ``n`` kernels (PyTorch version).
+
+        The kernels are evaluated on ``device``, e.g. next to the images
+        they blur.
+
+        Returns:
+            kernels (Tensor): (n, K, K), every kernel normalized.
+        """
+        inverse, beta, plateau = self.params(n)
+        key = (str(device), dtype)
+        if key not in self._terms_pt:
+            self._terms_pt[key] = torch.from_numpy(self.terms).to(device=device, dtype=dtype)
+        terms = self._terms_pt[key]
+        inverse = torch.from_numpy(inverse).to(device=device, dtype=dtype)
+        beta = torch.from_numpy(beta).to(device=device, dtype=dtype).view(n, 1, 1)
+        plateau = torch.from_numpy(plateau).to(device=device).view(n, 1, 1)
+        quadratic = torch.einsum('nc,ckl->nkl', inverse, terms).pow(beta)
+        kernels = torch.where(plateau, (quadratic + 1).reciprocal(), torch.exp(-0.5 * quadratic))
+        if self.noise_range is not None:
+            noise = torch.rand(kernels.shape, device=device, dtype=dtype)
+            noise = noise * (self.noise_range[1] - self.noise_range[0]) + self.noise_range[0]
+            kernels = torch.where(plateau, kernels, kernels * noise)
+        return kernels / kernels.sum(dim=(1, 2), keepdim=True)
+
+
 np.seterr(divide='ignore', invalid='ignore')
 
 
@@ -478,8 +630,7 @@ def generate_gaussian_noise_pt(img, sigma=10, gray_noise=0):
         cal_gray_noise = torch.sum(gray_noise) > 0
 
     if cal_gray_noise:
-        noise_gray = torch.randn(*img.size()[2:4], dtype=img.dtype, device=img.device) * sigma / 255.
-        noise_gray = noise_gray.view(b, 1, h, w)
+        noise_gray = torch.randn(b, 1, h, w, dtype=img.dtype, device=img.device) * sigma / 255.
 
     # always calculate color noise
     noise = torch.randn(*img.size(), dtype=img.dtype, device=img.device) * sigma / 255.
@@ -606,6 +757,27 @@ def add_poisson_noise(img, scale=1.0, clip=True, rounds=False, gray_noise=False)
     return out
 
 
+def _poisson_vals_pt(img):
+    """Levels the Poisson counts of every image in a batch are scaled by.
+
+    Like :func:`generate_poisson_noise`, the distinct values of an image are
+    rounded up to a power of two. They are counted for the whole batch at
+    once by scattering the 256 possible levels, instead of ``torch.unique``
+    per image.
+
+    Args:
+        img (Tensor): Shape (b, c, h, w), rounded to multiples of 1/255.
+
+    Returns:
+        (Tensor): Shape (b, 1, 1, 1), dtype of ``img``.
+    """
+    b = img.size(0)
+    levels = (img.reshape(b, -1) * 255.0).round().long()
+    present = torch.zeros(b, 256, dtype=torch.bool, device=img.device).scatter_(1, levels, True)
+    vals = torch.exp2(torch.ceil(torch.log2(present.sum(1).double())))
+    return vals.to(img.dtype).view(b, 1, 1, 1)
+
+
 def generate_poisson_noise_pt(img, scale=1.0, gray_noise=0):
     """Generate a batch of poisson noise (PyTorch version)
 
@@ -630,10 +802,7 @@ def generate_poisson_noise_pt(img, scale=1.0, gray_noise=0):
         img_gray = rgb_to_grayscale(img, num_output_channels=1)
         # round and clip image for counting vals correctly
         img_gray = torch.clamp((img_gray * 255.0).round(), 0, 255) / 255.
-        # use for-loop to get the unique values for each sample
-        vals_list = [len(torch.unique(img_gray[i, :, :, :])) for i in range(b)]
-        vals_list = [2**np.ceil(np.log2(vals)) for vals in vals_list]
-        vals = img_gray.new_tensor(vals_list).view(b, 1, 1, 1)
+        vals = _poisson_vals_pt(img_gray)
         out = torch.poisson(img_gray * vals) / vals
         noise_gray = out - img_gray
         noise_gray = noise_gray.expand(b, 3, h, w)
@@ -641,10 +810,7 @@ def generate_poisson_noise_pt(img, scale=1.0, gray_noise=0):
     # always calculate color noise
     # round and clip image for counting vals correctly
     img = torch.clamp((img * 255.0).round(), 0, 255) / 255.
-    # use for-loop to get the unique values for each sample
-    vals_list = [len(torch.unique(img[i, :, :, :])) for i in range(b)]
-    vals_list = [2**np.ceil(np.log2(vals)) for vals in vals_list]
-    vals = img.new_tensor(vals_list).view(b, 1, 1, 1)
+    vals = _poisson_vals_pt(img)
     out = torch.poisson(img * vals) / vals
     noise = out - img
     if cal_gray_noise:
@@ -741,7 +907,7 @@ def add_jpg_compression(img, quality=90):
             float32.
     """
     img = np.clip(img, 0, 1)
-    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)]
     _, encimg = cv2.imencode('.jpg', img * 255., encode_param)
     img = np.float32(cv2.imdecode(encimg, 1)) / 255.
     return img
@@ -762,3 +928,63 @@ def random_add_jpg_compression(img, quality_range=(90, 100)):
     """
     quality = np.random.uniform(quality_range[0], quality_range[1])
     return add_jpg_compression(img, quality)
+
+
+_jpg_executor = None
+_jpg_executor_lock = threading.Lock()
+
+
+def jpg_executor():
+    """Thread pool shared by the batched JPG functions, created on first use."""
+    global _jpg_executor
+    with _jpg_executor_lock:
+        if _jpg_executor is None:
+            _jpg_executor = ThreadPoolExecutor(thread_name_prefix='jpg')
+        return _jpg_executor
+
+
+def add_jpg_compression_batch(imgs, quality=90, executor=None):
+    """Add JPG compression artifacts to a batch of images on a thread pool.
+
+    cv2 releases the GIL while it encodes and decodes, so the images of a
+    batch are compressed in parallel, one :func:`add_jpg_compression` each.
+
+    Args:
+        imgs (Numpy array | list): Input images, shape (b, h, w, c) or a list
+            of (h, w, c), range [0, 1], float32.
+        quality (float | list[float]): JPG compression quality, one for all
+            images or one per image. Default: 90.
+        executor (Executor): Runs the compressions. Default: None, the pool of
+            :func:`jpg_executor`.
+
+    Returns:
+        (list[Numpy array]): Returned images after JPG, shape (h, w, c),
+            range[0, 1], float32.
+    """
+    if np.isscalar(quality):
+        quality = [quality] * len(imgs)
+    if len(imgs) < 2:
+        return [add_jpg_compression(img, q) for img, q in zip(imgs, quality)]
+    return list((executor or jpg_executor()).map(add_jpg_compression, imgs, quality))
+
+
+def random_add_jpg_compression_batch(imgs, quality_range=(90, 100), executor=None):
+    """Randomly add JPG compression artifacts to a batch of images.
+
+    Every image gets its own quality, see :func:`add_jpg_compression_batch`.
+
+    Args:
+        imgs (Numpy array | list): Input images, shape (b, h, w, c) or a list
+            of (h, w, c), range [0, 1], float32.
+        quality_range (tuple[float] | list[float]): JPG compression quality
+            range. 0 for lowest quality, 100 for best quality.
+            Default: (90, 100).
+        executor (Executor): Runs the compressions. Default: None, the pool of
+            :func:`jpg_executor`.
+
+    Returns:
+        (list[Numpy array]): Returned images after JPG, shape (h, w, c),
+            range[0, 1], float32.
+    """
+    quality = np.random.uniform(quality_range[0], quality_range[1], len(imgs))
+    return add_jpg_compression_batch(imgs, list(quality), executor)
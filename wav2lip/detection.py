@@ -0,0 +1,222 @@
+from collections import deque
+
+import cv2
+import numpy as np
+
+# frame height faces are detected at when the detection size is automatic
+AUTO_DETECT_HEIGHT = 480
+
+
+def detection_scale(shape, detect_height=0):
+    """Factor frames are shrunk by before face detection.
+
+    Args:
+        shape (tuple): Shape of the frame, (h, w, ...).
+        detect_height (int): Height to detect at, 0 picks
+            ``AUTO_DETECT_HEIGHT`` and -1 keeps the full resolution. Frames are
+            never enlarged. Default: 0.
+
+    Returns:
+        float: Scale in (0, 1].
+    """
+    if detect_height < 0:
+        return 1.0
+    target = detect_height or AUTO_DETECT_HEIGHT
+    return min(1.0, target / shape[0])
+
+
+def detect_faces(detector, frames, detect_height=0):
+    """Run RetinaFace on shrunk copies of ``frames``.
+
+    The face in a talking-head video covers a large part of the frame, so it
+    is found just as well at a few hundred pixels while the detector cost falls
+    with the pixel count. Boxes and landmarks are mapped back to the full
+    resolution frame; pads are left to the caller.
+
+    Args:
+        detector (RetinaFace): Face detector, called with a list of frames.
+        frames (list[ndarray]): BGR frames of the same size.
+        detect_height (int): See :func:`detection_scale`. Default: 0.
+
+    Returns:
+        list: ``(box, landmarks)`` of the first face per frame, or None where
+            there is none. ``box`` is ``(x1, y1, x2, y2)`` ints and
+            ``landmarks`` a float32 array of shape (5, 2).
+    """
+    if not frames:
+        return []
+    scale = detection_scale(frames[0].shape, detect_height)
+    if scale < 1:
+        size = (max(1, round(frames[0].shape[1] * scale)), max(1, round(frames[0].shape[0] * scale)))
+        # the exact factor per axis after rounding the size
+        sx, sy = size[0] / frames[0].shape[1], size[1] / frames[0].shape[0]
+        frames = [cv2.resize(frame, size, interpolation=cv2.INTER_AREA) for frame in frames]
+    else:
+        sx = sy = 1.0
+
+    detections = []
+    for faces in detector(frames):  # return faces list of all images
+        if not faces:
+            detections.append(None)
+            continue
+        box, landmarks, score = faces[0]
+        box = (box[0] / sx, box[1] / sy, box[2] / sx, box[3] / sy)
+        landmarks = np.asarray(landmarks, np.float32) / np.array([sx, sy], np.float32)
+        detections.append((tuple(map(int, box)), landmarks))
+    return detections
+
+
+def prepare_frame(frame, out_height=None, rotate=False, crop=(0, -1, 0, -1)):
+    """Resize, rotate and crop a decoded video frame like the ``--out_height``,
+    ``--rotate`` and ``--crop`` arguments ask for.
+
+    Args:
+        frame (ndarray): BGR frame as decoded.
+        out_height (int, optional): Height to resize to keeping the aspect
+            ratio, None keeps the size. Default: None.
+        rotate (bool): Rotate by 90 degrees clockwise. Default: False.
+        crop (tuple): ``(top, bottom, left, right)``, -1 for the far edge.
+
+    Returns:
+        ndarray: The prepared frame.
+    """
+    if out_height is not None:
+        aspect_ratio = frame.shape[1] / frame.shape[0]
+        frame = cv2.resize(frame, (int(out_height * aspect_ratio), out_height))
+
+    if rotate:
+        frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
+
+    y1, y2, x1, x2 = crop
+    if x2 == -1:
+        x2 = frame.shape[1]
+    if y2 == -1:
+        y2 = frame.shape[0]
+
+    return frame[y1:y2, x1:x2]
+
+
+# RetinaFace of a detection worker process
+_worker_detector = None
+
+
+def _init_worker(gpu_id, threads):
+    global _worker_detector
+    import torch
+    from batch_face import RetinaFace
+
+    torch.set_num_threads(threads)
+    _worker_detector = RetinaFace(
+        gpu_id=gpu_id, model_path="checkpoints/mobilenet.pth", network="mobilenet"
+    )
+
+
+def open_at(path, start):
+    """Open the video at ``path`` with frame ``start`` as the next frame read.
+
+    Seeking is not frame-accurate on many inter-coded streams. When the
+    position after the seek is not ``start``, the video is opened again and
+    the frames before ``start`` are decoded and dropped.
+
+    Returns:
+        cv2.VideoCapture: The opened video.
+    """
+    video_stream = cv2.VideoCapture(path)
+    if not start:
+        return video_stream
+    video_stream.set(cv2.CAP_PROP_POS_FRAMES, start)
+    if round(video_stream.get(cv2.CAP_PROP_POS_FRAMES)) == start:
+        return video_stream
+    video_stream.release()
+    video_stream = cv2.VideoCapture(path)
+    for _ in range(start):
+        if not video_stream.grab():
+            break
+    return video_stream
+
+
+def _detect_shard(path, start, count, prepare, detect_height):
+    video_stream = open_at(path, start)
+    frames = []
+    while len(frames) < count:
+        still_reading, frame = video_stream.read()
+        if not still_reading:
+            break
+        frames.append(prepare_frame(frame, **prepare))
+    video_stream.release()
+
+    detections = []
+    for i in range(0, len(frames), 8):
+        detections += detect_faces(_worker_detector, frames[i : i + 8], detect_height)
+    return detections
+
+
+class ShardedDetector:
+    """Per-frame face detection of a video file spread over worker processes.
+
+    The frame range is cut into shards of ``shard_size`` frames. Every worker
+    process has its own RetinaFace, opens the video itself at the start of its
+    shard with :func:`open_at` and prepares the frames with
+    :func:`prepare_frame`, so no frames are sent between processes. Detections come back in frame order,
+    so smoothing them afterwards gives the same boxes as a single pass.
+
+    Args:
+        workers (int): Number of worker processes.
+        gpu_id (int): Passed to RetinaFace, -1 for the CPU. Default: -1.
+        detect_height (int): See :func:`detection_scale`. Default: 0.
+        shard_size (int): Frames per shard. Default: 128.
+    """
+
+    def __init__(self, workers, gpu_id=-1, detect_height=0, shard_size=128):
+        self.workers = max(1, int(workers))
+        self.gpu_id = gpu_id
+        self.detect_height = detect_height
+        self.shard_size = shard_size
+
+    def detect(self, path, max_frames, prepare=None):
+        """Yield the detection of every frame of ``path`` in order.
+
+        Args:
+            path (str): Video file.
+            max_frames (int): Number of frames to detect at most.
+            prepare (dict, optional): Keyword arguments for
+                :func:`prepare_frame`. Default: None.
+
+        Yields:
+            ``(box, landmarks)`` or None, like :func:`detect_faces`.
+        """
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        from wav2lip.runtime import host_cpus
+
+        prepare = prepare or {}
+        threads = max(1, host_cpus() // self.workers)
+        # spawn, as forking next to running torch and pipeline threads can deadlock
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            self.workers, mp_context=context, initializer=_init_worker, initargs=(self.gpu_id, threads)
+        ) as pool:
+            starts = iter(range(0, max_frames, self.shard_size))
+            in_flight = deque()
+            try:
+                while True:
+                    # keep every worker busy with a shard queued behind it
+                    while len(in_flight) < 2 * self.workers:
+                        start = next(starts, None)
+                        if start is None:
+                            break
+                        count = min(self.shard_size, max_frames - start)
+                        in_flight.append(
+                            (count, pool.submit(_detect_shard, path, start, count, prepare, self.detect_height))
+                        )
+                    if not in_flight:
+                        break
+                    count, future = in_flight.popleft()
+                    detections = future.result()
+                    yield from detections
+                    if len(detections) < count:  # the video ended in this shard
+                        break
+            finally:
+                for _, future in in_flight:
+                    future.cancel()
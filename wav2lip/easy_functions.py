@@ -1,15 +1,11 @@
-import torch
 import subprocess
 import json
 import os
-import dlib
-import pickle
 import re
-from wav2lip.models import Wav2Lip
 from urllib.parse import urlparse
-from torch.hub import download_url_to_file, get_dir
 
-device = 'cuda' if torch.cuda.is_available() else 'mps' if torch.backends.mps.is_available() else 'cpu'
+# torch and the models are imported where they are used, so that importing
+# wav2lip to call run() stays cheap
 
 
 def get_video_details(filename):
@@ -56,40 +52,61 @@ def format_time(seconds):
     else:
         return f"{seconds}s"
 
-def _load(checkpoint_path):
-    if device != "cpu":
-        checkpoint = torch.load(checkpoint_path)
-    else:
-        checkpoint = torch.load(
-            checkpoint_path, map_location=lambda storage, loc: storage
-        )
-    return checkpoint
-
-
-def load_model(path):
-    # If results file exists, load it and return
-    working_directory = os.getcwd()
-    folder, filename_with_extension = os.path.split(path)
-    filename, file_type = os.path.splitext(filename_with_extension)
-    results_file = os.path.join(folder, filename + ".pk1")
-    if os.path.exists(results_file):
-        with open(results_file, "rb") as f:
-            return pickle.load(f)
+def fused_weights_path(path):
+    """Path of the safetensors file with the BatchNorm of checkpoint ``path`` folded in."""
+    return os.path.splitext(path)[0] + ".fused.safetensors"
+
+
+def fold_batchnorm(state_dict):
+    """``state_dict`` of a Wav2Lip checkpoint with its BatchNorm folded into the convolutions."""
+    import torch
+    from wav2lip.models import Wav2Lip, fuse_conv_bn
+
     model = Wav2Lip()
-    print("Loading {}".format(path))
-    checkpoint = _load(path)
-    s = checkpoint["state_dict"]
-    new_s = {}
-    for k, v in s.items():
-        new_s[k.replace("module.", "")] = v
-    model.load_state_dict(new_s)
-
-    model = model.to(device)
-    # Save results to file
-    with open(results_file, "wb") as f:
-        pickle.dump(model.eval(), f)
-    # os.remove(path)
-    return model.eval()
+    model.load_state_dict(state_dict)
+    with torch.no_grad():
+        return fuse_conv_bn(model.eval()).state_dict()
+
+
+def load_model(path, device=None, fuse=True):
+    """Load a Wav2Lip checkpoint.
+
+    The ``.pth`` checkpoint is converted to a safetensors file next to it the
+    first time. After that the weights are memory mapped instead of unpickled
+    and the model is built on the meta device and takes the mapped tensors as
+    its parameters, so no weights are initialised or copied on the CPU.
+
+    With ``fuse`` the BatchNorm layers are folded into the convolutions before
+    them when converting, which leaves the outputs the same up to float
+    rounding. The folded weights get a file of their own, see
+    :func:`fused_weights_path`, so they are memory mapped too.
+
+    Args:
+        path (str): Path of the ``.pth`` checkpoint.
+        device (str, optional): Device to load to. Default: the best one
+            available.
+        fuse (bool): Fold BatchNorm into the convolutions. Default: True.
+
+    Returns:
+        Wav2Lip: The model on ``device``, in eval mode.
+    """
+    import torch
+    from wav2lip.models import Wav2Lip, fuse_conv_bn
+    from wav2lip.runtime import best_device
+    from wav2lip.weights import convert_checkpoint, load_weights
+
+    device = device or best_device()
+    if fuse:
+        weights = convert_checkpoint(path, fused_weights_path(path), fold_batchnorm)
+    else:
+        weights = convert_checkpoint(path)
+    state_dict = load_weights(weights, device)
+    with torch.device("meta"):
+        model = Wav2Lip().eval()
+        if fuse:
+            fuse_conv_bn(model)
+    model.load_state_dict(state_dict, assign=True)
+    return model
 
 
 def get_input_length(filename):
@@ -115,24 +132,6 @@ def is_url(string):
     return bool(url_regex.match(string))
 
 
-def load_predictor():
-    checkpoint = os.path.join(
-        "wav2lip", "checkpoints", "shape_predictor_68_face_landmarks_GTX.dat"
-    )
-    predictor = dlib.shape_predictor(checkpoint)
-    mouth_detector = dlib.get_frontal_face_detector()
-
-    # Serialize the variables
-    with open(os.path.join("wav2lip", "checkpoints", "predictor.pkl"), "wb") as f:
-        pickle.dump(predictor, f)
-
-    with open(os.path.join("wav2lip", "checkpoints", "mouth_detector.pkl"), "wb") as f:
-        pickle.dump(mouth_detector, f)
-
-    # delete the .dat file as it is no longer needed
-    # os.remove(output)
-
-
 def load_file_from_url(url, model_dir=None, progress=True, file_name=None):
     """Load file form http url, will download models if necessary.
 
@@ -148,6 +147,8 @@ def load_file_from_url(url, model_dir=None, progress=True, file_name=None):
     Returns:
         str: The path to the downloaded file.
     """
+    from torch.hub import download_url_to_file, get_dir
+
     if model_dir is None:  # use the pytorch hub_dir
         hub_dir = get_dir()
         model_dir = os.path.join(hub_dir, "checkpoints")
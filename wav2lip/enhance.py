@@ -1,22 +1,210 @@
+import threading
 import warnings
-from gfpgan import GFPGANer
+
+import cv2
+import numpy as np
 
 warnings.filterwarnings("ignore")
 
+# GFPGANer keeps the faces of the current call on its face helper, so frames
+# blended on a worker pool have to take turns
+_enhance_lock = threading.Lock()
+
+
+def load_sr(device=None):
+    # gfpgan pulls in basicsr and facexlib, only Enhanced renders pay for them
+    from gfpgan import GFPGANer
 
-def load_sr():
     run_params = GFPGANer(
         model_path="checkpoints/GFPGANv1.4.pth",
         upscale=1,
         arch="clean",
         channel_multiplier=2,
         bg_upsampler=None,
+        device=device,
     )
     return run_params
 
 
 def upscale(image, properties):
-    _, _, output = properties.enhance(
-        image, has_aligned=False, only_center_face=False, paste_back=True
-    )
+    with _enhance_lock:
+        _, _, output = properties.enhance(
+            image, has_aligned=False, only_center_face=False, paste_back=True
+        )
     return output
+
+
+# where GFPGANer puts the eyes, nose and mouth corners in its 512x512 input,
+# the template facexlib aligns faces to
+FACE_TEMPLATE = np.array(
+    [
+        [192.98138, 239.94708],
+        [318.90277, 240.1936],
+        [256.63416, 314.01935],
+        [201.26117, 371.41043],
+        [313.08905, 371.15118],
+    ],
+    np.float32,
+)
+FACE_SIZE = 512
+
+
+def align_face(image, landmarks):
+    """Warp the face in ``image`` to GFPGAN's input, like facexlib aligns it.
+
+    Args:
+        image (ndarray): BGR image holding the face.
+        landmarks (ndarray): Eyes, nose and mouth corners of the face in
+            ``image``, shape (5, 2), in the order RetinaFace returns them.
+
+    Returns:
+        tuple: ``(face, affine)``, the 512x512 face and the 2x3 transform
+            from ``image`` to it.
+    """
+    affine = cv2.estimateAffinePartial2D(np.asarray(landmarks, np.float32), FACE_TEMPLATE, method=cv2.LMEDS)[0]
+    face = cv2.warpAffine(
+        image, affine, (FACE_SIZE, FACE_SIZE), borderMode=cv2.BORDER_CONSTANT, borderValue=(135, 133, 132)
+    )
+    return face, affine
+
+
+def restore_faces(properties, faces, weight=0.5):
+    """Run the GFPGAN network of ``properties`` on a batch of aligned faces.
+
+    Args:
+        properties (GFPGANer): Model from :func:`load_sr`.
+        faces (list[ndarray]): 512x512 BGR faces from :func:`align_face`.
+        weight (float): Weight of the restored features, as in
+            ``GFPGANer.enhance``. Default: 0.5.
+
+    Returns:
+        ndarray: Restored BGR faces, uint8, shape (n, 512, 512, 3).
+    """
+    import torch
+
+    batch = torch.from_numpy(np.ascontiguousarray(np.stack(faces)[..., ::-1])).to(properties.device)
+    batch = batch.permute(0, 3, 1, 2).float().div_(255.0).sub_(0.5).div_(0.5)
+    with _enhance_lock, torch.no_grad():
+        output = properties.gfpgan(batch, return_rgb=False, weight=weight)[0]
+    output = output.float().clamp_(-1, 1).add_(1).mul_(127.5).round_()
+    return output.permute(0, 2, 3, 1).cpu().numpy()[..., ::-1].astype(np.uint8)
+
+
+def paste_face(image, face, affine):
+    """Paste a restored face back into ``image`` with the soft edge facexlib uses.
+
+    Args:
+        image (ndarray): BGR image the face was aligned from.
+        face (ndarray): Restored 512x512 face.
+        affine (ndarray): Transform from :func:`align_face`.
+
+    Returns:
+        ndarray: ``image`` with the face pasted in, uint8.
+    """
+    h, w = image.shape[:2]
+    inverse = cv2.invertAffineTransform(affine)
+    face = cv2.warpAffine(face, inverse, (w, h))
+    mask = cv2.warpAffine(np.ones((FACE_SIZE, FACE_SIZE), np.float32), inverse, (w, h))
+    mask = cv2.erode(mask, np.ones((2, 2), np.uint8))
+    edge = int(mask.sum() ** 0.5) // 20
+    if edge:
+        mask = cv2.erode(mask, np.ones((2 * edge, 2 * edge), np.uint8))
+        mask = cv2.GaussianBlur(mask, (2 * edge + 1, 2 * edge + 1), 0)
+    mask = mask[..., None]
+    return (mask * face + (1 - mask) * image + 0.5).astype(np.uint8)
+
+
+def enhance_faces(properties, images, landmarks, batch_size=8):
+    """Restore the face in each of ``images`` with GFPGAN, in batches.
+
+    Faces with landmarks are aligned with them and restored in batches of
+    ``batch_size``. GFPGANer would detect and align every face again and run
+    one at a time. Faces without landmarks still go through
+    :func:`upscale`.
+
+    Args:
+        properties (GFPGANer): Model from :func:`load_sr`.
+        images (list): BGR face crops, None entries are passed through.
+        landmarks (list): Landmarks of every crop in crop coordinates, see
+            :func:`align_face`, or None.
+        batch_size (int): Faces per GFPGAN batch. Default: 8.
+
+    Returns:
+        list: The crops with their faces restored.
+    """
+    out = list(images)
+    aligned = [
+        (i, *align_face(image, points))
+        for i, (image, points) in enumerate(zip(images, landmarks))
+        if image is not None and points is not None
+    ]
+    for start in range(0, len(aligned), batch_size):
+        chunk = aligned[start : start + batch_size]
+        restored = restore_faces(properties, [face for _, face, _ in chunk])
+        for (i, _, affine), face in zip(chunk, restored):
+            out[i] = paste_face(images[i], face, affine)
+    for i, (image, points) in enumerate(zip(images, landmarks)):
+        if image is not None and points is None:
+            out[i] = upscale(image, properties)
+    return out
+
+
+def mouth_roi(size, landmarks=None):
+    """Box around the mouth in a face crop of ``size``, ``(x1, y1, x2, y2)``.
+
+    Args:
+        size (tuple): ``(w, h)`` of the crop.
+        landmarks (ndarray, optional): RetinaFace landmarks in crop
+            coordinates, the box is placed around the mouth corners. Default:
+            the middle of the lower half of the crop.
+    """
+    w, h = size
+    if landmarks is None:
+        return w // 8, h // 2, w - w // 8, h
+    (lx, ly), (rx, ry) = landmarks[3], landmarks[4]
+    mw = max(abs(rx - lx), w / 8)
+    cy = (ly + ry) / 2
+    x1, x2 = int(min(lx, rx) - 0.5 * mw), int(max(lx, rx) + 0.5 * mw) + 1
+    y1, y2 = int(cy - 0.6 * mw), int(cy + 0.8 * mw) + 1
+    return max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+
+
+def sharpen_mouth(face, size, landmarks=None, amount=0.8):
+    """Upsample a predicted face to ``size`` with a sharpened mouth.
+
+    The whole face is resized like Improved renders do. The mouth box is
+    resampled with bicubic interpolation instead and unsharp masked at the
+    scale of the upsampling blur, then feathered into the rest so no seam
+    shows. A few milliseconds per face on a CPU core.
+
+    Args:
+        face (ndarray): Predicted face, 96x96 in [0, 255].
+        size (tuple): ``(w, h)`` of the face crop.
+        landmarks (ndarray, optional): See :func:`mouth_roi`.
+        amount (float): Strength of the unsharp mask. Default: 0.8.
+
+    Returns:
+        ndarray: uint8 face of ``size``.
+    """
+    face = face.astype(np.uint8)
+    w, h = size
+    out = cv2.resize(face, size)
+    x1, y1, x2, y2 = mouth_roi(size, landmarks)
+    if x2 - x1 < 4 or y2 - y1 < 4:
+        return out
+    sx, sy = face.shape[1] / w, face.shape[0] / h
+    # output pixel (x, y) of the box samples the face where cv2.resize would
+    to_face = np.array([[sx, 0, (x1 + 0.5) * sx - 0.5], [0, sy, (y1 + 0.5) * sy - 0.5]], np.float32)
+    roi = cv2.warpAffine(
+        face, to_face, (x2 - x1, y2 - y1), flags=cv2.INTER_CUBIC | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE
+    )
+    blurred = cv2.GaussianBlur(roi, (0, 0), max(0.5 / sx, 0.5 / sy) * 0.5)
+    roi = cv2.addWeighted(roi, 1 + amount, blurred, -amount, 0)
+
+    # ramp over the outer eighth of the box
+    ramp_y = np.clip(np.minimum(np.arange(y2 - y1), np.arange(y2 - y1)[::-1]) / max(1, (y2 - y1) // 8), 0, 1)
+    ramp_x = np.clip(np.minimum(np.arange(x2 - x1), np.arange(x2 - x1)[::-1]) / max(1, (x2 - x1) // 8), 0, 1)
+    alpha = (ramp_y[:, None] * ramp_x[None, :])[..., None]
+    box = out[y1:y2, x1:x2]
+    out[y1:y2, x1:x2] = (alpha * roi + (1 - alpha) * box + 0.5).astype(np.uint8)
+    return out
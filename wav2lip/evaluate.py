@@ -0,0 +1,364 @@
+"""Quality against speed of inference settings.
+
+Run ``python -m wav2lip.evaluate --checkpoint_path <.pth> --face <video>
+--audio <audio> --syncnet <lipsync_expert.pth>`` to render a fixed corpus
+with every configuration and compare them on
+
+- lip sync: the SyncNet offset and confidence of the rendered faces,
+- fidelity: PSNR and SSIM of the faces against the reference render,
+- speed: frames per second of the whole render.
+
+The corpus is the given clip cut to ``--seconds``, and a synthetic clip of its
+first frame moving on a fixed path, which exercises detection and tracking.
+Both are written once to ``--corpus_dir`` together with the reference render,
+so later runs, e.g. after changing the code, compare with the same frames.
+
+A configuration is a list of ``inference.py`` arguments, given as
+``--config name="--precision half --detect_every 3"``. The report ends with
+the Pareto front: the configurations no other one beats in speed, SSIM and
+sync confidence at once.
+"""
+import argparse
+import json
+import os
+import shlex
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+# configurations compared when no --config is given, as inference.py arguments
+PRESETS = {
+    "default": [],
+    "detect_every_5": ["--detect_every", "5"],
+    "half": ["--precision", "half"],
+    "trace": ["--backend", "trace"],
+    "silence": ["--silence", "original"],
+    "enhanced_lite": ["--quality", "Enhanced-Lite"],
+}
+# the render every configuration is compared with: full resolution detection on every frame in FP32
+REFERENCE = ["--detect_every", "1", "--detect_height", "-1"]
+
+
+def build_corpus(face, audio_path, corpus_dir, seconds=8.0, fps=25.0):
+    """Clips every configuration renders, written to ``corpus_dir`` the first time.
+
+    Args:
+        face (str): Video or image of a face.
+        audio_path (str): Audio to drive it, cut to ``seconds``.
+        corpus_dir (str): Directory of the corpus.
+        seconds (float): Length of the clips. Default: 8.
+        fps (float): Frame rate of the synthetic clip. Default: 25.
+
+    Returns:
+        list[dict]: ``name``, ``face`` and ``audio`` of every clip.
+    """
+    index = os.path.join(corpus_dir, "corpus.json")
+    if os.path.exists(index):
+        with open(index) as f:
+            return json.load(f)
+
+    from wav2lip import audio
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    wav_path = os.path.join(corpus_dir, "audio.wav")
+    audio.save_wav(audio.load_wav(audio_path, 16000)[: int(seconds * 16000)], wav_path, 16000)
+
+    video_stream = cv2.VideoCapture(face)
+    source_fps = video_stream.get(cv2.CAP_PROP_FPS) or fps
+    frames = []
+    while len(frames) < seconds * source_fps:
+        still_reading, frame = video_stream.read()
+        if not still_reading:
+            break
+        frames.append(frame)
+    video_stream.release()
+    if not frames:
+        raise ValueError(f"Could not read any frame of {face}")
+
+    clips = []
+    if len(frames) > 1:
+        clips.append({"name": "real", "face": _write_video(os.path.join(corpus_dir, "real.mp4"), frames, source_fps)})
+    else:
+        still = os.path.join(corpus_dir, "still.png")
+        cv2.imwrite(still, frames[0])
+        clips.append({"name": "still", "face": still})
+    moving = [_drift(frames[0], i / fps) for i in range(int(seconds * fps))]
+    clips.append({"name": "synthetic", "face": _write_video(os.path.join(corpus_dir, "synthetic.mp4"), moving, fps)})
+    for clip in clips:
+        clip["audio"] = wav_path
+
+    with open(index, "w") as f:
+        json.dump(clips, f, indent=2)
+    return clips
+
+
+def _drift(image, t):
+    # a slow sway and zoom, the same on every run
+    h, w = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), 2 * np.sin(2 * np.pi * t / 6), 1 + 0.05 * np.sin(2 * np.pi * t / 5))
+    matrix[:, 2] += (0.04 * w * np.sin(2 * np.pi * t / 4), 0.02 * h * np.sin(2 * np.pi * t / 3))
+    return cv2.warpAffine(image, matrix, (w, h), borderMode=cv2.BORDER_REFLECT)
+
+
+def _write_video(path, frames, fps):
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (frames[0].shape[1], frames[0].shape[0]))
+    for frame in frames:
+        out.write(frame)
+    out.release()
+    return path
+
+
+def render(inference, checkpoint_path, clip, config, out_dir):
+    """Render ``clip`` with the inference arguments ``config``.
+
+    Args:
+        inference (module): ``wav2lip.inference``, imported by the caller as
+            importing it loads torch.
+        checkpoint_path (str): Wav2Lip checkpoint.
+        clip (dict): See :func:`build_corpus`.
+        config (list[str]): Arguments of ``inference.py``.
+        out_dir (str): Directory of the render, emptied first.
+
+    Returns:
+        dict: The ``frames`` rendered and the wall clock ``seconds`` of the
+            render, including reading the input and writing the video.
+    """
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    args = inference.parser.parse_args(
+        [
+            "--checkpoint_path", checkpoint_path,
+            "--face", clip["face"],
+            "--audio", clip["audio"],
+            "--outfile", os.path.join(out_dir, "result_voice.mp4"),
+            # detections of an earlier render must not be reused
+            "--face_cache", os.path.join(out_dir, "faces.pkl"),
+            *config,
+        ]
+    )
+    device = inference.select_render_device(args)
+    if device == "cpu":
+        inference.configure_cpu(args.cpu_threads, args.interop_threads)
+    models = inference.load_models(args.checkpoint_path, device, args.precision, args.backend)
+    models.preload(args.quality).join()
+    session = inference.InferenceSession(args, models, temp_dir=out_dir)
+    start = time.perf_counter()
+    session.run()
+    seconds = time.perf_counter() - start
+    frames = int(cv2.VideoCapture(session.temp_path("result.mp4")).get(cv2.CAP_PROP_FRAME_COUNT))
+    result = {"config": config, "frames": frames, "seconds": seconds}
+    with open(os.path.join(out_dir, "render.json"), "w") as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+def face_boxes(detector, frames, pads=(0, 10, 0, 0)):
+    """Padded face box of every frame, the last one where no face is found."""
+    from wav2lip.detection import detect_faces
+
+    boxes, box = [], None
+    for i in range(0, len(frames), 8):
+        for frame, detection in zip(frames[i : i + 8], detect_faces(detector, frames[i : i + 8])):
+            if detection is not None:
+                x1, y1, x2, y2 = detection[0]
+                h, w = frame.shape[:2]
+                box = (max(0, x1 - pads[2]), max(0, y1 - pads[0]), min(w, x2 + pads[3]), min(h, y2 + pads[1]))
+            boxes.append(box)
+    if box is None:
+        raise ValueError("No face found in the reference render")
+    first = next(b for b in boxes if b is not None)
+    return [first if b is None else b for b in boxes]
+
+
+def mel_windows(wav_path, fps, frames):
+    """Mel window of every frame, cut like a render cuts them."""
+    from wav2lip import audio
+
+    mel = audio.melspectrogram(audio.load_wav(wav_path, 16000))
+    starts = [min(int(i * 80.0 / fps), mel.shape[1] - 16) for i in range(frames)]
+    return np.asarray([mel[:, start : start + 16] for start in starts])
+
+
+def score(frames, reference, boxes, mels, syncnet=None):
+    """Metrics of the faces of a render against the faces of the reference render.
+
+    Args:
+        frames (list[ndarray]): Frames of the render.
+        reference (list[ndarray]): Frames of the reference render.
+        boxes (list[tuple]): Face box of every frame, see :func:`face_boxes`.
+        mels (ndarray): Mel window of every frame, see :func:`mel_windows`.
+        syncnet (SyncNet_color, optional): Scores the lip sync when given.
+
+    Returns:
+        dict: PSNR and SSIM of the faces and, with ``syncnet``, the sync
+            offset and confidence.
+    """
+    from wav2lip.metrics import psnr, ssim, sync_offset
+
+    n = min(len(frames), len(reference), len(boxes))
+    faces, psnrs, ssims = [], [], []
+    for frame, expected, (x1, y1, x2, y2) in zip(frames[:n], reference[:n], boxes[:n]):
+        face = frame[y1:y2, x1:x2]
+        psnrs.append(psnr(expected[y1:y2, x1:x2], face))
+        ssims.append(ssim(expected[y1:y2, x1:x2], face))
+        faces.append(cv2.resize(face, (96, 96)))
+    finite = [p for p in psnrs if np.isfinite(p)]
+    result = {
+        "psnr": round(float(np.mean(finite)), 2) if finite else float("inf"),
+        "ssim": round(float(np.mean(ssims)), 4),
+    }
+    if syncnet is not None:
+        offset, confidence = sync_offset(syncnet, np.asarray(faces, np.float32) / 255.0, mels[:n])
+        result.update(sync_offset=offset, sync_confidence=round(confidence, 3))
+    return result
+
+
+def pareto_front(rows, keys=("fps", "ssim", "sync_confidence")):
+    """Names of the rows no other row matches or beats in all ``keys`` and beats in one."""
+    keys = [k for k in keys if all(k in row for row in rows)]
+
+    def dominates(a, b):
+        return all(a[k] >= b[k] for k in keys) and any(a[k] > b[k] for k in keys)
+
+    return [row["config"] for row in rows if not any(dominates(other, row) for other in rows)]
+
+
+def evaluate(args, configs):
+    """Render the corpus with the reference and every configuration and score them.
+
+    Returns:
+        dict: One row per configuration with its metrics averaged over the
+            clips, and the Pareto front.
+    """
+    import wav2lip.inference as inference
+    from wav2lip.benchmark import read_video
+    from wav2lip.metrics import load_syncnet
+
+    clips = build_corpus(args.face, args.audio, args.corpus_dir, args.seconds)
+    # a reused reference is not rendered, which would otherwise register the models
+    inference.register_models(inference.registry, args.checkpoint_path)
+    syncnet = load_syncnet(args.syncnet) if args.syncnet else None
+    base = shlex.split(args.render_args)
+    reference_config = base + REFERENCE
+
+    references = {}
+    for clip in clips:
+        out_dir = os.path.join(args.corpus_dir, "reference", clip["name"])
+        saved = os.path.join(out_dir, "render.json")
+        reuse = False
+        if os.path.exists(saved) and not args.refresh_reference:
+            with open(saved) as f:
+                reuse = json.load(f)["config"] == reference_config
+        if not reuse:
+            render(inference, args.checkpoint_path, clip, reference_config, out_dir)
+        with open(saved) as f:
+            timing = json.load(f)
+        frames = read_video(os.path.join(out_dir, "result.mp4"))
+        video_stream = cv2.VideoCapture(clip["face"])
+        fps = video_stream.get(cv2.CAP_PROP_FPS) or 25.0
+        video_stream.release()
+        references[clip["name"]] = {
+            "frames": frames,
+            "boxes": face_boxes(inference.registry.get("retinaface", "cpu"), frames),
+            "mels": mel_windows(clip["audio"], fps, len(frames)),
+            "timing": timing,
+        }
+
+    rows = []
+    for name, config in [("reference", None), *configs.items()]:
+        scores, frames_total, seconds_total = [], 0, 0.0
+        for i, clip in enumerate(clips):
+            expected = references[clip["name"]]
+            if config is None:
+                timing, frames = expected["timing"], expected["frames"]
+            else:
+                out_dir = os.path.join(args.corpus_dir, "renders", name, clip["name"])
+                if i == 0 and args.warmup:
+                    # loads the models and compiles for --backend outside the timed renders
+                    render(inference, args.checkpoint_path, clip, base + config, out_dir)
+                timing = render(inference, args.checkpoint_path, clip, base + config, out_dir)
+                frames = read_video(os.path.join(out_dir, "result.mp4"))
+            frames_total += timing["frames"]
+            seconds_total += timing["seconds"]
+            scores.append(score(frames, expected["frames"], expected["boxes"], expected["mels"], syncnet))
+        row = {"config": name, "args": " ".join(base + (REFERENCE if config is None else config))}
+        row["fps"] = round(frames_total / seconds_total, 2)
+        for key in scores[0]:
+            values = [s[key] for s in scores]
+            row[key] = max(values, key=abs) if key == "sync_offset" else round(float(np.mean(values)), 4)
+        rows.append(row)
+
+    reference = rows[0]
+    for row in rows:
+        row["speedup"] = round(row["fps"] / reference["fps"], 2)
+        row["passed"] = row["psnr"] >= args.min_psnr
+        if "sync_confidence" in row:
+            row["sync_drop"] = round(reference["sync_confidence"] - row["sync_confidence"], 3)
+            row["passed"] = (
+                row["passed"]
+                and row["sync_drop"] <= args.max_sync_drop
+                and row["sync_offset"] == reference["sync_offset"]
+            )
+    return {"clips": [clip["name"] for clip in clips], "configs": rows, "pareto": pareto_front(rows)}
+
+
+def print_report(report):
+    print(f"clips: {', '.join(report['clips'])}, faces compared with the reference render")
+    sync = "sync_confidence" in report["configs"][0]
+    header = f"{'config':<16}{'fps':>8}{'speedup':>9}{'PSNR':>8}{'SSIM':>8}"
+    if sync:
+        header += f"{'offset':>8}{'conf':>7}{'drop':>7}"
+    print(header + f"{'gate':>6}{'pareto':>8}")
+    for row in report["configs"]:
+        line = f"{row['config']:<16}{row['fps']:>8.2f}{row['speedup']:>8.2f}x{row['psnr']:>8.2f}{row['ssim']:>8.4f}"
+        if sync:
+            line += f"{row['sync_offset']:>8}{row['sync_confidence']:>7.3f}{row['sync_drop']:>7.3f}"
+        pareto = "*" if row["config"] in report["pareto"] else ""
+        print(line + f"{'pass' if row['passed'] else 'FAIL':>6}{pareto:>8}")
+
+
+def parse_config(spec):
+    """``name=args`` of a --config option as ``(name, [args])``."""
+    name, _, config = spec.partition("=")
+    if not name:
+        raise argparse.ArgumentTypeError(f"--config needs a name, as in name=\"--precision half\", got {spec!r}")
+    return name, shlex.split(config)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the quality and speed of Wav2Lip inference settings")
+    parser.add_argument("--checkpoint_path", type=str, required=True, help="Wav2Lip checkpoint to render with")
+    parser.add_argument("--face", type=str, required=True, help="Video or image of a face the corpus is made from")
+    parser.add_argument("--audio", type=str, required=True, help="Audio to drive the face")
+    parser.add_argument("--syncnet", type=str, default=None, help="SyncNet checkpoint (lipsync_expert.pth) for sync scores")
+    parser.add_argument("--corpus_dir", type=str, default="evaluation", help="Directory of the corpus and the renders")
+    parser.add_argument("--seconds", type=float, default=8.0, help="Length of the clips of a new corpus")
+    parser.add_argument(
+        "--config",
+        type=parse_config,
+        action="append",
+        default=None,
+        help='Configuration to compare, name="inference arguments"; repeat for more. Default: the presets',
+    )
+    parser.add_argument("--render_args", type=str, default="", help="Inference arguments of every render, e.g. the quality")
+    parser.add_argument("--refresh_reference", default=False, action="store_true", help="Render the reference again")
+    parser.add_argument("--no_warmup", dest="warmup", default=True, action="store_false", help="Time the first render too")
+    parser.add_argument("--min_psnr", type=float, default=30.0, help="Lowest face PSNR in dB against the reference to pass")
+    parser.add_argument("--max_sync_drop", type=float, default=0.5, help="Largest drop of the sync confidence to pass")
+    parser.add_argument("--json", default=False, action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = evaluate(args, dict(args.config) if args.config else PRESETS)
+    with open(os.path.join(args.corpus_dir, "report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0 if all(row["passed"] for row in report["configs"]) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
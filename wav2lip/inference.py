@@ -1,4 +1,4 @@
-from pathib import Path
+from pathlib import Path
 
 print("\rloading torch       ", end="")
 import torch
@@ -6,14 +6,14 @@ import torch
 print("\rloading numpy       ", end="")
 import numpy as np
 
-print("\rloading Image       ", end="")
-from PIL import Image
-
 print("\rloading argparse    ", end="")
 import argparse
 
-print("\rloading configparser", end="")
-import configparser
+print("\rloading shutil      ", end="")
+import shutil
+
+print("\rloading tempfile    ", end="")
+import tempfile
 
 print("\rloading math        ", end="")
 import math
@@ -27,20 +27,26 @@ import subprocess
 print("\rloading pickle      ", end="")
 import pickle
 
+print("\rloading hashlib     ", end="")
+import hashlib
+
 print("\rloading cv2         ", end="")
 import cv2
 
 print("\rloading audio       ", end="")
 import wav2lip.audio as audio
 
-print("\rloading RetinaFace ", end="")
-from batch_face import RetinaFace
-
 print("\rloading re          ", end="")
 import re
 
-print("\rloading partial     ", end="")
-from functools import partial
+print("\rloading itertools   ", end="")
+from itertools import islice
+
+print("\rloading deque       ", end="")
+from collections import deque
+
+print("\rloading threading   ", end="")
+import threading
 
 print("\rloading tqdm        ", end="")
 from tqdm import tqdm
@@ -51,19 +57,57 @@ import warnings
 warnings.filterwarnings(
     "ignore", category=UserWarning, module="torchvision.transforms.functional_tensor"
 )
-print("\rloading upscale     ", end="")
-from wav2lip.enhance import upscale
+print("\rloading enhance     ", end="")
+from wav2lip.enhance import enhance_faces, sharpen_mouth
 
 print("\rloading load_sr     ", end="")
 from wav2lip.enhance import load_sr
 
+print("\rloading pipeline    ", end="")
+from wav2lip.pipeline import Pipeline
+
+print("\rloading compositor  ", end="")
+from wav2lip.compositor import AlphaCompositor, prepare_alpha
+
+print("\rloading detection   ", end="")
+from wav2lip.detection import ShardedDetector, detect_faces, prepare_frame
+
+print("\rloading tracking    ", end="")
+from wav2lip.tracking import KeyframeTracker
+
+print("\rloading smoothing   ", end="")
+from wav2lip.smoothing import causal_filter, get_smoothened_box, smooth_track
+
+print("\rloading masks       ", end="")
+from wav2lip.masks import MaskGenerator, feather_params, fit_mouth, place_mouth
+
+print("\rloading vad         ", end="")
+from wav2lip.hparams import hparams as hp
+from wav2lip.vad import fade_weights, silent_frames, window_loudness
+
+print("\rloading runtime     ", end="")
+from wav2lip.compiled import BACKENDS
+from wav2lip.runtime import (
+    HALF_DTYPES,
+    ParityGuard,
+    best_device,
+    configure_cpu,
+    prepare_model,
+    resolve_precision,
+    select_device,
+    to_input,
+)
+
+print("\rloading registry    ", end="")
+from wav2lip.registry import ModelRegistry
+
 print("\rloading load_model  ", end="")
-from wav2lip.easy_functions import load_model, g_colab
+from wav2lip.easy_functions import load_model
+from wav2lip.weights import file_sha256
 
 print("\rimports loaded!     ")
 
-device = 'cuda' if torch.cuda.is_available() else 'mps' if torch.backends.mps.is_available() else 'cpu'
-gpu_id = 0 if torch.cuda.is_available() else -1
+device = best_device()
 
 if device == 'cpu':
     print('Warning: No GPU detected so inference will be done on the CPU which is VERY SLOW!')
@@ -171,6 +215,15 @@ parser.add_argument(
     help="Prevent smoothing face detections over a short temporal window",
 )
 
+parser.add_argument(
+    "--smoothing",
+    type=str,
+    default="window",
+    choices=["window", "ema", "one_euro"],
+    help="How face detections are smoothed: a window over the next 5 frames, or a causal "
+    "exponential or One-Euro filter that needs no later frames",
+)
+
 parser.add_argument(
     "--no_seg",
     default=False,
@@ -231,556 +284,1239 @@ parser.add_argument(
     required=False,
 )
 
+parser.add_argument(
+    "--mask_downscale",
+    default=0,
+    type=int,
+    help="Factor the mask feathering is computed at reduced resolution by, 0 picks one from the mask size, 1 is exact",
+    required=False,
+)
+
 parser.add_argument(
     "--quality",
     type=str,
-    help="Choose between Fast, Improved and Enhanced",
+    help="Choose between Fast, Improved, Enhanced-Lite and Enhanced",
     default="Fast",
 )
 
-with open(os.path.join("wav2lip", "checkpoints", "predictor.pkl"), "rb") as f:
-    predictor = pickle.load(f)
-
-with open(os.path.join("wav2lip", "checkpoints", "mouth_detector.pkl"), "rb") as f:
-    mouth_detector = pickle.load(f)
-
-# creating variables to prevent failing when a face isn't detected
-kernel = last_mask = x = y = w = h = None
-
-# Load the config file
-config = configparser.ConfigParser()
-config.read('config.ini')
-
-# Get the value of the "preview_window" variable
-preview_window = config.get('OPTIONS', 'preview_window')
-
-all_mouth_landmarks = []
-
-model = detector = detector_model = None
-
-def do_load(checkpoint_path):
-    global model, detector, detector_model
-    model = load_model(checkpoint_path)
-    detector = RetinaFace(
-        gpu_id=gpu_id, model_path="checkpoints/mobilenet.pth", network="mobilenet"
-    )
-    detector_model = detector.model
-
-def face_rect(images):
-    face_batch_size = 8
-    num_batches = math.ceil(len(images) / face_batch_size)
-    prev_ret = None
-    for i in range(num_batches):
-        batch = images[i * face_batch_size : (i + 1) * face_batch_size]
-        all_faces = detector(batch)  # return faces list of all images
-        for faces in all_faces:
-            if faces:
-                box, landmarks, score = faces[0]
-                prev_ret = tuple(map(int, box))
-            yield prev_ret
-
-def create_tracked_mask(img, original_img):
-    global kernel, last_mask, x, y, w, h  # Add last_mask to global variables
-
-    # Convert color space from BGR to RGB if necessary
-    cv2.cvtColor(img, cv2.COLOR_BGR2RGB, img)
-    cv2.cvtColor(original_img, cv2.COLOR_BGR2RGB, original_img)
-
-    # Detect face
-    faces = mouth_detector(img)
-    if len(faces) == 0:
-        if last_mask is not None:
-            last_mask = cv2.resize(last_mask, (img.shape[1], img.shape[0]))
-            mask = last_mask  # use the last successful mask
-        else:
-            cv2.cvtColor(img, cv2.COLOR_BGR2RGB, img)
-            return img, None
-    else:
-        face = faces[0]
-        shape = predictor(img, face)
-
-        # Get points for mouth
-        mouth_points = np.array(
-            [[shape.part(i).x, shape.part(i).y] for i in range(48, 68)]
-        )
-
-        # Calculate bounding box dimensions
-        x, y, w, h = cv2.boundingRect(mouth_points)
-
-        # Set kernel size as a fraction of bounding box size
-        kernel_size = int(max(w, h) * args.mask_dilation)
-        # if kernel_size % 2 == 0:  # Ensure kernel size is odd
-        # kernel_size += 1
-
-        # Create kernel
-        kernel = np.ones((kernel_size, kernel_size), np.uint8)
-
-        # Create binary mask for mouth
-        mask = np.zeros(img.shape[:2], dtype=np.uint8)
-        cv2.fillConvexPoly(mask, mouth_points, 255)
-
-        last_mask = mask  # Update last_mask with the new mask
-
-    # Dilate the mask
-    dilated_mask = cv2.dilate(mask, kernel)
-
-    # Calculate distance transform of dilated mask
-    dist_transform = cv2.distanceTransform(dilated_mask, cv2.DIST_L2, 5)
+parser.add_argument(
+    "--blend_workers",
+    default=min(4, os.cpu_count() or 1),
+    type=int,
+    help="Number of threads compositing predicted faces back into frames",
+    required=False,
+)
 
-    # Normalize distance transform
-    cv2.normalize(dist_transform, dist_transform, 0, 255, cv2.NORM_MINMAX)
+parser.add_argument(
+    "--detect_every",
+    default=1,
+    type=int,
+    help="Detect faces on at most every Nth video frame and track them in between, 1 detects every frame",
+    required=False,
+)
 
-    # Convert normalized distance transform to binary mask and convert it to uint8
-    _, masked_diff = cv2.threshold(dist_transform, 50, 255, cv2.THRESH_BINARY)
-    masked_diff = masked_diff.astype(np.uint8)
+parser.add_argument(
+    "--detect_height",
+    default=0,
+    type=int,
+    help="Frame height faces are detected at, 0 picks one from the frame size, -1 detects at full resolution",
+    required=False,
+)
 
-    # make sure blur is an odd number
-    blur = args.mask_feathering
-    if blur % 2 == 0:
-        blur += 1
-    # Set blur size as a fraction of bounding box size
-    blur = int(max(w, h) * blur)  # 10% of bounding box size
-    if blur % 2 == 0:  # Ensure blur size is odd
-        blur += 1
-    masked_diff = cv2.GaussianBlur(masked_diff, (blur, blur), 0)
+parser.add_argument(
+    "--detect_workers",
+    default=1,
+    type=int,
+    help="Number of processes detecting faces of a video in parallel, only used when detecting every frame",
+    required=False,
+)
 
-    # Convert numpy arrays to PIL Images
-    input1 = Image.fromarray(img)
-    input2 = Image.fromarray(original_img)
+parser.add_argument(
+    "--face_cache",
+    default="",
+    type=str,
+    help="File the detected face boxes are saved to and reused from on the next run. Default: a file under "
+    "temp/faces named by the sha256 of the input and the detection settings",
+    required=False,
+)
 
-    # Convert mask to single channel where pixel values are from the alpha channel of the current mask
-    mask = Image.fromarray(masked_diff)
+parser.add_argument(
+    "--silence",
+    default="off",
+    choices=["off", "original", "closed"],
+    help="What silent stretches of the audio show without running Wav2Lip on every frame: original passes the "
+    "face through, closed shows a closed mouth, predicted once and reused for a still image and on every "
+    "frame of a video",
+    required=False,
+)
 
-    # Ensure images are the same size
-    assert input1.size == input2.size == mask.size
+parser.add_argument(
+    "--silence_threshold",
+    default=40.0,
+    type=float,
+    help="How many dB below the loudest part of the audio counts as silence",
+    required=False,
+)
 
-    # Paste input1 onto input2 using the mask
-    input2.paste(input1, (0, 0), mask)
+parser.add_argument(
+    "--silence_min_duration",
+    default=0.5,
+    type=float,
+    help="Shortest pause in seconds that counts as silence",
+    required=False,
+)
 
-    # Convert the final PIL Image back to a numpy array
-    input2 = np.array(input2)
+parser.add_argument(
+    "--silence_fade",
+    default=3,
+    type=int,
+    help="Frames of the crossfade into and out of silence",
+    required=False,
+)
 
-    # input2 = cv2.cvtColor(input2, cv2.COLOR_BGR2RGB)
-    cv2.cvtColor(input2, cv2.COLOR_BGR2RGB, input2)
+parser.add_argument(
+    "--enhance_batch_size",
+    default=8,
+    type=int,
+    help="Faces GFPGAN restores at once in Enhanced renders",
+    required=False,
+)
 
-    return input2, mask
+parser.add_argument(
+    "--queue_size",
+    default=8,
+    type=int,
+    help="Maximum number of items waiting between two pipeline stages",
+    required=False,
+)
 
+parser.add_argument(
+    "--device",
+    default="auto",
+    choices=["auto", "cuda", "mps", "cpu"],
+    help="Device to render on, auto picks the GPU when there is one",
+    required=False,
+)
 
-def create_mask(img, original_img):
-    global kernel, last_mask, x, y, w, h # Add last_mask to global variables
+parser.add_argument(
+    "--precision",
+    default="fp32",
+    choices=["fp32", "half", "bf16", "fp16", "int8"],
+    help="Precision of Wav2Lip; half is bf16 on the CPU and fp16 on a GPU, both checked against fp32 on the "
+    "first batch and replaced by it when they differ; int8 runs on the CPU and needs a model made by "
+    "python -m wav2lip.quantize",
+    required=False,
+)
 
-    # Convert color space from BGR to RGB if necessary
-    cv2.cvtColor(img, cv2.COLOR_BGR2RGB, img)
-    cv2.cvtColor(original_img, cv2.COLOR_BGR2RGB, original_img)
+parser.add_argument(
+    "--backend",
+    default="eager",
+    choices=list(BACKENDS),
+    help="How Wav2Lip runs; trace and compile compile it once per batch size bucket and cache the result in "
+    "wav2lip/checkpoints/compiled",
+    required=False,
+)
 
-    if last_mask is not None:
-        last_mask = np.array(last_mask)  # Convert PIL Image to numpy array
-        last_mask = cv2.resize(last_mask, (img.shape[1], img.shape[0]))
-        mask = last_mask  # use the last successful mask
-        mask = Image.fromarray(mask)
+parser.add_argument(
+    "--cpu_threads",
+    default=0,
+    type=int,
+    help="Intra-op threads of torch on the CPU, 0 for one per available CPU",
+    required=False,
+)
 
-    else:
-        # Detect face
-        faces = mouth_detector(img)
-        if len(faces) == 0:
-            cv2.cvtColor(img, cv2.COLOR_BGR2RGB, img)
-            return img, None
-        else:
-            face = faces[0]
-            shape = predictor(img, face)
+parser.add_argument(
+    "--interop_threads",
+    default=0,
+    type=int,
+    help="Inter-op threads of torch on the CPU, 0 for 1",
+    required=False,
+)
 
-            # Get points for mouth
-            mouth_points = np.array(
-                [[shape.part(i).x, shape.part(i).y] for i in range(48, 68)]
-            )
+parser.add_argument(
+    "--memory_budget",
+    default=0,
+    type=int,
+    help="MB the models kept loaded between renders of one process may take, least recently used ones are "
+    "dropped beyond it, 0 for no limit",
+    required=False,
+)
 
-            # Calculate bounding box dimensions
-            x, y, w, h = cv2.boundingRect(mouth_points)
+parser.add_argument(
+    "--idle_seconds",
+    default=0,
+    type=float,
+    help="Seconds after which a model no render used is dropped, 0 to keep it",
+    required=False,
+)
 
-            # Set kernel size as a fraction of bounding box size
-            kernel_size = int(max(w, h) * args.mask_dilation)
-            # if kernel_size % 2 == 0:  # Ensure kernel size is odd
-            # kernel_size += 1
+mel_step_size = 16
 
-            # Create kernel
-            kernel = np.ones((kernel_size, kernel_size), np.uint8)
 
-            # Create binary mask for mouth
-            mask = np.zeros(img.shape[:2], dtype=np.uint8)
-            cv2.fillConvexPoly(mask, mouth_points, 255)
+class SharedModels:
+    """Model handles shared by every :class:`InferenceSession` of a process.
+
+    The models come from a :class:`ModelRegistry`, which loads each of them
+    the first time a session asks for it and hands the same object to every
+    session after that. The handles are only read while rendering, so one
+    instance can serve many sessions at once.
+
+    Args:
+        registry (ModelRegistry): Registry the models are registered with,
+            see :func:`register_models`.
+        checkpoint_path (str): Path of the Wav2Lip checkpoint to use.
+        device (str): Device to load the models on. Default: the best one
+            available.
+        precision (str): Precision of Wav2Lip, "fp32", "half", "bf16",
+            "fp16" or "int8", see :func:`resolve_precision`. Default: "fp32".
+        backend (str): How Wav2Lip runs, "eager", "trace" or "compile", see
+            :mod:`wav2lip.compiled`. Default: "eager".
+    """
+
+    def __init__(self, registry, checkpoint_path, device=device, precision="fp32", backend="eager"):
+        self.registry = registry
+        self.precision = resolve_precision(precision, device)
+        self.model_name = model_name(checkpoint_path, self.precision, backend)
+        self.device = device
+
+    @property
+    def model(self):
+        """Wav2Lip model in eval mode."""
+        return self.registry.get(self.model_name, self.device)
+
+    @property
+    def detector(self):
+        """RetinaFace face detector."""
+        return self.registry.get("retinaface", self.device)
+
+    @property
+    def predictor(self):
+        """dlib 68 point landmark predictor."""
+        return self.registry.get("predictor", "cpu")
+
+    @property
+    def mouth_detector(self):
+        """dlib face detector, only used to place the mouth mask when there
+        are no landmarks."""
+        return self.registry.get("mouth_detector", "cpu")
+
+    @property
+    def sr(self):
+        """GFPGAN face restorer, the only one :func:`load_sr` loads."""
+        return self.registry.get("gfpgan", self.device)
+
+    def preload(self, quality="Improved"):
+        """Start loading the models a render of ``quality`` needs in the
+        background, so the render does not wait for them one by one."""
+        self.registry.preload(["predictor", "mouth_detector"], "cpu")
+        names = [self.model_name, "retinaface"]
+        if quality not in ("Fast", "Improved", "Enhanced-Lite"):
+            names.append("gfpgan")
+        return self.registry.preload(names, self.device)
+
+
+def model_name(checkpoint_path, precision="fp32", backend="eager"):
+    """Registry name of a Wav2Lip checkpoint, e.g. ``"Wav2Lip_GAN"`` or ``"Wav2Lip_GAN-bf16-trace"``."""
+    name = os.path.splitext(os.path.basename(checkpoint_path))[0]
+    if precision != "fp32":
+        name += f"-{precision}"
+    if backend != "eager":
+        name += f"-{backend}"
+    return name
+
+
+def _load_int8(checkpoint_path, device):
+    from wav2lip.quantize import load_quantized
 
-            # Dilate the mask
-            dilated_mask = cv2.dilate(mask, kernel)
+    if device != "cpu":
+        raise ValueError("The INT8 model only runs on the CPU, use --device cpu")
+    return prepare_model(load_quantized(checkpoint_path), device)
 
-            # Calculate distance transform of dilated mask
-            dist_transform = cv2.distanceTransform(dilated_mask, cv2.DIST_L2, 5)
 
-            # Normalize distance transform
-            cv2.normalize(dist_transform, dist_transform, 0, 255, cv2.NORM_MINMAX)
+def _compile(model, checkpoint_path, precision, backend, device):
+    from wav2lip.compiled import CompiledModel, cache_key
 
-            # Convert normalized distance transform to binary mask and convert it to uint8
-            _, masked_diff = cv2.threshold(dist_transform, 50, 255, cv2.THRESH_BINARY)
-            masked_diff = masked_diff.astype(np.uint8)
+    source = checkpoint_path
+    if precision == "int8":
+        from wav2lip.quantize import quantized_path
 
-            if not args.mask_feathering == 0:
-                blur = args.mask_feathering
-                # Set blur size as a fraction of bounding box size
-                blur = int(max(w, h) * blur)  # 10% of bounding box size
-                if blur % 2 == 0:  # Ensure blur size is odd
-                    blur += 1
-                masked_diff = cv2.GaussianBlur(masked_diff, (blur, blur), 0)
+        source = quantized_path(checkpoint_path)
+    return CompiledModel(model, backend, device, cache_key(source, precision, device))
 
-            # Convert mask to single channel where pixel values are from the alpha channel of the current mask
-            mask = Image.fromarray(masked_diff)
 
-            last_mask = mask  # Update last_mask with the final mask after dilation and feathering
+def _load_wav2lip(registry, checkpoint_path, precision, backend, device):
+    if precision == "int8":
+        model = _load_int8(checkpoint_path, device)
+    elif precision in HALF_DTYPES:
+        model = prepare_model(load_model(checkpoint_path, device).to(HALF_DTYPES[precision]), device)
+    else:
+        model = prepare_model(load_model(checkpoint_path, device), device)
+    if backend != "eager":
+        model = _compile(model, checkpoint_path, precision, backend, device)
+    if precision in HALF_DTYPES:
+        # the FP32 model is only loaded for the parity check and after a fallback
+        model = ParityGuard(model, lambda: registry.get(model_name(checkpoint_path), device), HALF_DTYPES[precision])
+    return model
 
-    # Convert numpy arrays to PIL Images
-    input1 = Image.fromarray(img)
-    input2 = Image.fromarray(original_img)
 
-    # Resize mask to match image size
-    # mask = Image.fromarray(mask)
-    mask = mask.resize(input1.size)
+def _load_retinaface(device):
+    from batch_face import RetinaFace
 
-    # Ensure images are the same size
-    assert input1.size == input2.size == mask.size
+    return RetinaFace(gpu_id=0 if device == "cuda" else -1, model_path="checkpoints/mobilenet.pth", network="mobilenet")
 
-    # Paste input1 onto input2 using the mask
-    input2.paste(input1, (0, 0), mask)
 
-    # Convert the final PIL Image back to a numpy array
-    input2 = np.array(input2)
+def _load_pickle(name):
+    with open(os.path.join("wav2lip", "checkpoints", name), "rb") as f:
+        return pickle.load(f)
 
-    # input2 = cv2.cvtColor(input2, cv2.COLOR_BGR2RGB)
-    cv2.cvtColor(input2, cv2.COLOR_BGR2RGB, input2)
 
-    return input2, mask
+def register_models(registry, checkpoint_path):
+    """Register the loaders of every model a render may need.
 
+    The face detectors are small and needed by every render, so they stay
+    resident; Wav2Lip and GFPGAN can be evicted under the memory budget.
 
-def get_smoothened_boxes(boxes, T):
-    for i in range(len(boxes)):
-        if i + T > len(boxes):
-            window = boxes[len(boxes) - T :]
-        else:
-            window = boxes[i : i + T]
-        boxes[i] = np.mean(window, axis=0)
-    return boxes
-            
-def face_detect(images, results_file="last_detected_face.pkl"):
-    # If results file exists, load it and return
-    if os.path.exists(results_file):
-        print("Using face detection data from last input")
-        with open(results_file, "rb") as f:
-            return pickle.load(f)
-
-    results = []
-    pady1, pady2, padx1, padx2 = args.pads
-    
-    tqdm_partial = partial(tqdm, position=0, leave=True)
-    for image, (rect) in tqdm_partial(
-        zip(images, face_rect(images)),
-        total=len(images),
-        desc="detecting face in every frame",
-        ncols=100,
-    ):
-        if rect is None:
-            cv2.imwrite(
-                "temp/faulty_frame.jpg", image
-            )  # check this frame where the face was not detected.
-            raise ValueError(
-                "Face not detected! Ensure the video contains a face in all the frames."
+    Args:
+        registry (ModelRegistry): Registry to register with.
+        checkpoint_path (str): Path of the Wav2Lip checkpoint.
+    """
+    for precision in ("fp32", "int8", *HALF_DTYPES):
+        for backend in BACKENDS:
+            registry.register(
+                model_name(checkpoint_path, precision, backend),
+                lambda device, precision=precision, backend=backend: _load_wav2lip(
+                    registry, checkpoint_path, precision, backend, device
+                ),
             )
+    registry.register("retinaface", _load_retinaface, pinned=True)
+    registry.register("predictor", lambda device: _load_pickle("predictor.pkl"), pinned=True)
+    registry.register("mouth_detector", lambda device: _load_pickle("mouth_detector.pkl"), pinned=True)
+    registry.register("gfpgan", load_sr)
+
+
+# models of this process, shared by all its sessions
+registry = ModelRegistry()
+
+
+def load_models(checkpoint_path, device=device, precision="fp32", backend="eager"):
+    """Models for rendering with the Wav2Lip checkpoint at ``checkpoint_path``.
+
+    Nothing is loaded here, every model is loaded by :data:`registry` the first
+    time it is used or by :meth:`SharedModels.preload`.
+
+    Args:
+        checkpoint_path (str): Path of the Wav2Lip checkpoint.
+        device (str): Device to render on. Default: the best one available.
+        precision (str): See :class:`SharedModels`. Default: "fp32".
+        backend (str): See :class:`SharedModels`. Default: "eager".
+
+    Returns:
+        SharedModels: The models.
+    """
+    register_models(registry, checkpoint_path)
+    return SharedModels(registry, checkpoint_path, device, precision, backend)
+
+
+class MaskState:
+    """Mouth mask carried from one frame to the next within a single render.
+
+    Frames are composited on a worker pool, so every access goes through
+    ``lock``.
+    """
+
+    def __init__(self, generator):
+        self.generator = generator
+        # kept to prevent failing when a face isn't detected
+        self.last_mask = self.x = self.y = self.w = self.h = None
+        self.mouth_points = self.mouth_shape = None
+        # mouth polygon relative to the detector's mouth corners
+        self.mouth_template = None
+        # fixed-point alpha of last_mask at the size of the last crop
+        self.alpha = self.alpha_size = None
+        self.lock = threading.Lock()
+
+
+compositor = AlphaCompositor()
+
+
+class InferenceSession:
+    """One render, from the input face and audio to the muxed output video.
+
+    Everything that changes while rendering (arguments filled in on the way,
+    the mouth mask, intermediate files) belongs to the session, and the models
+    come in through a :class:`SharedModels`. Several sessions can therefore
+    run at the same time in one process, e.g. on a thread pool.
+
+    Args:
+        args (argparse.Namespace): Parsed command line, copied so the session
+            can fill in derived values without touching the caller's.
+        models (SharedModels): Models shared with other sessions.
+        temp_dir (str, optional): Directory for intermediate files. Default: a
+            new directory under ``temp/``, removed once the render succeeded.
+    """
+
+    def __init__(self, args, models, temp_dir=None):
+        self.args = argparse.Namespace(**vars(args))
+        self.models = models
+        self.own_temp_dir = temp_dir is None
+        if temp_dir is None:
+            os.makedirs(Path(os.getcwd()) / "temp", exist_ok=True)
+            temp_dir = tempfile.mkdtemp(prefix="session-", dir=Path(os.getcwd()) / "temp")
+        self.temp_dir = temp_dir
+        self.mask_state = MaskState(MaskGenerator(self.args.mask_downscale))
+        self.run_params = None
+        self.max_frames = None
+        self.fps = None
+        # still image renders: the frame every output starts from and the
+        # part of the face crop that changes, see blend_static
+        self.template = None
+        self.static_region = None
+        self.static_lock = threading.Lock()
+        # weight of the generated face per frame with --silence, see silence_weights
+        self.weights = None
+        self.frames_skipped = 0
+
+    def temp_path(self, name):
+        return os.path.join(self.temp_dir, name)
+
+    def detect_face(self, image):
+        return detect_faces(self.models.detector, [image], self.args.detect_height)[0]
+
+    def frame_options(self):
+        args = self.args
+        return {
+            "out_height": args.out_height if args.fullres != 1 else None,
+            "rotate": args.rotate,
+            "crop": args.crop,
+        }
+
+    def face_rect(self, images):
+        args = self.args
+        if args.detect_every > 1:
+            tracker = KeyframeTracker(self.detect_face, args.detect_every)
+            yield from tracker.track(images)
+            print(tracker.summary())
+            return
+
+        prev_ret = None
+        if args.detect_workers > 1 and not args.static and self.max_frames > 1:
+            # workers read the video themselves, images only pace the output
+            worker_gpu = 0 if self.models.device == "cuda" else -1
+            sharded = ShardedDetector(args.detect_workers, worker_gpu, args.detect_height)
+            detections = sharded.detect(args.face, self.max_frames, self.frame_options())
+            for image, detection in zip(images, detections):
+                if detection is not None:
+                    prev_ret = detection
+                yield prev_ret
+            return
+
+        face_batch_size = 8
+        images = iter(images)
+        while True:
+            batch = list(islice(images, face_batch_size))
+            if not batch:
+                break
+            for detection in detect_faces(self.models.detector, batch, self.args.detect_height):
+                if detection is not None:
+                    prev_ret = detection
+                yield prev_ret
 
-        y1 = max(0, rect[1] - pady1)
-        y2 = min(image.shape[0], rect[3] + pady2)
-        x1 = max(0, rect[0] - padx1)
-        x2 = min(image.shape[1], rect[2] + padx2)
-
-        results.append([x1, y1, x2, y2])
+    def get_mouth_points(self, rgb):
+        # Detect face
+        faces = self.models.mouth_detector(rgb)
+        if len(faces) == 0:
+            return None
+        face = faces[0]
+        shape = self.models.predictor(rgb, face)
 
+        # Get points for mouth
+        return np.array(
+            [[shape.part(i).x, shape.part(i).y] for i in range(48, 68)]
+        )
 
-    boxes = np.array(results)
-    if str(args.nosmooth) == "False":
-        boxes = get_smoothened_boxes(boxes, T=5)
-    results = [
-        [image[y1:y2, x1:x2], (y1, y2, x1, x2)]
-        for image, (x1, y1, x2, y2) in zip(images, boxes)
-    ]
+    def fit_mouth_template(self, img, landmarks):
+        import dlib
 
-    # Save results to file
-    with open(results_file, "wb") as f:
-        pickle.dump(results, f)
+        # run the landmark predictor once, on the crop, which is already the
+        # face box, so no dlib face detection is needed
+        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        shape = self.models.predictor(rgb, dlib.rectangle(0, 0, img.shape[1] - 1, img.shape[0] - 1))
+        mouth_points = np.array(
+            [[shape.part(i).x, shape.part(i).y] for i in range(48, 68)]
+        )
+        return fit_mouth(mouth_points, landmarks)
+
+    def landmark_mouth_points(self, img, landmarks):
+        state = self.mask_state
+        with state.lock:
+            if state.mouth_template is None:
+                state.mouth_template = self.fit_mouth_template(img, landmarks)
+            template = state.mouth_template
+        return place_mouth(template, landmarks)
+
+    def create_tracked_mask(self, img, original_img, landmarks=None):
+        args, state = self.args, self.mask_state
+        if landmarks is not None:
+            mouth_points = self.landmark_mouth_points(img, landmarks)
+        else:
+            # dlib expects RGB, the blend itself works on BGR
+            mouth_points = self.get_mouth_points(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        if mouth_points is None:
+            with state.lock:
+                last_points, last_shape, w, h = state.mouth_points, state.mouth_shape, state.w, state.h
+            if last_points is None:
+                return img, None
+            # use the last successful mouth, scaled to this crop
+            mouth_points = np.round(
+                last_points * (img.shape[1] / last_shape[1], img.shape[0] / last_shape[0])
+            ).astype(np.int32)
+        else:
+            # Calculate bounding box dimensions
+            x, y, w, h = cv2.boundingRect(mouth_points)
 
-    return results
+            with state.lock:  # Update the last mouth with the new one
+                state.mouth_points, state.mouth_shape = mouth_points, img.shape[:2]
+                state.x, state.y, state.w, state.h = x, y, w, h
+
+        # make sure blur is an odd number
+        feathering = args.mask_feathering
+        if feathering % 2 == 0:
+            feathering += 1
+        kernel_size, blur = feather_params(w, h, args.mask_dilation, feathering)
+        masked_diff = state.generator.get(img.shape, mouth_points, kernel_size, blur)
+
+        # Ensure images are the same size
+        assert img.shape == original_img.shape and img.shape[:2] == masked_diff.shape
+
+        # Blend img into original_img in place using the mask
+        compositor.composite(img, original_img, prepare_alpha(masked_diff), out=original_img)
+
+        return original_img, masked_diff
+
+    def create_mask(self, img, original_img, landmarks=None):
+        args, state = self.args, self.mask_state
+        # the mask is built once per render, so hold the lock while building it
+        with state.lock:
+            if state.last_mask is None:
+                if landmarks is not None:
+                    state.mouth_template = self.fit_mouth_template(img, landmarks)
+                    mouth_points = place_mouth(state.mouth_template, landmarks)
+                else:
+                    # dlib expects RGB, the blend itself works on BGR
+                    mouth_points = self.get_mouth_points(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+                if mouth_points is not None:
+                    # Calculate bounding box dimensions
+                    x, y, w, h = cv2.boundingRect(mouth_points)
+
+                    # Dilate, cut and feather the mouth as a fraction of its size
+                    kernel_size, blur = feather_params(w, h, args.mask_dilation, args.mask_feathering)
+
+                    # Update last_mask with the final mask after dilation and feathering
+                    state.last_mask = state.generator.get(img.shape, mouth_points, kernel_size, blur)
+                    state.mouth_points, state.mouth_shape = mouth_points, img.shape[:2]
+                    state.x, state.y, state.w, state.h = x, y, w, h
+            mask = state.last_mask
+
+            if mask is not None:
+                # Resize mask to match image size, always from the mask as it was built
+                size = (img.shape[1], img.shape[0])
+                if state.alpha_size != size:
+                    state.alpha = prepare_alpha(cv2.resize(mask, size))
+                    state.alpha_size = size
+                alpha = state.alpha
+
+        if mask is None:
+            return img, None
 
+        # Ensure images are the same size
+        assert img.shape == original_img.shape
+
+        # Blend img into original_img in place using the mask
+        compositor.composite(img, original_img, alpha, out=original_img)
+
+        return original_img, mask
+
+    def face_cache_path(self):
+        """File of the face boxes of this input, see ``--face_cache``.
+
+        Boxes are only reused for the same input file detected with the same
+        settings, so renders of other inputs never pick them up. They are
+        saved before smoothing, which every render applies its own way.
+        """
+        args = self.args
+        if args.face_cache:
+            return args.face_cache
+        settings = (
+            file_sha256(args.face),
+            args.pads,
+            args.out_height,
+            args.fullres,
+            args.crop,
+            args.rotate,
+            args.static,
+            args.detect_every,
+            args.detect_height,
+        )
+        key = hashlib.sha256(repr(settings).encode()).hexdigest()[:16]
+        return os.path.join(os.getcwd(), "temp", "faces", f"{key}.pkl")
+
+    def face_detect(self, images):
+        args = self.args
+        results_file = self.face_cache_path()
+        smooth = str(args.nosmooth) == "False"
+        # If results file exists, load it and reuse its boxes
+        if os.path.exists(results_file):
+            print("Using face detection data from last input")
+            with open(results_file, "rb") as f:
+                cached = pickle.load(f)
+            if isinstance(cached, dict):
+                # every box is known up front, so the whole track is smoothed at once
+                boxes = cached["boxes"]
+                if smooth:
+                    boxes = smooth_track(boxes, args.smoothing, self.fps)
+                for image, (x1, y1, x2, y2), landmarks in zip(images, boxes, cached["landmarks"]):
+                    yield image, (y1, y2, x1, x2), landmarks
+            else:
+                # files saved by older versions hold smoothed boxes, and no
+                # landmarks before landmarks were kept
+                for image, entry in zip(images, cached):
+                    yield image, entry[1], entry[2] if len(entry) > 2 else None
+            return
+
+        emitted = 0
+        pady1, pady2, padx1, padx2 = args.pads
+        # causal filters see each box once, without waiting for later ones
+        box_filter = causal_filter(args.smoothing, self.fps) if smooth and args.smoothing != "window" else None
+        if box_filter is not None:
+            smooth = False
+        T = 5 if smooth else 1
+
+        # frames are detected in batches, so keep them until their box is known
+        pending = deque()
+
+        def remember(images):
+            for image in images:
+                pending.append(image)
+                yield image
+
+        # boxes as detected are saved, so a later render can smooth them its own way
+        raw_boxes = []
+        boxes = []
+        all_landmarks = []
+
+        def emit():
+            nonlocal emitted
+            i = emitted
+            if smooth:
+                get_smoothened_box(boxes, i, T)
+            x1, y1, x2, y2 = boxes[i]
+            emitted += 1
+            return pending.popleft(), (y1, y2, x1, x2), all_landmarks[i]
+
+        for detection in self.face_rect(remember(images)):
+            image = pending[len(boxes) - emitted]
+            if detection is None:
+                faulty_frame = self.temp_path("faulty_frame.jpg")
+                cv2.imwrite(
+                    faulty_frame, image
+                )  # check this frame where the face was not detected.
+                raise ValueError(
+                    f"Face not detected! Ensure the video contains a face in all the frames. See {faulty_frame}"
+                )
 
-def datagen(frames, mels):
-    img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
-    print("\r" + " " * 100, end="\r")
-    if args.box[0] == -1:
-        if not args.static:
-            face_det_results = face_detect(frames)  # BGR2RGB for CNN face detection
+            rect, landmarks = detection
+            y1 = max(0, rect[1] - pady1)
+            y2 = min(image.shape[0], rect[3] + pady2)
+            x1 = max(0, rect[0] - padx1)
+            x2 = min(image.shape[1], rect[2] + padx2)
+            raw_boxes.append([x1, y1, x2, y2])
+
+            if box_filter is not None:
+                x1, y1, x2, y2 = box_filter([x1, y1, x2, y2])
+
+            boxes.append([x1, y1, x2, y2])
+            all_landmarks.append(landmarks)
+
+            # a smoothing window only looks ahead, so a box is final once the
+            # T - 1 boxes after it are known
+            while emitted + T <= len(boxes):
+                yield emit()
+
+        while emitted < len(boxes):
+            yield emit()
+
+        # Save results to file, renamed into place so concurrent sessions
+        # never read a half written file
+        os.makedirs(os.path.dirname(os.path.abspath(results_file)), exist_ok=True)
+        partial = self.temp_path(os.path.basename(results_file))
+        with open(partial, "wb") as f:
+            pickle.dump({"boxes": raw_boxes, "landmarks": all_landmarks}, f)
+        os.replace(partial, results_file)
+
+    def face_boxes(self, images):
+        args = self.args
+        if args.box[0] == -1:
+            yield from self.face_detect(images)
         else:
-            face_det_results = face_detect([frames[0]])
-    else:
-        print("Using the specified bounding box instead of face detection...")
-        y1, y2, x1, x2 = args.box
-        face_det_results = [[f[y1:y2, x1:x2], (y1, y2, x1, x2)] for f in frames]
-
-    for i, m in enumerate(mels):
-        idx = 0 if args.static else i % len(frames)
-        frame_to_save = frames[idx].copy()
-        face, coords = face_det_results[idx].copy()
-
-        face = cv2.resize(face, (args.img_size, args.img_size))
+            print("Using the specified bounding box instead of face detection...")
+            y1, y2, x1, x2 = args.box
+            for image in images:
+                yield image, (y1, y2, x1, x2), None
+
+    def datagen(self, detections, mels):
+        args = self.args
+        img_batch, mel_batch, frame_batch, coords_batch, landmarks_batch, source_batch = [], [], [], [], [], []
+        print("\r" + " " * 100, end="\r")
+
+        # the audio may outlast the video, in which case the frames loop
+        detections = iter(detections)
+        seen = []
+        exhausted = False
+
+        for i, m in enumerate(mels):
+            if not exhausted and i == len(seen):
+                try:
+                    seen.append(next(detections))
+                except StopIteration:
+                    exhausted = True
+            idx = i % len(seen)
+            frame, coords, landmarks = seen[idx]
+            frame_to_save = frame.copy()
+            y1, y2, x1, x2 = coords
+
+            face = cv2.resize(frame[y1:y2, x1:x2], (args.img_size, args.img_size))
+
+            img_batch.append(face)
+            mel_batch.append(m)
+            frame_batch.append(frame_to_save)
+            coords_batch.append(coords)
+            landmarks_batch.append(landmarks)
+            source_batch.append(idx)
+
+            if len(img_batch) >= args.wav2lip_batch_size:
+                img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
+
+                img_masked = img_batch.copy()
+                img_masked[:, args.img_size // 2 :] = 0
+
+                img_batch = np.concatenate((img_masked, img_batch), axis=3)
+                mel_batch = np.reshape(
+                    mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1]
+                )
 
-        img_batch.append(face)
-        mel_batch.append(m)
-        frame_batch.append(frame_to_save)
-        coords_batch.append(coords)
+                yield img_batch, mel_batch, frame_batch, coords_batch, landmarks_batch, source_batch
+                img_batch, mel_batch, frame_batch, coords_batch, landmarks_batch, source_batch = [], [], [], [], [], []
 
-        if len(img_batch) >= args.wav2lip_batch_size:
+        if len(img_batch) > 0:
             img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
 
             img_masked = img_batch.copy()
             img_masked[:, args.img_size // 2 :] = 0
 
-            img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.0
+            img_batch = np.concatenate((img_masked, img_batch), axis=3)
             mel_batch = np.reshape(
                 mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1]
             )
 
-            yield img_batch, mel_batch, frame_batch, coords_batch
-            img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+            yield img_batch, mel_batch, frame_batch, coords_batch, landmarks_batch, source_batch
 
-    if len(img_batch) > 0:
-        img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
-
-        img_masked = img_batch.copy()
-        img_masked[:, args.img_size // 2 :] = 0
-
-        img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.0
-        mel_batch = np.reshape(
-            mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1]
-        )
+    def read_frames(self, video_stream, max_frames):
+        args = self.args
+        if video_stream is None:
+            yield cv2.imread(args.face)
+            return
 
-        yield img_batch, mel_batch, frame_batch, coords_batch
-
-
-mel_step_size = 16
-
-def _load(checkpoint_path):
-    if device != "cpu":
-        checkpoint = torch.load(checkpoint_path)
-    else:
-        checkpoint = torch.load(
-            checkpoint_path, map_location=lambda storage, loc: storage
-        )
-    return checkpoint
-
-
-def main():
-    print("start of main")
-    args.img_size = 96
-    frame_number = 11
-
-    if os.path.isfile(args.face) and args.face.split(".")[1] in ["jpg", "png", "jpeg"]:
-        args.static = True
-
-    if not os.path.isfile(args.face):
-        raise ValueError("--face argument must be a valid path to video/image file")
-
-    elif args.face.split(".")[1] in ["jpg", "png", "jpeg"]:
-        full_frames = [cv2.imread(args.face)]
-        fps = args.fps
-
-    else:
         if args.fullres != 1:
             print("Resizing video...")
-        video_stream = cv2.VideoCapture(args.face)
-        fps = video_stream.get(cv2.CAP_PROP_FPS)
 
-        full_frames = []
-        while 1:
+        options = self.frame_options()
+        read = 0
+        while read < max_frames:
             still_reading, frame = video_stream.read()
             if not still_reading:
-                video_stream.release()
                 break
 
-            if args.fullres != 1:
-                aspect_ratio = frame.shape[1] / frame.shape[0]
-                frame = cv2.resize(
-                    frame, (int(args.out_height * aspect_ratio), args.out_height)
-                )
-
-            if args.rotate:
-                frame = cv2.rotate(frame, cv2.cv2.ROTATE_90_CLOCKWISE)
-
-            y1, y2, x1, x2 = args.crop
-            if x2 == -1:
-                x2 = frame.shape[1]
-            if y2 == -1:
-                y2 = frame.shape[0]
-
-            frame = frame[y1:y2, x1:x2]
-
-            full_frames.append(frame)
-
-    if not args.audio.endswith(".wav"):
-        print("Converting audio to .wav")
-        if not os.path.exists(Path(os.getcwd()) / "temp"):
-            os.makedirs(Path(os.getcwd()) / "temp")
-
-        subprocess.check_call(
-            [
-                "ffmpeg",
-                "-y",
-                "-loglevel",
-                "error",
-                "-i",
-                args.audio,
-                f"{os.getcwd()}/temp/temp.wav",
-            ] 
-        )
-        args.audio = "temp/temp.wav"
+            read += 1
+            yield prepare_frame(frame, **options)
+        video_stream.release()
+
+    def datagen_static(self, detections, mels):
+        """Batches for a still image.
+
+        The face is resized and half masked once and every full batch reuses
+        the same input array. No frames are copied, the outputs are built from
+        ``self.template`` instead.
+        """
+        args = self.args
+        frame, coords, landmarks = next(iter(detections))
+        y1, y2, x1, x2 = coords
+        face = cv2.resize(frame[y1:y2, x1:x2], (args.img_size, args.img_size))
+
+        if str(args.debug_mask) == "True":  # gray the output once instead of per frame
+            frame = cv2.cvtColor(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR)
+        self.template = frame
+
+        img_masked = face.copy()
+        img_masked[args.img_size // 2 :] = 0
+        face = np.concatenate((img_masked, face), axis=2)
+
+        batch_size = args.wav2lip_batch_size
+        img_batch = np.repeat(face[np.newaxis], batch_size, axis=0)
+        print("\r" + " " * 100, end="\r")
+        for start in range(0, len(mels), batch_size):
+            mel_batch = np.asarray(mels[start : start + batch_size])
+            n = len(mel_batch)
+            mel_batch = np.reshape(mel_batch, [n, mel_batch.shape[1], mel_batch.shape[2], 1])
+            yield (
+                img_batch if n == batch_size else img_batch[:n],
+                mel_batch,
+                [None] * n,
+                [coords] * n,
+                [landmarks] * n,
+                [0] * n,
+            )
 
-    print("analysing audio...")
-    wav = audio.load_wav(args.audio, 16000)
-    mel = audio.melspectrogram(wav)
+    def infer(self, batches):
+        """Predict the faces of every batch, skipping silent frames with ``--silence``.
+
+        Yields ``(face, frame, coords, landmarks, weight)`` per frame. With
+        ``--silence original`` the face of a silent frame is None and
+        ``weight`` is the share of the generated face on the crossfades. With
+        ``--silence closed`` the crossfade is already in the mels, and the
+        silent frames of a still image share one prediction. Every frame of a
+        video has its own face, so they are all predicted.
+        """
+        args = self.args
+        # only a still image can reuse its closed mouth, a video would need one per frame
+        reuse = args.silence == "closed" and self.max_frames == 1
+        closed = None
+        last_batch = last_tensor = None
+        i = 0
+        for img_batch, mel_batch, frames, coords, landmarks, sources in batches:
+            n = len(frames)
+            weights = [1.0] * n if self.weights is None else self.weights[i : i + n].tolist()
+            if args.silence == "closed" and not reuse:
+                weights = [1.0] * n
+            i += n
+            run, closing = [], False
+            for k, weight in enumerate(weights):
+                if weight > 0:
+                    run.append(k)
+                elif reuse and closed is None and not closing:
+                    run.append(k)
+                    closing = True
+            self.frames_skipped += n - len(run)
+
+            preds = [None] * n
+            if run:
+                if len(run) == n:
+                    faces, mels = img_batch, mel_batch
+                else:
+                    faces, mels = img_batch[run], mel_batch[run]
+                if faces is last_batch:  # a still image sends the same faces every time
+                    img_tensor = last_tensor
+                else:
+                    img_tensor = to_input(faces, self.models.device)
+                    last_batch, last_tensor = faces, img_tensor
+
+                with torch.inference_mode():
+                    pred = self.models.model(to_input(mels, self.models.device), img_tensor)
+
+                pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.0
+                for k, p in zip(run, pred):
+                    preds[k] = p
+                    if weights[k] == 0:
+                        closed = p
+            if reuse:
+                preds = [closed if p is None else p for p in preds]
+                weights = [1.0] * n
+
+            # hand frames on one at a time so they can be blended in parallel
+            yield from zip(preds, frames, coords, landmarks, weights)
+
+    def enhance(self, items):
+        """Restore the predicted faces with GFPGAN for Enhanced renders.
+
+        Faces are resized to their crops and restored ``--enhance_batch_size``
+        at a time, aligned with the landmarks found when detecting them.
+        """
+        args = self.args
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= args.enhance_batch_size:
+                yield from self._enhance_batch(batch)
+                batch = []
+        if batch:
+            yield from self._enhance_batch(batch)
+
+    def _enhance_batch(self, items):
+        crops, points = [], []
+        for p, f, c, landmarks, weight in items:
+            y1, y2, x1, x2 = c
+            crops.append(None if p is None else cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1)))
+            points.append(None if landmarks is None else landmarks - (x1, y1))
+        faces = enhance_faces(self.run_params, crops, points, self.args.enhance_batch_size)
+        for face, (p, f, c, landmarks, weight) in zip(faces, items):
+            yield face, f, c, landmarks, weight
+
+    def silence_weights(self, wav, starts, fps):
+        """Weight of the generated face in every frame with ``--silence``, else None.
+
+        Args:
+            wav (ndarray): Waveform of the audio.
+            starts (list[int]): First mel frame of every frame's mel chunk.
+            fps (float): Frame rate of the output.
+        """
+        args = self.args
+        if args.silence == "off" or len(starts) < 2:
+            return None
+        loudness = window_loudness(wav, starts, hp.hop_size, mel_step_size)
+        silent = silent_frames(loudness, args.silence_threshold, max(1, round(args.silence_min_duration * fps)))
+        print(f"{int(silent.sum())} of {len(silent)} frames are silent")
+        return fade_weights(silent, args.silence_fade)
+
+    def static_mask(self, p, c, landmarks):
+        """Region of the face crop a still image render changes, and its alpha.
+
+        Built from the first predicted face. Outside the mouth mask the
+        composite gives back the template, so only the mask's bounding box
+        needs blending. Returns None when the mask can change from frame to
+        frame, which is only the case for mouth tracking without landmarks.
+        """
+        args = self.args
+        y1, y2, x1, x2 = c
+        if args.quality not in ["Enhanced", "Enhanced-Lite", "Improved"]:
+            return (0, y2 - y1, 0, x2 - x1), None
+        if str(args.mouth_tracking) == "True" and landmarks is None:
+            return None
+
+        dst = self.template[y1:y2, x1:x2].copy()
+        try:
+            if str(args.mouth_tracking) == "True":
+                _, mask = self.create_tracked_mask(p, dst, landmarks)
+            else:
+                _, mask = self.create_mask(p, dst, landmarks)
+        except Exception as e:
+            print("Error in creating mask:", e)
+            mask = None
+        if mask is None:  # pasted without a mask, like blend_frame does
+            return (0, y2 - y1, 0, x2 - x1), None
+
+        mask = cv2.resize(mask, (x2 - x1, y2 - y1)) if mask.shape[:2] != dst.shape[:2] else mask
+        ys, xs = np.nonzero(mask)
+        if not len(ys):
+            return (0, 0, 0, 0), None
+        ry1, ry2, rx1, rx2 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+        return (ry1, ry2, rx1, rx2), prepare_alpha(mask[ry1:ry2, rx1:rx2])
+
+    def blend_static(self, p, f, c, landmarks=None, weight=1.0):
+        """Blend one predicted face of a still image render.
+
+        A face of None is a silent frame, which shows the template, and a
+        ``weight`` below 1 fades the face into it.
+
+        Returns:
+            tuple: ``(y, x, patch)``, the part of the template that changes in
+                this output frame and where it goes.
+        """
+        y1, y2, x1, x2 = c
+        if p is None:
+            return y1, x1, self.template[y1:y2, x1:x2]
+        y, x, patch = self._blend_static(p, c, landmarks)
+        if weight < 1:
+            original = self.template[y : y + patch.shape[0], x : x + patch.shape[1]]
+            patch = cv2.addWeighted(patch, weight, original, 1 - weight, 0)
+        return y, x, patch
+
+    def _blend_static(self, p, c, landmarks):
+        args = self.args
+        y1, y2, x1, x2 = c
+        if landmarks is not None:  # the mask is placed in crop coordinates
+            landmarks = landmarks - (x1, y1)
+
+        if args.quality == "Enhanced-Lite":
+            p = sharpen_mouth(p, (x2 - x1, y2 - y1), landmarks)
+        else:
+            p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
 
-    if np.isnan(mel.reshape(-1)).sum() > 0:
-        raise ValueError(
-            "Mel contains nan! Using a TTS voice? Add a small epsilon noise to the wav file and try again"
-        )
+        with self.static_lock:
+            if self.static_region is None:
+                self.static_region = (self.static_mask(p, c, landmarks),)
+            region = self.static_region[0]
+
+        if region is None:
+            cf = self.template[y1:y2, x1:x2].copy()
+            try:
+                p, last_mask = self.create_tracked_mask(p, cf, landmarks)
+            except Exception as e:
+                print("Error in creating mask:", e)
+            return y1, x1, p
+
+        (ry1, ry2, rx1, rx2), alpha = region
+        if alpha is None:
+            return y1 + ry1, x1 + rx1, p[ry1:ry2, rx1:rx2]
+        dst = self.template[y1 + ry1 : y1 + ry2, x1 + rx1 : x1 + rx2]
+        return y1 + ry1, x1 + rx1, compositor.composite(p[ry1:ry2, rx1:rx2], dst, alpha)
+
+    def blend_frame(self, p, f, c, landmarks=None, weight=1.0):
+        args = self.args
+        y1, y2, x1, x2 = c
+        if landmarks is not None:  # the mask is placed in crop coordinates
+            landmarks = landmarks - (x1, y1)
+
+        if (
+            str(args.debug_mask) == "True"
+        ):  # makes the background black & white so you can see the mask better
+            f = cv2.cvtColor(f, cv2.COLOR_BGR2GRAY)
+            f = cv2.cvtColor(f, cv2.COLOR_GRAY2BGR)
+
+        if p is None:  # silent, the original face shows
+            return f
+
+        if args.quality == "Enhanced-Lite":
+            p = sharpen_mouth(p, (x2 - x1, y2 - y1), landmarks)
+        else:
+            p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
+        cf = f[y1:y2, x1:x2]
+        original = cf.copy() if weight < 1 else None
+
+        if args.quality in ["Enhanced", "Enhanced-Lite", "Improved"]:
+            try:
+                if str(args.mouth_tracking) == "True":
+                    p, last_mask = self.create_tracked_mask(p, cf, landmarks)
+                else:
+                    p, last_mask = self.create_mask(p, cf, landmarks)
+            except Exception as e:
+                print("Error in creating mask:", e)
+                pass
+
+        if p is not cf:  # masks are blended straight into the frame
+            f[y1:y2, x1:x2] = p
+        if original is not None:  # fading into or out of silence
+            f[y1:y2, x1:x2] = cv2.addWeighted(f[y1:y2, x1:x2], weight, original, 1 - weight, 0)
+        return f
 
-    mel_chunks = []
-
-    mel_idx_multiplier = 80.0 / fps
-    i = 0
-    while 1:
-        start_idx = int(i * mel_idx_multiplier)
-        if start_idx + mel_step_size > len(mel[0]):
-            mel_chunks.append(mel[:, len(mel[0]) - mel_step_size :])
-            break
-        mel_chunks.append(mel[:, start_idx : start_idx + mel_step_size])
-        i += 1
-
-    full_frames = full_frames[: len(mel_chunks)]
-    if str(args.preview_settings) == "True":
-        full_frames = [full_frames[0]]
-        mel_chunks = [mel_chunks[0]]
-    print(str(len(full_frames)) + " frames to process")
-    batch_size = args.wav2lip_batch_size
-    if str(args.preview_settings) == "True":
-        gen = datagen(full_frames, mel_chunks)
-    else:
-        gen = datagen(full_frames.copy(), mel_chunks)
-
-    for i, (img_batch, mel_batch, frames, coords) in enumerate(
-        tqdm(
-            gen,
-            total=int(np.ceil(float(len(mel_chunks)) / batch_size)),
-            desc="Processing Wav2Lip",
-            ncols=100,
-        )
-    ):
-        if i == 0:
-            if not args.quality == "Fast":
-                print(
-                    f"mask size: {args.mask_dilation}, feathering: {args.mask_feathering}"
-                )
-                if not args.quality == "Improved":
-                    print("Loading", args.sr_model)
-                    run_params = load_sr()
+    def run(self):
+        """Render ``args.outfile``, the temporary directory is kept if it fails."""
+        self.render()
+        if self.own_temp_dir:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
 
-            print("Starting...")
-            frame_h, frame_w = full_frames[0].shape[:-1]
-            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-            out = cv2.VideoWriter("temp/result.mp4", fourcc, fps, (frame_w, frame_h))
+    def render(self):
+        args = self.args
+        print("start of main")
+        args.img_size = 96
 
-        img_batch = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))).to(device)
-        mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(device)
+        if os.path.isfile(args.face) and args.face.split(".")[1] in ["jpg", "png", "jpeg"]:
+            args.static = True
 
-        with torch.no_grad():
-            pred = model(mel_batch, img_batch)
+        if not os.path.isfile(args.face):
+            raise ValueError("--face argument must be a valid path to video/image file")
 
-        pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.0
+        elif args.face.split(".")[1] in ["jpg", "png", "jpeg"]:
+            video_stream = None
+            fps = args.fps
 
-        for p, f, c in zip(pred, frames, coords):
-            # cv2.imwrite('temp/f.jpg', f)
+        else:
+            video_stream = cv2.VideoCapture(args.face)
+            fps = video_stream.get(cv2.CAP_PROP_FPS)
+
+        if not args.audio.endswith(".wav"):
+            print("Converting audio to .wav")
+            wav_path = self.temp_path("temp.wav")
+
+            subprocess.check_call(
+                [
+                    "ffmpeg",
+                    "-y",
+                    "-loglevel",
+                    "error",
+                    "-i",
+                    args.audio,
+                    wav_path,
+                ]
+            )
+            args.audio = wav_path
 
-            y1, y2, x1, x2 = c
+        print("analysing audio...")
+        wav = audio.load_wav(args.audio, 16000)
+        mel = audio.melspectrogram(wav)
 
-            if (
-                str(args.debug_mask) == "True"
-            ):  # makes the background black & white so you can see the mask better
-                f = cv2.cvtColor(f, cv2.COLOR_BGR2GRAY)
-                f = cv2.cvtColor(f, cv2.COLOR_GRAY2BGR)
+        if np.isnan(mel.reshape(-1)).sum() > 0:
+            raise ValueError(
+                "Mel contains nan! Using a TTS voice? Add a small epsilon noise to the wav file and try again"
+            )
 
-            p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
-            cf = f[y1:y2, x1:x2]
+        mel_chunks = []
+        mel_starts = []
 
+        mel_idx_multiplier = 80.0 / fps
+        i = 0
+        while 1:
+            start_idx = int(i * mel_idx_multiplier)
+            if start_idx + mel_step_size > len(mel[0]):
+                mel_starts.append(len(mel[0]) - mel_step_size)
+                mel_chunks.append(mel[:, len(mel[0]) - mel_step_size :])
+                break
+            mel_starts.append(start_idx)
+            mel_chunks.append(mel[:, start_idx : start_idx + mel_step_size])
+            i += 1
+
+        max_frames = len(mel_chunks)
+        if str(args.preview_settings) == "True" or args.static:
+            max_frames = 1
+        if str(args.preview_settings) == "True":
+            mel_chunks = [mel_chunks[0]]
+        print(str(len(mel_chunks)) + " frames to process")
+        self.max_frames = max_frames
+        self.fps = fps
+
+        self.weights = self.silence_weights(wav, mel_starts[: len(mel_chunks)], fps)
+        if self.weights is not None and args.silence == "closed":
+            # the mouth closes with the audio: the mels fade to those of silence
+            silence = np.full_like(mel_chunks[0], -hp.max_abs_value)
+            mel_chunks = [m if w == 1 else w * m + (1 - w) * silence for m, w in zip(mel_chunks, self.weights)]
+
+        if not args.quality == "Fast":
+            print(
+                f"mask size: {args.mask_dilation}, feathering: {args.mask_feathering}"
+            )
+            if args.quality not in ["Improved", "Enhanced-Lite"]:
+                self.run_params = self.models.sr
+
+        print("Starting...")
+        out = None
+        result_path = self.temp_path("result.mp4")
+        progress = tqdm(total=len(mel_chunks), desc="Processing Wav2Lip", ncols=100)
+
+        def write(f):
+            nonlocal out
+            if out is None:
+                frame_h, frame_w = f.shape[:-1]
+                fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+                out = cv2.VideoWriter(result_path, fourcc, fps, (frame_w, frame_h))
+            out.write(f)
+            progress.update()
+
+        buffer = None
+
+        def write_static(item):
+            # every output is the template with only the changed region replaced
+            nonlocal buffer
+            y, x, patch = item
+            if buffer is None:
+                buffer = self.template.copy()
+            buffer[y : y + patch.shape[0], x : x + patch.shape[1]] = patch
+            write(buffer)
+
+        # decode -> detect -> batch -> infer -> blend -> write, each on its own thread
+        pipeline = Pipeline(queue_size=args.queue_size)
+        pipeline.add_stage("decode", lambda: self.read_frames(video_stream, max_frames))
+        pipeline.add_stage("detect", self.face_boxes, stream=True)
+        if args.static:
+            pipeline.add_stage("batch", lambda detections: self.datagen_static(detections, mel_chunks), stream=True)
+            pipeline.add_stage("infer", self.infer, stream=True)
+            if args.quality == "Enhanced":
+                pipeline.add_stage("enhance", self.enhance, stream=True)
+            pipeline.add_stage("blend", lambda item: self.blend_static(*item), workers=args.blend_workers)
+            pipeline.add_stage("write", write_static)
+        else:
+            pipeline.add_stage("batch", lambda detections: self.datagen(detections, mel_chunks), stream=True)
+            pipeline.add_stage("infer", self.infer, stream=True)
             if args.quality == "Enhanced":
-                p = upscale(p, run_params)
+                pipeline.add_stage("enhance", self.enhance, stream=True)
+            pipeline.add_stage("blend", lambda item: self.blend_frame(*item), workers=args.blend_workers)
+            pipeline.add_stage("write", write)
+        try:
+            pipeline.run()
+        finally:
+            progress.close()
+            if out is not None:
+                out.release()
+        # Close the window(s) when done
+        cv2.destroyAllWindows()
+
+        print(pipeline.report())
+        if self.weights is not None:
+            print(f"{self.frames_skipped} of {len(mel_chunks)} frames skipped Wav2Lip")
+
+        print("converting to final video")
+
+        subprocess.check_call([
+            "ffmpeg",
+            "-y",
+            "-loglevel",
+            "error",
+            "-i",
+            result_path,
+            "-i",
+            args.audio,
+            "-c:v",
+            "libx264",
+            args.outfile
+        ])
+
+
+def select_render_device(args):
+    """Device a render with ``args`` runs on, see :func:`select_device`.
+
+    Raises:
+        ValueError: When the device is not available or does not run
+            ``args.precision``.
+    """
+    if args.precision == "int8":
+        if args.device not in ("auto", "cpu"):
+            raise ValueError("--precision int8 only runs on the CPU")
+        return "cpu"
+    return select_device(args.device)
+
+
+def configure_registry(memory_budget=0, idle_seconds=0):
+    """Apply ``--memory_budget`` (MB) and ``--idle_seconds`` to :data:`registry`.
+
+    Idle models are dropped by a background thread, so a process waiting for
+    its next render frees them too.
+    """
+    registry.memory_budget = memory_budget * 2**20
+    registry.idle_seconds = idle_seconds
+    if idle_seconds > 0:
+        registry.start_evicting(max(1.0, idle_seconds / 4))
+    else:
+        registry.stop_evicting()
+    registry.evict()
 
-            if args.quality in ["Enhanced", "Improved"]:
-                try:
-                    if str(args.mouth_tracking) == "True":
-                        p, last_mask = create_tracked_mask(p, cf)
-                    else:
-                        p, last_mask = create_mask(p, cf)
-                except Exception as e:
-                    print("Error in creating mask:", e)
-                    pass
 
-            f[y1:y2, x1:x2] = p
+def render(args):
+    """Render with the parsed arguments ``args`` on the models of this process.
+
+    The models stay loaded in :data:`registry` afterwards, so later renders of
+    the same process start with them warm.
+
+    Raises:
+        ValueError: When the device is not available or does not run
+            ``args.precision``.
+    """
+    render_device = select_render_device(args)
+    if render_device == "cpu":
+        threads, interop_threads = configure_cpu(args.cpu_threads, args.interop_threads)
+        print(f"Rendering on the CPU with {threads} threads, {interop_threads} inter-op")
+    configure_registry(args.memory_budget, args.idle_seconds)
+    models = load_models(args.checkpoint_path, render_device, args.precision, args.backend)
+    # load while the session reads the audio and the first frames
+    models.preload(args.quality)
+    InferenceSession(args, models).run()
+    print(registry.report())
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    try:
+        select_render_device(args)
+    except ValueError as e:
+        parser.error(str(e))
+    render(args)
 
-            # Display the frame
-            # if preview_window == "Face":
-            #     cv2.imshow("face preview - press Q to abort", p)
-            # elif preview_window == "Full":
-            #     cv2.imshow("full preview - press Q to abort", f)
-            # elif preview_window == "Both":
-            #     cv2.imshow("face preview - press Q to abort", p)
-            #     cv2.imshow("full preview - press Q to abort", f)
-
-            #     key = cv2.waitKey(1) & 0xFF
-            #     if key == ord('q'):
-            #         exit()  # Exit the loop when 'Q' is pressed
-
-            # if str(args.preview_settings) == "True":
-            #     cv2.imwrite("temp/preview.jpg", f)
-            #     if not g_colab:
-            #         cv2.imshow("preview - press Q to close", f)
-            #         if cv2.waitKey(-1) & 0xFF == ord('q'):
-            #             exit()  # Exit the loop when 'Q' is pressed
-
-            # else:
-            #     out.write(f)
-            out.write(f)
-    # Close the window(s) when done
-    cv2.destroyAllWindows()
-
-    out.release()
-
-    print("converting to final video")
-
-    subprocess.check_call([
-        "ffmpeg",
-        "-y",
-        "-loglevel",
-        "error",
-        "-i",
-        "temp/result.mp4",
-        "-i",
-        args.audio,
-        "-c:v",
-        "libx264",
-        args.outfile
-    ])
 
 if __name__ == "__main__":
-    args = parser.parse_args()
-    do_load(args.checkpoint_path)
     main()
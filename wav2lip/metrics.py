@@ -0,0 +1,156 @@
+import cv2
+import numpy as np
+
+
+def psnr(reference, image, peak=255.0):
+    """Peak signal-to-noise ratio in dB of ``image`` against ``reference``.
+
+    Args:
+        reference (ndarray): Reference image or stack of images.
+        image (ndarray): Image of the same shape.
+        peak (float): Largest possible pixel value. Default: 255.
+
+    Returns:
+        float: PSNR, inf for identical images.
+    """
+    mse = np.mean((np.asarray(reference, np.float64) - np.asarray(image, np.float64)) ** 2)
+    return float("inf") if mse == 0 else float(10 * np.log10(peak**2 / mse))
+
+
+def ssim(reference, image, peak=255.0):
+    """Mean structural similarity of two images, with the usual 11x11 Gaussian window.
+
+    Color images are compared per channel and averaged.
+
+    Args:
+        reference (ndarray): Reference image, (h, w) or (h, w, c).
+        image (ndarray): Image of the same shape.
+        peak (float): Largest possible pixel value. Default: 255.
+
+    Returns:
+        float: SSIM in [-1, 1], 1 for identical images.
+    """
+    a = np.asarray(reference, np.float64)
+    b = np.asarray(image, np.float64)
+    c1, c2 = (0.01 * peak) ** 2, (0.03 * peak) ** 2
+
+    def blur(x):
+        return cv2.GaussianBlur(x, (11, 11), 1.5)
+
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a**2
+    var_b = blur(b * b) - mu_b**2
+    cov = blur(a * b) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a**2 + mu_b**2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+
+def image_metrics(reference, images):
+    """PSNR, SSIM and pixel differences of ``images`` against ``reference``.
+
+    Args:
+        reference (ndarray): Reference images, (n, h, w, c) in [0, 255].
+        images (ndarray): Images of the same shape.
+
+    Returns:
+        dict: Overall PSNR, mean and minimum SSIM over the images, and the
+            mean and largest absolute pixel difference.
+    """
+    reference = np.asarray(reference, np.float64)
+    images = np.asarray(images, np.float64)
+    ssims = [ssim(a, b) for a, b in zip(reference, images)]
+    diff = np.abs(reference - images)
+    return {
+        "psnr": round(psnr(reference, images), 2),
+        "ssim": round(float(np.mean(ssims)), 4),
+        "min_ssim": round(float(np.min(ssims)), 4),
+        "mean_abs_diff": round(float(diff.mean()), 3),
+        "max_abs_diff": round(float(diff.max()), 1),
+    }
+
+
+def _sync_embeddings(syncnet, faces, mels):
+    """Audio and face embeddings of every window of 5 consecutive faces, see :func:`sync_scores`."""
+    import torch
+
+    faces = np.asarray(faces, np.float32)
+    n = len(faces) - 4
+    if n <= 0:
+        return torch.zeros(0, 512), torch.zeros(0, 512)
+    # lower halves of 5 faces stacked on the channels, as SyncNet takes them
+    halves = faces[:, faces.shape[1] // 2 :]
+    windows = np.concatenate([halves[i : i + n] for i in range(5)], axis=3)
+    face_input = torch.from_numpy(np.ascontiguousarray(windows.transpose(0, 3, 1, 2)))
+    mel_input = torch.from_numpy(np.asarray(mels[:n], np.float32)[:, None])
+    with torch.inference_mode():
+        return syncnet(mel_input, face_input)
+
+
+def sync_scores(syncnet, faces, mels):
+    """Audio-visual sync of generated faces, as rated by SyncNet.
+
+    Every window of 5 consecutive faces is compared with the mel window of its
+    first frame, which covers the same 0.2s, like the expert sync loss Wav2Lip
+    was trained with.
+
+    Args:
+        syncnet (SyncNet_color): SyncNet in eval mode, on the CPU.
+        faces (ndarray): Consecutive generated faces, (n, 96, 96, 3) BGR in
+            [0, 1].
+        mels (ndarray): Mel window of every face, (n, 80, 16).
+
+    Returns:
+        ndarray: Cosine similarity of the audio and face embeddings of every
+            window, higher is better in sync.
+    """
+    import torch
+
+    audio_embedding, face_embedding = _sync_embeddings(syncnet, faces, mels)
+    if not len(face_embedding):
+        return np.zeros(0)
+    return torch.nn.functional.cosine_similarity(audio_embedding, face_embedding).numpy()
+
+
+def sync_offset(syncnet, faces, mels, max_offset=15):
+    """Audio-visual offset and sync confidence, as SyncNet evaluations report them.
+
+    The face embeddings are compared with the audio embeddings shifted by
+    every offset up to ``max_offset`` frames. The offset is the shift with
+    the smallest mean distance, and the confidence is how much smaller that
+    distance is than the median over all shifts. In sync, the offset is 0
+    and the confidence high.
+
+    Args:
+        syncnet (SyncNet_color): SyncNet in eval mode, on the CPU.
+        faces (ndarray): See :func:`sync_scores`.
+        mels (ndarray): See :func:`sync_scores`.
+        max_offset (int): Largest shift in frames either way. Default: 15.
+
+    Returns:
+        tuple: ``(offset, confidence)``, offset in frames, positive when
+            the audio comes first; ``(0, 0.0)`` for fewer than 5 faces.
+    """
+    audio_embedding, face_embedding = _sync_embeddings(syncnet, faces, mels)
+    n = len(face_embedding)
+    if not n:
+        return 0, 0.0
+    distance = (face_embedding[:, None] - audio_embedding[None]).norm(dim=2).numpy()
+    offsets = np.arange(-min(max_offset, n - 1), min(max_offset, n - 1) + 1)
+    # mean distance of face i to audio i + offset, over the frames both have
+    mean = np.array([np.diagonal(distance, offset).mean() for offset in offsets])
+    # of equally close shifts the smallest one
+    best = min(range(len(offsets)), key=lambda i: (mean[i], abs(offsets[i])))
+    return int(-offsets[best]), float(np.median(mean) - mean[best])
+
+
+def load_syncnet(path):
+    """SyncNet_color from a checkpoint like ``lipsync_expert.pth``, on the CPU."""
+    import torch
+
+    from wav2lip.models import SyncNet_color
+
+    checkpoint = torch.load(path, map_location="cpu", weights_only=True)
+    state_dict = checkpoint.get("state_dict", checkpoint)
+    syncnet = SyncNet_color()
+    syncnet.load_state_dict({k.replace("module.", ""): v for k, v in state_dict.items()})
+    return syncnet.eval()
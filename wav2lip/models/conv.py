@@ -1,6 +1,7 @@
 import torch
 from torch import nn
 from torch.nn import functional as F
+from torch.nn.utils.fusion import fuse_conv_bn_eval
 
 class Conv2d(nn.Module):
     def __init__(self, cin, cout, kernel_size, stride, padding, residual=False, *args, **kwargs):
@@ -42,3 +43,18 @@ class Conv2dTranspose(nn.Module):
     def forward(self, x):
         out = self.conv_block(x)
         return self.act(out)
+
+def fuse_conv_bn(model):
+    """Fold the BatchNorm of every Conv2d and Conv2dTranspose block of ``model``
+    into its convolution, in place.
+
+    Only valid for inference: the folded convolution uses the running
+    statistics, so the model has to stay in eval mode.
+    """
+    for module in model.modules():
+        if not isinstance(module, (Conv2d, Conv2dTranspose)) or len(module.conv_block) != 2:
+            continue
+        conv, bn = module.conv_block
+        fused = fuse_conv_bn_eval(conv.eval(), bn.eval(), transpose=isinstance(conv, nn.ConvTranspose2d))
+        module.conv_block = nn.Sequential(fused)
+    return model
@@ -0,0 +1,263 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# marks the end of a stream between two stages
+_DONE = object()
+
+
+def ordered_map(fn, items, workers, window=None):
+    """Map ``fn`` over ``items`` on a thread pool, yielding results in input order.
+
+    Args:
+        fn (callable): Function applied to every item.
+        items (iterable): Input items, consumed lazily.
+        workers (int): Number of pool threads.
+        window (int, optional): Maximum number of items in flight. Default:
+            twice the number of workers.
+
+    Yields:
+        The results of ``fn``, in the order of ``items``.
+    """
+    window = window or 2 * workers
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        try:
+            for item in items:
+                in_flight.append(pool.submit(fn, item))
+                if len(in_flight) >= window:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+
+class StageMetrics:
+    """Counters collected by one pipeline stage while it runs."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.wait_in = 0.0
+        self.wait_out = 0.0
+        self.depth_total = 0
+        self.depth_samples = 0
+        self.depth_max = 0
+        self.started = None
+        self.finished = None
+
+    def sample_depth(self, depth):
+        self.depth_total += depth
+        self.depth_samples += 1
+        self.depth_max = max(self.depth_max, depth)
+
+    @property
+    def mean_depth(self):
+        if not self.depth_samples:
+            return 0.0
+        return self.depth_total / self.depth_samples
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def utilisation(self):
+        if not self.elapsed:
+            return 0.0
+        return self.busy / self.elapsed
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "busy_s": round(self.busy, 3),
+            "wait_in_s": round(self.wait_in, 3),
+            "wait_out_s": round(self.wait_out, 3),
+            "utilisation": round(self.utilisation, 3),
+            "queue_mean": round(self.mean_depth, 2),
+            "queue_max": self.depth_max,
+        }
+
+
+class Stage:
+    """One worker of a :class:`Pipeline`.
+
+    Args:
+        name (str): Name shown in the metrics report.
+        fn (callable): With ``stream=False`` it is called once per input item and
+            its return value is passed downstream. With ``stream=True`` it is
+            called once with an iterator over all input items and every value it
+            yields is passed downstream, which lets a stage batch, buffer or
+            expand items. The first stage of a pipeline is always a stream stage
+            and receives no input.
+        stream (bool): See ``fn``. Default: False.
+        workers (int): Number of threads calling ``fn`` when ``stream=False``.
+            Results still leave the stage in input order. Default: 1.
+    """
+
+    def __init__(self, name, fn, stream=False, workers=1):
+        self.name = name
+        self.fn = fn
+        self.stream = stream
+        self.workers = max(1, int(workers))
+        self.metrics = StageMetrics(name)
+
+
+class Pipeline:
+    """Runs stages on their own threads connected by bounded queues.
+
+    cv2, torch and ffmpeg release the GIL while they work, so stages that wrap
+    them overlap instead of waiting for each other. The queue in front of a
+    stage fills up when that stage is the bottleneck, which is what the
+    per-stage queue depth in :meth:`report` shows.
+
+    Args:
+        queue_size (int): Maximum number of items waiting between two stages.
+            Default: 8.
+    """
+
+    def __init__(self, queue_size=8):
+        self.queue_size = max(1, int(queue_size))
+        self.stages = []
+        self._stop = threading.Event()
+        self._error = None
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, fn, stream=False, workers=1):
+        if not self.stages:
+            stream = True
+        self.stages.append(Stage(name, fn, stream, workers))
+        return self
+
+    def run(self):
+        """Run every stage to completion and re-raise the first stage error."""
+        if not self.stages:
+            return
+        queues = [queue.Queue(self.queue_size) for _ in self.stages[1:]]
+        threads = []
+        for i, stage in enumerate(self.stages):
+            inq = queues[i - 1] if i > 0 else None
+            outq = queues[i] if i < len(queues) else None
+            thread = threading.Thread(
+                target=self._work, args=(stage, inq, outq), name=f"pipeline-{stage.name}", daemon=True
+            )
+            threads.append(thread)
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.1)
+        except BaseException as e:
+            self._fail(e)
+            raise
+        if self._error is not None:
+            raise self._error
+
+    def metrics(self):
+        return [stage.metrics.as_dict() for stage in self.stages]
+
+    def report(self):
+        """Return a table of the per-stage metrics, bottleneck first."""
+        rows = sorted(self.metrics(), key=lambda m: m["utilisation"], reverse=True)
+        header = f"{'stage':<10}{'items':>8}{'busy s':>10}{'util':>8}{'queue avg':>11}{'queue max':>11}"
+        lines = [header]
+        for m in rows:
+            lines.append(
+                f"{m['stage']:<10}{m['items']:>8}{m['busy_s']:>10.2f}{m['utilisation']:>8.0%}"
+                f"{m['queue_mean']:>11.2f}{m['queue_max']:>11}"
+            )
+        return "\n".join(lines)
+
+    def _fail(self, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    def _get(self, inq, metrics):
+        while True:
+            if self._stop.is_set():
+                raise _Cancelled()
+            metrics.sample_depth(inq.qsize())
+            start = time.perf_counter()
+            try:
+                item = inq.get(timeout=0.1)
+            except queue.Empty:
+                metrics.wait_in += time.perf_counter() - start
+                continue
+            metrics.wait_in += time.perf_counter() - start
+            return item
+
+    def _put(self, outq, item, metrics):
+        if outq is None:
+            return
+        start = time.perf_counter()
+        while True:
+            if self._stop.is_set():
+                raise _Cancelled()
+            try:
+                outq.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        metrics.wait_out += time.perf_counter() - start
+
+    def _inputs(self, inq, metrics):
+        while True:
+            item = self._get(inq, metrics)
+            if item is _DONE:
+                return
+            yield item
+
+    def _work(self, stage, inq, outq):
+        metrics = stage.metrics
+        metrics.started = time.perf_counter()
+        try:
+            if stage.stream:
+                outputs = stage.fn(self._inputs(inq, metrics)) if inq is not None else stage.fn()
+                for item in outputs or ():
+                    metrics.items += 1
+                    self._put(outq, item, metrics)
+            elif stage.workers > 1:
+                lock = threading.Lock()
+
+                def timed(item):
+                    start = time.perf_counter()
+                    try:
+                        return stage.fn(item)
+                    finally:
+                        with lock:
+                            metrics.busy += time.perf_counter() - start
+
+                for item in ordered_map(timed, self._inputs(inq, metrics), stage.workers):
+                    metrics.items += 1
+                    self._put(outq, item, metrics)
+            else:
+                for item in self._inputs(inq, metrics):
+                    item = stage.fn(item)
+                    metrics.items += 1
+                    self._put(outq, item, metrics)
+            self._put(outq, _DONE, metrics)
+        except _Cancelled:
+            pass
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            metrics.finished = time.perf_counter()
+            if stage.workers > 1 and not stage.stream:
+                # busy time was summed over the pool, report it per worker
+                metrics.busy /= stage.workers
+            else:
+                metrics.busy = max(0.0, metrics.elapsed - metrics.wait_in - metrics.wait_out)
+
+
+class _Cancelled(Exception):
+    pass
@@ -0,0 +1,437 @@
+"""INT8 static quantization of Wav2Lip for CPU inference.
+
+Run ``python -m wav2lip.quantize --checkpoint_path <.pth> --face <video>
+--audio <audio>`` to calibrate on face crops and mel windows of a sample
+render. The INT8 model is compared with FP32 on the frames after the
+calibration frames, and saved as ``<checkpoint>.int8.pt`` next to the
+checkpoint only when it passes the accuracy gate. Renders use it with
+``--precision int8``.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import time
+import warnings
+
+import cv2
+import numpy as np
+import torch
+from torch import nn
+from torch.ao.nn.intrinsic import ConvReLU2d
+from torch.ao.nn.quantized import FloatFunctional
+from torch.ao.quantization import (
+    DeQuantStub,
+    QConfig,
+    QuantStub,
+    convert,
+    default_weight_observer,
+    get_default_qconfig,
+    prepare,
+)
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+from wav2lip.models.conv import Conv2d, Conv2dTranspose
+
+QUANTIZED_VERSION = 1
+
+
+def _fused_conv(block):
+    if len(block.conv_block) == 1:  # already folded by fuse_conv_bn
+        return copy.deepcopy(block.conv_block[0])
+    conv, bn = block.conv_block
+    return fuse_conv_bn_eval(conv.eval(), bn.eval(), transpose=isinstance(conv, nn.ConvTranspose2d))
+
+
+class QuantizableConv2d(nn.Module):
+    """:class:`Conv2d` with BatchNorm folded and the ReLU fused.
+
+    The residual add goes through a ``FloatFunctional`` so that it becomes a
+    quantized add+ReLU instead of a float add between two dequantizations.
+    """
+
+    def __init__(self, block):
+        super().__init__()
+        self.residual = block.residual
+        if self.residual:
+            self.conv = _fused_conv(block)
+            self.add_relu = FloatFunctional()
+        else:
+            self.conv = ConvReLU2d(_fused_conv(block), nn.ReLU())
+
+    def forward(self, x):
+        if self.residual:
+            return self.add_relu.add_relu(self.conv(x), x)
+        return self.conv(x)
+
+
+class QuantizableConv2dTranspose(nn.Module):
+    """:class:`Conv2dTranspose` with BatchNorm folded; the ReLU stays separate
+    as there is no fused quantized transposed convolution."""
+
+    def __init__(self, block):
+        super().__init__()
+        self.conv = _fused_conv(block)
+        self.act = nn.ReLU()
+
+    def forward(self, x):
+        return self.act(self.conv(x))
+
+
+def _swap_blocks(module):
+    for name, child in module.named_children():
+        if isinstance(child, Conv2d):
+            setattr(module, name, QuantizableConv2d(child))
+        elif isinstance(child, Conv2dTranspose):
+            setattr(module, name, QuantizableConv2dTranspose(child))
+        else:
+            _swap_blocks(child)
+
+
+class QuantizableWav2Lip(nn.Module):
+    """Wav2Lip restructured for eager mode quantization.
+
+    Both inputs are quantized on entry and the skip connections are
+    concatenated through ``FloatFunctional`` so they are requantized to one
+    scale. Only the sigmoid at the very end runs in float.
+
+    Args:
+        model (Wav2Lip): Float model in eval mode, copied.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        model = copy.deepcopy(model)
+        _swap_blocks(model)
+        self.audio_encoder = model.audio_encoder
+        self.face_encoder_blocks = model.face_encoder_blocks
+        self.face_decoder_blocks = model.face_decoder_blocks
+        # output_block is Conv2d, nn.Conv2d, Sigmoid
+        self.output_conv = model.output_block[:2]
+        self.quant_audio = QuantStub()
+        self.quant_face = QuantStub()
+        self.dequant = DeQuantStub()
+        self.cats = nn.ModuleList(FloatFunctional() for _ in self.face_decoder_blocks)
+
+    def forward(self, audio_sequences, face_sequences):
+        B = audio_sequences.size(0)
+
+        input_dim_size = len(face_sequences.size())
+        if input_dim_size > 4:
+            audio_sequences = torch.cat([audio_sequences[:, i] for i in range(audio_sequences.size(1))], dim=0)
+            face_sequences = torch.cat([face_sequences[:, :, i] for i in range(face_sequences.size(2))], dim=0)
+
+        audio_embedding = self.audio_encoder(self.quant_audio(audio_sequences))
+
+        feats = []
+        x = self.quant_face(face_sequences)
+        for f in self.face_encoder_blocks:
+            x = f(x)
+            feats.append(x)
+
+        x = audio_embedding
+        for f, cat in zip(self.face_decoder_blocks, self.cats):
+            x = cat.cat([f(x), feats.pop()], dim=1)
+
+        x = torch.sigmoid(self.dequant(self.output_conv(x)))
+
+        if input_dim_size > 4:
+            x = torch.split(x, B, dim=0)
+            return torch.stack(x, dim=2)
+        return x
+
+
+def default_engine():
+    """Quantized kernel library for this machine, fbgemm/x86 or qnnpack on ARM."""
+    return "qnnpack" if platform.machine().lower() in ("arm64", "aarch64") else "x86"
+
+
+def _prepare(model, engine):
+    torch.backends.quantized.engine = engine
+    qmodel = QuantizableWav2Lip(model).eval()
+    qmodel.qconfig = get_default_qconfig(engine)
+    # quantized transposed convolutions only take per-tensor weights
+    per_tensor = QConfig(activation=qmodel.qconfig.activation, weight=default_weight_observer)
+    for module in qmodel.modules():
+        if isinstance(module, nn.ConvTranspose2d):
+            module.qconfig = per_tensor
+    return prepare(qmodel)
+
+
+def quantize_static(model, batches, engine=None):
+    """INT8 copy of ``model`` calibrated on ``batches``.
+
+    Args:
+        model (Wav2Lip): Float model on the CPU, in eval mode.
+        batches (iterable): ``(mel_batch, face_batch)`` tensors as inference
+            feeds the model.
+        engine (str, optional): Quantized engine. Default:
+            :func:`default_engine`.
+
+    Returns:
+        QuantizableWav2Lip: The converted INT8 model.
+    """
+    engine = engine or default_engine()
+    qmodel = _prepare(model, engine)
+    with torch.no_grad():
+        for mel_batch, face_batch in batches:
+            qmodel(mel_batch, face_batch)
+    return convert(qmodel)
+
+
+def quantized_path(checkpoint_path):
+    return os.path.splitext(checkpoint_path)[0] + ".int8.pt"
+
+
+def save_quantized(qmodel, path, checkpoint_path):
+    partial = path + ".partial"
+    torch.save(
+        {
+            "version": QUANTIZED_VERSION,
+            "engine": torch.backends.quantized.engine,
+            "checkpoint_size": os.path.getsize(checkpoint_path),
+            "state_dict": qmodel.state_dict(),
+        },
+        partial,
+    )
+    os.replace(partial, path)
+
+
+def load_quantized(checkpoint_path):
+    """Load the INT8 model saved for ``checkpoint_path`` by this module's CLI.
+
+    It is read from :func:`quantized_path`, the only place the CLI saves it.
+
+    Raises:
+        FileNotFoundError: When there is no INT8 model for the checkpoint.
+        ValueError: When it was made from a different checkpoint.
+    """
+    from wav2lip.easy_functions import load_model
+
+    path = quantized_path(checkpoint_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"No INT8 model at {path}, create it with "
+            f"python -m wav2lip.quantize --checkpoint_path {checkpoint_path} --face <video> --audio <audio>"
+        )
+    saved = torch.load(path, map_location="cpu", weights_only=True)
+    if saved.get("version") != QUANTIZED_VERSION or saved["checkpoint_size"] != os.path.getsize(checkpoint_path):
+        raise ValueError(f"{path} was made from another checkpoint, quantize {checkpoint_path} again")
+
+    # build the converted structure, then take the saved weights and scales
+    qmodel = _prepare(load_model(checkpoint_path, "cpu"), saved["engine"])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # observers that never saw data
+        qmodel = convert(qmodel)
+    qmodel.load_state_dict(saved["state_dict"])
+    return qmodel
+
+
+def calibration_batches(detector, face, audio_path, frames, batch_size=32, pads=(0, 10, 0, 0), img_size=96):
+    """Model inputs of the first ``frames`` frames of a render, built like inference builds them.
+
+    Args:
+        detector (RetinaFace): Face detector.
+        face (str): Video or image with the face.
+        audio_path (str): Audio to drive it.
+        frames (int): Number of frames to build inputs for.
+        batch_size (int): Frames per batch. Default: 32.
+        pads (tuple): ``(top, bottom, left, right)`` added to the face box.
+        img_size (int): Face size of the model. Default: 96.
+
+    Returns:
+        list: ``(face_batch, mel_batch)`` as NHWC numpy arrays, faces in
+            uint8 with the masked half first like ``datagen``.
+    """
+    from wav2lip import audio
+    from wav2lip.detection import detect_faces
+
+    video_stream = cv2.VideoCapture(face)
+    fps = video_stream.get(cv2.CAP_PROP_FPS) or 25.0
+    images = []
+    while len(images) < frames:
+        still_reading, image = video_stream.read()
+        if not still_reading:
+            break
+        images.append(image)
+    video_stream.release()
+    if not images:
+        raise ValueError(f"Could not read any frame of {face}")
+
+    mel = audio.melspectrogram(audio.load_wav(audio_path, 16000))
+    mel_idx_multiplier = 80.0 / fps
+    mels = []
+    while len(mels) < frames:
+        start = int(len(mels) * mel_idx_multiplier)
+        if start + 16 > mel.shape[1]:
+            break
+        mels.append(mel[:, start : start + 16])
+
+    crops = []
+    for i in range(0, len(images), 8):
+        for image, detection in zip(images[i : i + 8], detect_faces(detector, images[i : i + 8])):
+            if detection is None:
+                continue
+            x1, y1, x2, y2 = detection[0]
+            y1, y2 = max(0, y1 - pads[0]), min(image.shape[0], y2 + pads[1])
+            x1, x2 = max(0, x1 - pads[2]), min(image.shape[1], x2 + pads[3])
+            crops.append(cv2.resize(image[y1:y2, x1:x2], (img_size, img_size)))
+    if not crops:
+        raise ValueError(f"No face found in {face}")
+
+    batches = []
+    for start in range(0, len(mels), batch_size):
+        # the audio may outlast the video, in which case the faces loop
+        faces = np.asarray([crops[i % len(crops)] for i in range(start, min(start + batch_size, len(mels)))])
+        masked = faces.copy()
+        masked[:, img_size // 2 :] = 0
+        face_batch = np.concatenate((masked, faces), axis=3)
+        mel_batch = np.asarray(mels[start : start + len(faces)])[..., np.newaxis]
+        batches.append((face_batch, mel_batch))
+    return batches
+
+
+def split_batches(batches, calibration_frames, batch_size, min_eval_batches=2):
+    """Split the batches of :func:`calibration_batches` into calibration and held-out ones.
+
+    Args:
+        batches (list): Batches in frame order.
+        calibration_frames (int): Frames to calibrate on.
+        batch_size (int): Frames per batch.
+        min_eval_batches (int): Fewest batches left to evaluate on. Default: 2.
+
+    Returns:
+        tuple: ``(calibration, evaluation)`` lists of batches.
+
+    Raises:
+        ValueError: When fewer than ``min_eval_batches`` batches follow the
+            calibration ones, since evaluating on calibration inputs would
+            overstate the INT8 accuracy.
+    """
+    split = max(1, calibration_frames // batch_size)
+    calibration, evaluation = batches[:split], batches[split:]
+    if len(evaluation) < min_eval_batches:
+        raise ValueError(
+            f"Only {len(evaluation)} of {len(batches)} batches are left after the {len(calibration)} "
+            f"calibration batches, at least {min_eval_batches} are needed to evaluate on. "
+            "Use a longer video and audio, or fewer --calibration_frames"
+        )
+    return calibration, evaluation
+
+
+def _run(model, batches):
+    from wav2lip.runtime import to_input
+
+    outputs = []
+    start = time.perf_counter()
+    with torch.inference_mode():
+        for face_batch, mel_batch in batches:
+            outputs.append(model(to_input(mel_batch, "cpu"), to_input(face_batch, "cpu")).numpy())
+    elapsed = time.perf_counter() - start
+    return np.concatenate(outputs).transpose(0, 2, 3, 1), elapsed
+
+
+def compare(model, qmodel, batches, syncnet=None):
+    """Outputs of the INT8 model against the float model on ``batches``.
+
+    Returns:
+        dict: Image metrics of the INT8 faces against the FP32 faces, the
+            time of both and, with ``syncnet``, their mean sync scores.
+    """
+    from wav2lip.metrics import image_metrics, sync_scores
+
+    reference, fp32_s = _run(model, batches)
+    faces, int8_s = _run(qmodel, batches)
+    frames = len(reference)
+    report = {
+        "frames": frames,
+        "fp32_fps": round(frames / fp32_s, 1),
+        "int8_fps": round(frames / int8_s, 1),
+        "speedup": round(fp32_s / int8_s, 2),
+        **image_metrics(reference * 255.0, faces * 255.0),
+    }
+    if syncnet is not None:
+        mels = np.concatenate([mel_batch[..., 0] for _, mel_batch in batches])
+        report["fp32_sync"] = round(float(sync_scores(syncnet, reference, mels).mean()), 4)
+        report["int8_sync"] = round(float(sync_scores(syncnet, faces, mels).mean()), 4)
+    return report
+
+
+def passes_gate(report, min_psnr, max_sync_drop):
+    if report["psnr"] < min_psnr:
+        return False
+    if "int8_sync" in report and report["fp32_sync"] - report["int8_sync"] > max_sync_drop:
+        return False
+    return True
+
+
+def print_report(report):
+    print(f"INT8 against FP32 on {report['frames']} frames")
+    print(f"  speed  {report['fp32_fps']:.1f} -> {report['int8_fps']:.1f} faces/s ({report['speedup']:.2f}x)")
+    print(f"  PSNR   {report['psnr']:.2f} dB, SSIM {report['ssim']:.4f} (min {report['min_ssim']:.4f})")
+    print(f"  pixels mean diff {report['mean_abs_diff']:.2f}, max diff {report['max_abs_diff']:.0f}")
+    if "int8_sync" in report:
+        print(f"  sync   {report['fp32_sync']:.4f} -> {report['int8_sync']:.4f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quantize Wav2Lip to INT8 for CPU inference")
+    parser.add_argument("--checkpoint_path", type=str, required=True, help="Wav2Lip checkpoint to quantize")
+    parser.add_argument("--face", type=str, required=True, help="Video of a face to calibrate and evaluate on")
+    parser.add_argument("--audio", type=str, required=True, help="Audio to drive the face")
+    parser.add_argument("--calibration_frames", type=int, default=256, help="Frames to calibrate on")
+    parser.add_argument("--eval_frames", type=int, default=128, help="Frames after those to evaluate on")
+    parser.add_argument("--batch_size", type=int, default=32, help="Frames per batch")
+    parser.add_argument(
+        "--min_eval_batches", type=int, default=2, help="Fewest batches after the calibration frames to evaluate on"
+    )
+    parser.add_argument("--pads", nargs=4, type=int, default=[0, 10, 0, 0], help="Padding (top, bottom, left, right)")
+    parser.add_argument("--syncnet", type=str, default=None, help="SyncNet checkpoint (lipsync_expert.pth) for sync scores")
+    parser.add_argument("--min_psnr", type=float, default=30.0, help="Lowest PSNR in dB against FP32 to accept")
+    parser.add_argument("--max_sync_drop", type=float, default=0.05, help="Largest drop of the mean sync score to accept")
+    parser.add_argument("--force", default=False, action="store_true", help="Save even when the gate fails")
+    parser.add_argument("--json", default=False, action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    from batch_face import RetinaFace
+
+    from wav2lip.easy_functions import load_model
+    from wav2lip.metrics import load_syncnet
+    from wav2lip.runtime import to_input
+
+    detector = RetinaFace(gpu_id=-1, model_path="checkpoints/mobilenet.pth", network="mobilenet")
+    batches = calibration_batches(
+        detector, args.face, args.audio, args.calibration_frames + args.eval_frames, args.batch_size, args.pads
+    )
+    try:
+        calibration, evaluation = split_batches(
+            batches, args.calibration_frames, args.batch_size, args.min_eval_batches
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+    model = load_model(args.checkpoint_path, "cpu")
+    qmodel = quantize_static(
+        model, ((to_input(mel_batch, "cpu"), to_input(face_batch, "cpu")) for face_batch, mel_batch in calibration)
+    )
+    syncnet = load_syncnet(args.syncnet) if args.syncnet else None
+    report = compare(model, qmodel, evaluation, syncnet)
+    report["passed"] = passes_gate(report, args.min_psnr, args.max_sync_drop)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    if not (report["passed"] or args.force):
+        print("INT8 model rejected by the accuracy gate, not saved")
+        return 1
+    # --precision int8 looks for the model there, so it cannot be saved anywhere else
+    path = quantized_path(args.checkpoint_path)
+    save_quantized(qmodel, path, args.checkpoint_path)
+    print(f"saved {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
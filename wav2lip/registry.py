@@ -0,0 +1,217 @@
+import threading
+import time
+
+import torch
+
+
+def model_bytes(model):
+    """Memory held by the tensors of ``model``, in bytes.
+
+    Modules are measured directly. Other objects, like ``GFPGANer`` or
+    ``RetinaFace``, are measured through the modules among their attributes.
+    Objects without any, like the dlib models, count as 0.
+    """
+    if isinstance(model, torch.nn.Module):
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors if t.device.type != "meta")
+    return sum(model_bytes(v) for v in getattr(model, "__dict__", {}).values() if isinstance(v, torch.nn.Module))
+
+
+class _Entry:
+    def __init__(self):
+        self.model = None
+        self.bytes = 0
+        self.load_seconds = None
+        self.last_used = 0.0
+        self.loads = self.hits = 0
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """Loads models by name and device on first use and keeps them resident.
+
+    Every model is registered with a loader, called with the device the first
+    time the model is asked for. Later calls return the same object, so every
+    session of a process shares one copy. A model is loaded once even when
+    several threads ask for it at the same time.
+
+    Models that were not used for ``idle_seconds`` are dropped, and while the
+    resident models need more than ``memory_budget`` bytes the least recently
+    used ones are dropped too. Models marked ``pinned`` are never dropped.
+    Dropping only releases the registry's reference, a session still holding
+    the model keeps it alive until it is done.
+
+    Args:
+        memory_budget (int): Bytes the resident models may take, 0 for no
+            limit. Default: 0.
+        idle_seconds (float): Seconds after which an unused model is dropped,
+            0 to keep models until the budget needs the room. Default: 0.
+    """
+
+    def __init__(self, memory_budget=0, idle_seconds=0):
+        self.memory_budget = memory_budget
+        self.idle_seconds = idle_seconds
+        self._loaders = {}
+        self._pinned = set()
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._evictor = None
+        self._stop = threading.Event()
+
+    def register(self, name, loader, pinned=False):
+        """Register ``loader(device)`` as the way to load ``name``.
+
+        Args:
+            name (str): Model name.
+            loader (callable): Called with the device, returns the model.
+            pinned (bool): Never drop the model once loaded. Default: False.
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            if pinned:
+                self._pinned.add(name)
+            else:
+                self._pinned.discard(name)
+
+    def _entry(self, name, device):
+        with self._lock:
+            if name not in self._loaders:
+                raise KeyError(f"No model registered as {name!r}")
+            return self._entries.setdefault((name, device), _Entry())
+
+    def get(self, name, device="cpu"):
+        """Return model ``name`` on ``device``, loading it if needed."""
+        entry = self._entry(name, device)
+        with entry.lock:
+            if entry.model is None:
+                start = time.perf_counter()
+                entry.model = self._loaders[name](device)
+                entry.load_seconds = time.perf_counter() - start
+                entry.bytes = model_bytes(entry.model)
+                entry.loads += 1
+                print(f"loaded {name} on {device} in {entry.load_seconds:.2f}s")
+            else:
+                entry.hits += 1
+            entry.last_used = time.monotonic()
+            model = entry.model
+        self.evict(keep=(name, device))
+        return model
+
+    def preload(self, names, device="cpu"):
+        """Load ``names`` on a background thread so the first ``get`` finds them ready.
+
+        Returns:
+            threading.Thread: The loading thread, already started.
+        """
+        def load():
+            for name in names:
+                try:
+                    self.get(name, device)
+                except Exception as e:
+                    # the render that needs it raises when it asks again
+                    print(f"preloading {name} failed: {e}")
+
+        thread = threading.Thread(target=load, name="preload", daemon=True)
+        thread.start()
+        return thread
+
+    def loaded(self, name, device="cpu"):
+        entry = self._entries.get((name, device))
+        return entry is not None and entry.model is not None
+
+    def evict(self, now=None, keep=None):
+        """Drop idle models and, over the memory budget, the least recently used.
+
+        Args:
+            now (float, optional): ``time.monotonic()`` to measure idle time
+                against. Default: now.
+            keep (tuple, optional): ``(name, device)`` of a model not to drop,
+                e.g. the one just asked for. Default: None.
+
+        Returns:
+            list: ``(name, device)`` of the dropped models.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            resident = [
+                (key, entry) for key, entry in self._entries.items()
+                if entry.model is not None and key[0] not in self._pinned and key != keep
+            ]
+            total = sum(entry.bytes for entry in self._entries.values() if entry.model is not None)
+        resident.sort(key=lambda item: item[1].last_used)
+
+        dropped = []
+        for key, entry in resident:
+            idle = self.idle_seconds and now - entry.last_used > self.idle_seconds
+            over = self.memory_budget and total > self.memory_budget
+            if not (idle or over):
+                continue
+            # a model being loaded or handed out right now is skipped
+            if not entry.lock.acquire(blocking=False):
+                continue
+            try:
+                if entry.model is not None:
+                    entry.model = None
+                    total -= entry.bytes
+                    dropped.append(key)
+            finally:
+                entry.lock.release()
+        if dropped and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        return dropped
+
+    def start_evicting(self, interval):
+        """Call :meth:`evict` every ``interval`` seconds on a background thread.
+
+        :meth:`get` only evicts when a model is asked for, so without this an
+        idle process keeps its models however long it waits. Calling it again
+        while the thread runs only changes the interval.
+
+        Args:
+            interval (float): Seconds between two evictions.
+        """
+        self._interval = interval
+        if self._evictor is not None and self._evictor.is_alive():
+            return
+
+        def run():
+            while not self._stop.wait(self._interval):
+                dropped = self.evict()
+                if dropped:
+                    print("evicted " + ", ".join(f"{name} on {device}" for name, device in dropped))
+
+        self._stop.clear()
+        self._evictor = threading.Thread(target=run, name="evict", daemon=True)
+        self._evictor.start()
+
+    def stop_evicting(self):
+        """Stop the thread of :meth:`start_evicting`."""
+        if self._evictor is not None:
+            self._stop.set()
+            self._evictor.join()
+            self._evictor = None
+
+    def stats(self):
+        """Load time, size and use counts of every model asked for so far."""
+        with self._lock:
+            items = sorted(self._entries.items())
+        return [
+            {
+                "name": name,
+                "device": device,
+                "resident": entry.model is not None,
+                "load_s": None if entry.load_seconds is None else round(entry.load_seconds, 3),
+                "mb": round(entry.bytes / 2**20, 1),
+                "loads": entry.loads,
+                "hits": entry.hits,
+            }
+            for (name, device), entry in items
+        ]
+
+    def report(self):
+        lines = [f"{'model':<20}{'device':>8}{'load s':>8}{'MB':>8}{'loads':>7}{'hits':>8}"]
+        for s in self.stats():
+            load_s = "-" if s["load_s"] is None else f"{s['load_s']:.2f}"
+            name = s["name"] + ("" if s["resident"] else " (evicted)")
+            lines.append(f"{name:<20}{s['device']:>8}{load_s:>8}{s['mb']:>8.1f}{s['loads']:>7}{s['hits']:>8}")
+        return "\n".join(lines)
@@ -0,0 +1,167 @@
+import os
+import threading
+
+import numpy as np
+import torch
+
+
+def best_device():
+    return "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
+
+
+def select_device(requested="auto"):
+    """Device to render on, ``"auto"`` for the best one available.
+
+    Raises:
+        ValueError: When the requested device is not available.
+    """
+    if requested == "auto":
+        return best_device()
+    if requested == "cuda" and not torch.cuda.is_available():
+        raise ValueError("--device cuda was requested but CUDA is not available")
+    if requested == "mps" and not torch.backends.mps.is_available():
+        raise ValueError("--device mps was requested but MPS is not available")
+    return requested
+
+
+def host_cpus():
+    """CPUs this process may run on, which in a container can be fewer than the host has."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not on Linux
+        return os.cpu_count() or 1
+
+
+def cpu_threads(threads=0, interop_threads=0):
+    """Intra-op and inter-op thread counts for CPU inference.
+
+    Wav2Lip is one chain of convolutions, so a single inter-op thread is
+    enough, and every CPU goes to the intra-op pool. More threads than CPUs
+    only make the threads preempt each other.
+
+    Args:
+        threads (int): Intra-op threads, 0 for one per CPU. Default: 0.
+        interop_threads (int): Inter-op threads, 0 for 1. Default: 0.
+
+    Returns:
+        tuple: ``(threads, interop_threads)``.
+    """
+    return (threads if threads > 0 else host_cpus()), (interop_threads if interop_threads > 0 else 1)
+
+
+def configure_cpu(threads=0, interop_threads=0):
+    """Set the torch thread pools for CPU inference, see :func:`cpu_threads`.
+
+    Returns:
+        tuple: The ``(threads, interop_threads)`` in effect.
+    """
+    threads, interop_threads = cpu_threads(threads, interop_threads)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(interop_threads)
+    except RuntimeError:
+        # only possible before the first parallel work of the process
+        interop_threads = torch.get_num_interop_threads()
+    return threads, interop_threads
+
+
+def prepare_model(model, device):
+    """Put a loaded model in the memory format that is fastest on ``device``.
+
+    On the CPU the oneDNN convolutions run fastest on channels_last tensors,
+    on CUDA the default layout is kept.
+    """
+    if device == "cpu":
+        model = model.to(memory_format=torch.channels_last)
+    return model
+
+
+def resolve_precision(precision, device):
+    """Precision Wav2Lip runs in on ``device``.
+
+    ``"half"`` picks the 16 bit float type the device is fast at: bfloat16 on
+    the CPU, where oneDNN has bfloat16 kernels but float16 is slower than
+    FP32, and float16 on CUDA and MPS.
+    """
+    if precision == "half":
+        return "bf16" if device == "cpu" else "fp16"
+    return precision
+
+
+# torch dtype of the reduced float precisions
+HALF_DTYPES = {"bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+def to_input(batch, device):
+    """float32 NCHW tensor of an NHWC numpy batch on ``device``.
+
+    uint8 batches are moved as uint8 and only scaled to [0, 1] floats on
+    ``device``, a quarter of the bytes of float32.
+
+    On the CPU the NHWC data already is the channels_last layout of the NCHW
+    tensor, so it is only viewed as NCHW instead of being transposed.
+    """
+    if batch.dtype == np.uint8:
+        tensor = torch.from_numpy(np.ascontiguousarray(batch)).to(device).permute(0, 3, 1, 2).float().div_(255.0)
+        return tensor if device == "cpu" else tensor.contiguous()
+    if device == "cpu":
+        return torch.from_numpy(np.ascontiguousarray(batch)).permute(0, 3, 1, 2).float()
+    return torch.FloatTensor(np.transpose(batch, (0, 3, 1, 2))).to(device)
+
+
+class ParityGuard:
+    """Wav2Lip in bfloat16 or float16 that falls back to FP32 when it is off.
+
+    The first ``check_batches`` batches also run through the FP32 model and
+    the outputs are compared. When they differ by more than ``atol``, when
+    the reduced model returns a non-finite value, or when it fails because
+    the device lacks a kernel for the dtype, every later batch runs in FP32.
+
+    Args:
+        model (Module): Wav2Lip cast to ``dtype``.
+        reference (callable): Returns the FP32 model, only called for the
+            checked batches and after falling back.
+        dtype (torch.dtype): Dtype of ``model``.
+        atol (float): Largest difference to the FP32 output, which is in
+            [0, 1]. Default: 4 / 255.
+        check_batches (int): Batches to compare with FP32. Default: 1.
+    """
+
+    def __init__(self, model, reference, dtype, atol=4 / 255, check_batches=1):
+        self.model = model
+        self.reference = reference
+        self.dtype = dtype
+        self.atol = atol
+        self.check_batches = check_batches
+        self.checked = 0
+        self.fallback_reason = None
+        self.lock = threading.Lock()
+
+    def __call__(self, mel, face):
+        if self.fallback_reason is None:
+            try:
+                out = self.model(mel.to(self.dtype), face.to(self.dtype)).float()
+            except RuntimeError as e:  # an op without a kernel for the dtype on this device
+                self._fall_back(str(e).splitlines()[0])
+            else:
+                if not torch.isfinite(out).all():
+                    self._fall_back("non-finite output")
+                else:
+                    with self.lock:
+                        check = self.checked < self.check_batches
+                        self.checked += check
+                    if not check:
+                        return out
+                    expected = self.reference()(mel, face)
+                    diff = float((out - expected).abs().max())
+                    if diff <= self.atol:
+                        return out
+                    self._fall_back(f"output differs from FP32 by {diff:.4f}")
+                    return expected
+        return self.reference()(mel, face)
+
+    def _fall_back(self, reason):
+        with self.lock:
+            if self.fallback_reason is None:
+                self.fallback_reason = reason
+                print(f"\n{self.dtype} Wav2Lip falls back to FP32: {reason}")
@@ -0,0 +1,153 @@
+import math
+
+import numpy as np
+
+
+def get_smoothened_box(boxes, i, T):
+    """Smooth ``boxes[i]`` in place over the window of ``T`` boxes starting at it.
+
+    The last ``T - 1`` boxes use the last full window, which by then holds
+    boxes that were already smoothed. :func:`get_smoothened_boxes` reproduces
+    exactly that.
+    """
+    if i + T > len(boxes):
+        window = boxes[len(boxes) - T :]
+    else:
+        window = boxes[i : i + T]
+    boxes[i] = [int(v) for v in np.mean(window, axis=0)]
+
+
+def moving_average(boxes, T):
+    """Vectorized equivalent of calling :func:`get_smoothened_box` for every box.
+
+    Args:
+        boxes (array_like): Boxes, shape (n, 4).
+        T (int): Window length.
+
+    Returns:
+        ndarray: int64 smoothed boxes, shape (n, 4).
+    """
+    raw = np.asarray(boxes, np.int64).reshape(-1, 4)
+    n = len(raw)
+    out = np.empty_like(raw)
+    full = max(0, n - T + 1)
+    if full:
+        # every window that fits only holds boxes that were not smoothed yet
+        sums = np.cumsum(np.concatenate([np.zeros((1, 4), np.int64), raw]), axis=0)
+        out[:full] = np.trunc((sums[T:T + full] - sums[:full]) / T)
+
+    # the tail reads back boxes smoothed before it, so it stays sequential,
+    # and its windows all cover the last T boxes
+    offset = full - 1 if full else 0
+    tail = out[offset:full].tolist() + raw[full:].tolist()
+    for i in range(full, n):
+        get_smoothened_box(tail, i - offset, T)
+    out[full:] = np.asarray(tail[full - offset :], np.int64).reshape(-1, 4)
+    return out
+
+
+def get_smoothened_boxes(boxes, T):
+    """Smooth a list of boxes in place, see :func:`moving_average`."""
+    if len(boxes):
+        boxes[:] = moving_average(boxes, T).tolist()
+    return boxes
+
+
+class EmaFilter:
+    """Causal exponential smoothing of boxes.
+
+    Args:
+        alpha (float): Weight of the newest box, 1 disables the smoothing.
+            Default: 0.5.
+    """
+
+    def __init__(self, alpha=0.5):
+        self.alpha = alpha
+        self.state = None
+
+    def reset(self):
+        self.state = None
+
+    def __call__(self, box, t=None):
+        box = np.asarray(box, np.float64)
+        if self.state is None:
+            self.state = box
+        else:
+            self.state = self.alpha * box + (1 - self.alpha) * self.state
+        return [int(round(v)) for v in self.state]
+
+
+class OneEuroFilter:
+    """Causal One-Euro filter for boxes.
+
+    The cutoff frequency rises with the speed of the box, so a still face is
+    smoothed heavily while a moving one is followed with little lag. Only the
+    last box and its speed are kept.
+
+    Args:
+        freq (float): Frame rate, used when no timestamps are given.
+        min_cutoff (float): Cutoff in Hz of a still box. Default: 1.0.
+        beta (float): Cutoff increase per pixel per second of speed.
+            Default: 0.05.
+        d_cutoff (float): Cutoff in Hz used to smooth the speed. Default: 1.0.
+    """
+
+    def __init__(self, freq, min_cutoff=1.0, beta=0.05, d_cutoff=1.0):
+        self.freq = freq
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.state = self.speed = self.t = None
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, box, t=None):
+        box = np.asarray(box, np.float64)
+        if self.state is None:
+            self.state, self.speed, self.t = box, np.zeros_like(box), t
+            return [int(round(v)) for v in box]
+
+        dt = (t - self.t) if t is not None and self.t is not None else 1.0 / self.freq
+        dt = max(dt, 1e-6)
+        self.t = t
+
+        a_d = self._alpha(self.d_cutoff, dt)
+        self.speed = a_d * (box - self.state) / dt + (1 - a_d) * self.speed
+        cutoff = self.min_cutoff + self.beta * np.abs(self.speed)
+        a = self._alpha(cutoff, dt)
+        self.state = a * box + (1 - a) * self.state
+        return [int(round(v)) for v in self.state]
+
+
+def causal_filter(mode, fps):
+    """Filter object for a causal smoothing mode, ``"ema"`` or ``"one_euro"``."""
+    if mode == "ema":
+        return EmaFilter()
+    if mode == "one_euro":
+        return OneEuroFilter(fps)
+    raise ValueError(f"Unknown smoothing mode: {mode}")
+
+
+def smooth_track(boxes, mode="window", fps=25.0, T=5):
+    """Smooth a whole track of boxes that are all known up front.
+
+    Args:
+        boxes (array_like): Boxes in frame order, shape (n, 4).
+        mode (str): ``"window"`` for the window of :func:`moving_average`,
+            or a causal mode of :func:`causal_filter`. Default: "window".
+        fps (float): Frame rate, used by the causal filters. Default: 25.
+        T (int): Window length. Default: 5.
+
+    Returns:
+        list[list[int]]: The smoothed boxes.
+    """
+    if mode == "window":
+        return get_smoothened_boxes([list(box) for box in boxes], T)
+    box_filter = causal_filter(mode, fps)
+    return [box_filter(box) for box in boxes]
@@ -0,0 +1,209 @@
+import cv2
+import numpy as np
+
+
+def box_iou(a, b):
+    """Intersection over union of two ``(x1, y1, x2, y2)`` boxes."""
+    iw = min(a[2], b[2]) - max(a[0], b[0])
+    ih = min(a[3], b[3]) - max(a[1], b[1])
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def thumbnail(frame, size=(32, 18)):
+    """Tiny grayscale copy of a frame, compared between frames to find scene cuts."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+def compare_boxes(reference, boxes):
+    """Accuracy of tracked boxes against per-frame detection.
+
+    Args:
+        reference (list): ``(x1, y1, x2, y2)`` per frame from full detection.
+        boxes (list): ``(x1, y1, x2, y2)`` per frame to check.
+
+    Returns:
+        dict: Mean, 5th percentile and minimum IoU, and the mean and maximum
+            distance between box centers in pixels.
+    """
+    ious = np.array([box_iou(a, b) for a, b in zip(reference, boxes)])
+    ref = np.asarray(reference, np.float64)[: len(ious)]
+    got = np.asarray(boxes, np.float64)[: len(ious)]
+    centers = np.hypot(
+        (ref[:, 0] + ref[:, 2] - got[:, 0] - got[:, 2]) / 2,
+        (ref[:, 1] + ref[:, 3] - got[:, 1] - got[:, 3]) / 2,
+    )
+    return {
+        "frames": len(ious),
+        "mean_iou": round(float(ious.mean()), 4),
+        "p5_iou": round(float(np.percentile(ious, 5)), 4),
+        "min_iou": round(float(ious.min()), 4),
+        "mean_center_px": round(float(centers.mean()), 2),
+        "max_center_px": round(float(centers.max()), 2),
+    }
+
+
+class _Keyframe:
+    def __init__(self, frame, detection, template_size):
+        self.detection = detection
+        self.template = self.scale = None
+        if detection is None:
+            return
+        x1, y1, x2, y2 = detection[0]
+        patch = frame[max(0, y1) : y2, max(0, x1) : x2]
+        if patch.size == 0:
+            return
+        self.scale = min(1.0, template_size / max(patch.shape[:2]))
+        gray = cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY)
+        self.template = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+
+class KeyframeTracker:
+    """Face detection on keyframes only, for videos where the face barely moves.
+
+    Every frame between two keyframes is matched against the face of the last
+    keyframe with a small normalized template match. When the match is good the
+    frame is buffered, and once the next keyframe is detected the buffered boxes
+    and landmarks are interpolated between the two detections. A frame becomes
+    a keyframe early when the match score drops below ``min_match``, when the
+    matched face has moved by more than ``min_iou`` allows, or on a scene cut.
+    Frames before an early keyframe keep their matched boxes instead of being
+    interpolated towards a face that may be somewhere else.
+
+    The interval adapts between 1 and ``max_interval``. It doubles when a
+    scheduled detection lands where the template match predicted and halves
+    when it does not or when a frame has to be detected early.
+
+    Args:
+        detect (callable): Called with one frame, returns ``(box, landmarks)``
+            with box as ``(x1, y1, x2, y2)`` ints, or None without a face.
+        max_interval (int): Largest number of frames from one keyframe to the
+            next.
+        min_match (float): Smallest template match score (TM_CCOEFF_NORMED)
+            still trusted. Default: 0.6.
+        min_iou (float): Smallest IoU between the keyframe box and a matched
+            or newly detected box still counted as the same position.
+            Default: 0.7.
+        cut_threshold (float): Mean absolute difference of two consecutive
+            frame thumbnails, in gray levels, above which a scene cut is
+            assumed. Default: 30.
+        template_size (int): Longest side the face template is shrunk to.
+            Default: 48.
+    """
+
+    def __init__(self, detect, max_interval, min_match=0.6, min_iou=0.7, cut_threshold=30, template_size=48):
+        self.detect = detect
+        self.max_interval = max(1, int(max_interval))
+        self.min_match = min_match
+        self.min_iou = min_iou
+        self.cut_threshold = cut_threshold
+        self.template_size = template_size
+        self.interval = min(4, self.max_interval)
+        self.frames = self.detections = self.redetections = self.cuts = 0
+
+    def _keyframe(self, frame, previous=None):
+        self.detections += 1
+        detection = self.detect(frame)
+        if detection is None and previous is not None:
+            # no face here, carry the last one on like per-frame detection does
+            detection = previous.detection
+        return _Keyframe(frame, detection, self.template_size)
+
+    def _match(self, frame, key):
+        if key.template is None:
+            return None
+        (x1, y1, x2, y2), landmarks = key.detection
+        mx, my = (x2 - x1) // 2, (y2 - y1) // 2
+        sx1, sy1 = max(0, x1 - mx), max(0, y1 - my)
+        sx2, sy2 = min(frame.shape[1], x2 + mx), min(frame.shape[0], y2 + my)
+        window = cv2.cvtColor(frame[sy1:sy2, sx1:sx2], cv2.COLOR_BGR2GRAY)
+        window = cv2.resize(window, None, fx=key.scale, fy=key.scale, interpolation=cv2.INTER_AREA)
+        th, tw = key.template.shape
+        if window.shape[0] < th or window.shape[1] < tw:
+            return None
+
+        result = cv2.matchTemplate(window, key.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (lx, ly) = cv2.minMaxLoc(result)
+        if not np.isfinite(score) or score < self.min_match:
+            return None
+
+        dx = int(round(sx1 + lx / key.scale - max(0, x1)))
+        dy = int(round(sy1 + ly / key.scale - max(0, y1)))
+        box = (x1 + dx, y1 + dy, x2 + dx, y2 + dy)
+        if box_iou(box, key.detection[0]) < self.min_iou:
+            return None
+        return box, landmarks + np.array([dx, dy], dtype=landmarks.dtype)
+
+    def _interpolate(self, start, end, count):
+        (b0, l0), (b1, l1) = start, end
+        b0, b1 = np.asarray(b0, np.float64), np.asarray(b1, np.float64)
+        for i in range(1, count + 1):
+            t = i / (count + 1)
+            box = tuple(int(v) for v in np.round(b0 + (b1 - b0) * t))
+            yield box, (l0 + (l1 - l0) * t).astype(l0.dtype)
+
+    def track(self, frames):
+        """Yield ``(box, landmarks)`` or None for every frame, in order.
+
+        Args:
+            frames (iterable): BGR frames. Up to ``max_interval`` of them are
+                read ahead of what has been yielded.
+        """
+        key = None
+        segment = []
+        prev_thumb = None
+        for frame in frames:
+            self.frames += 1
+            thumb = thumbnail(frame)
+            cut = prev_thumb is not None and np.abs(thumb - prev_thumb).mean() > self.cut_threshold
+            prev_thumb = thumb
+
+            if key is None or key.detection is None:
+                key = self._keyframe(frame, key)
+                yield key.detection
+                continue
+
+            if cut:
+                self.cuts += 1
+            matched = None if cut else self._match(frame, key)
+            if matched is not None and len(segment) + 1 < self.interval:
+                segment.append(matched)
+                continue
+
+            new_key = self._keyframe(frame, key)
+            if matched is None:
+                # drifted or cut: keep the matched boxes of the old position
+                self.redetections += 1
+                self.interval = max(1, self.interval // 2)
+                yield from segment
+            else:
+                if new_key.detection is key.detection or box_iou(matched[0], new_key.detection[0]) >= self.min_iou:
+                    self.interval = min(self.max_interval, self.interval * 2)
+                else:
+                    self.interval = max(1, self.interval // 2)
+                yield from self._interpolate(key.detection, new_key.detection, len(segment))
+            yield new_key.detection
+            key, segment = new_key, []
+
+        # the video ended between keyframes
+        yield from segment
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "detections": self.detections,
+            "redetections": self.redetections,
+            "scene_cuts": self.cuts,
+            "interval": self.interval,
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (
+            f"face detection ran on {s['detections']} of {s['frames']} frames "
+            f"({s['redetections']} early, {s['scene_cuts']} scene cuts)"
+        )
@@ -0,0 +1,86 @@
+"""Silence detection, so pauses in the audio can skip Wav2Lip.
+
+Every video frame is rendered from a window of the mel spectrogram. A frame is
+silent when the audio under its window is much quieter than the loudest
+window, and only long enough runs of silent frames count, so short closures
+between words keep their lip motion.
+"""
+import numpy as np
+
+
+def window_loudness(wav, starts, hop_size, window):
+    """Loudness in dBFS of the audio under every mel window.
+
+    Args:
+        wav (ndarray): Waveform in [-1, 1].
+        starts (list[int]): First mel frame of every window.
+        hop_size (int): Samples per mel frame.
+        window (int): Mel frames per window.
+
+    Returns:
+        ndarray: RMS level of every window in dB, -inf for digital silence.
+    """
+    power = np.concatenate([[0.0], np.cumsum(np.asarray(wav, np.float64) ** 2)])
+    begin = np.clip(np.asarray(starts, np.int64) * hop_size, 0, len(wav))
+    end = np.clip(begin + window * hop_size, 0, len(wav))
+    mean = (power[end] - power[begin]) / np.maximum(end - begin, 1)
+    with np.errstate(divide="ignore"):
+        return 10 * np.log10(mean)
+
+
+def silent_frames(loudness, threshold_db=40.0, min_frames=1):
+    """Frames whose window is ``threshold_db`` below the loudest one.
+
+    Args:
+        loudness (ndarray): See :func:`window_loudness`.
+        threshold_db (float): How far below the loudest window a window is
+            silent. Default: 40.
+        min_frames (int): Shortest run of silent frames that counts, shorter
+            pauses are left alone. Default: 1.
+
+    Returns:
+        ndarray: bool per frame.
+    """
+    loudness = np.asarray(loudness, np.float64)
+    if not len(loudness) or not np.isfinite(loudness).any():
+        return np.ones(len(loudness), bool)
+    silent = loudness < np.max(loudness[np.isfinite(loudness)]) - threshold_db
+    # runs of silent frames are [starts[k], ends[k])
+    edges = np.diff(np.concatenate([[0], silent.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    lengths = ends - starts
+    # the silent frames in order are the runs one after the other
+    silent[silent] = np.repeat(lengths >= min_frames, lengths)
+    return silent
+
+
+def fade_weights(silent, fade_frames=3):
+    """Weight of the generated face in every frame, 0 inside silent runs.
+
+    The weight ramps down over the first ``fade_frames`` frames of a silent
+    run and back up over its last ones, so the mouth does not snap shut.
+    Runs at the start or end of the audio have no ramp on that side.
+
+    Args:
+        silent (ndarray): bool per frame, see :func:`silent_frames`.
+        fade_frames (int): Frames of every ramp, 0 for hard cuts. Default: 3.
+
+    Returns:
+        ndarray: float32 weights in [0, 1].
+    """
+    silent = np.asarray(silent, bool)
+    n = len(silent)
+    weights = np.where(silent, 0.0, 1.0)
+    if not fade_frames:
+        return weights.astype(np.float32)
+    # distance of every silent frame to the nearest voiced frame before and after it
+    index = np.arange(n)
+    before = np.maximum.accumulate(np.where(silent, -1, index))
+    after = np.minimum.accumulate(np.where(silent, n, index)[::-1])[::-1]
+    distance = np.minimum(
+        np.where(before >= 0, index - before, np.inf),
+        np.where(after < n, after - index, np.inf),
+    )
+    ramp = silent & (distance <= fade_frames)
+    weights[ramp] = 1 - distance[ramp] / (fade_frames + 1)
+    return weights.astype(np.float32)
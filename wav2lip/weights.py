@@ -0,0 +1,183 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+# safetensors dtype names and their torch dtypes; torch is only imported by the
+# functions that load or write weights, so checking files stays cheap
+_DTYPES = {
+    "F64": "float64",
+    "F32": "float32",
+    "F16": "float16",
+    "BF16": "bfloat16",
+    "I64": "int64",
+    "I32": "int32",
+    "I16": "int16",
+    "I8": "int8",
+    "U8": "uint8",
+    "BOOL": "bool",
+}
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def weights_path(checkpoint_path):
+    """Path of the safetensors file a ``.pth`` checkpoint is converted to."""
+    return os.path.splitext(checkpoint_path)[0] + ".safetensors"
+
+
+def _checksum_path(path):
+    return path + ".sha256"
+
+
+def write_checksum(path):
+    """Record the sha256 and size of ``path`` in ``<path>.sha256``."""
+    with open(_checksum_path(path), "w") as f:
+        f.write(f"{file_sha256(path)} {os.path.getsize(path)}\n")
+
+
+def read_checksum(path):
+    """Return ``(sha256, size)`` recorded for ``path``, or None."""
+    try:
+        with open(_checksum_path(path)) as f:
+            digest, size = f.read().split()
+    except (OSError, ValueError):
+        return None
+    return digest, int(size)
+
+
+def verify_weights(path):
+    """Whether ``path`` still has the sha256 recorded when it was written."""
+    recorded = read_checksum(path)
+    return recorded is not None and recorded[0] == file_sha256(path)
+
+
+def read_metadata(path):
+    """The ``__metadata__`` of a safetensors file, reading only its header."""
+    with open(path, "rb") as f:
+        try:
+            (header_size,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_size))
+        except (struct.error, ValueError):
+            raise ValueError(f"{path} is damaged, convert the checkpoint again") from None
+    return header.get("__metadata__", {})
+
+
+def _source_changed(path, checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        # only the converted file was shipped
+        return False
+    metadata = read_metadata(path)
+    stat = os.stat(checkpoint_path)
+    if metadata.get("source_size") != str(stat.st_size):
+        return True
+    if metadata.get("source_mtime_ns") == str(stat.st_mtime_ns):
+        return False
+    # touched or copied, which only matters if the contents changed
+    return metadata.get("source_sha256") != file_sha256(checkpoint_path)
+
+
+def convert_checkpoint(checkpoint_path, path=None, transform=None):
+    """Convert a Wav2Lip ``.pth`` checkpoint to safetensors once.
+
+    The ``state_dict`` is stored flat, without the ``module.`` prefix of
+    DataParallel checkpoints and with the sha256, size and modification time
+    of the source checkpoint in the metadata. A checksum file is written next
+    to it. Later calls return straight away while the checksum file matches
+    the size of the weights and the source checkpoint is unchanged.
+
+    Args:
+        checkpoint_path (str): Path of the ``.pth`` checkpoint.
+        path (str, optional): Where to write the weights. Default:
+            :func:`weights_path` of the checkpoint.
+        transform (callable, optional): Called with the ``state_dict``
+            before it is written, returns the ``state_dict`` to store.
+            Default: None, store it as it is.
+
+    Returns:
+        str: Path of the safetensors file.
+    """
+    path = path or weights_path(checkpoint_path)
+    recorded = read_checksum(path)
+    if (
+        recorded is not None
+        and os.path.exists(path)
+        and os.path.getsize(path) == recorded[1]
+        and not _source_changed(path, checkpoint_path)
+    ):
+        return path
+
+    import torch
+    from safetensors.torch import save_file
+
+    print("Converting {} to {}".format(checkpoint_path, os.path.basename(path)))
+    checkpoint = torch.load(checkpoint_path, map_location="cpu", weights_only=True)
+    state_dict = checkpoint.get("state_dict", checkpoint)
+    state_dict = {k.replace("module.", ""): v for k, v in state_dict.items()}
+    if transform is not None:
+        state_dict = transform(state_dict)
+    state_dict = {k: v.contiguous() for k, v in state_dict.items()}
+
+    stat = os.stat(checkpoint_path)
+    metadata = {
+        "source_sha256": file_sha256(checkpoint_path),
+        "source_size": str(stat.st_size),
+        "source_mtime_ns": str(stat.st_mtime_ns),
+    }
+    # write next to the final file and rename, so a crash never leaves half a file
+    partial = path + ".partial"
+    save_file(state_dict, partial, metadata=metadata)
+    os.replace(partial, path)
+    write_checksum(path)
+    return path
+
+
+def load_weights(path, device="cpu", verify=False):
+    """Load a safetensors file without copying it.
+
+    The file is memory mapped copy-on-write and every tensor is a view of the
+    mapping, so loading only reads the header and processes that load the same
+    file share its pages. Tensors are only copied when moved to another device.
+
+    Args:
+        path (str): Path of the safetensors file.
+        device (str): Device to put the tensors on. Default: "cpu".
+        verify (bool): Hash the whole file and compare it with its checksum
+            file first. Default: False, only the size is compared.
+
+    Returns:
+        dict[str, torch.Tensor]: The state dict.
+    """
+    recorded = read_checksum(path)
+    if recorded is None:
+        raise ValueError(f"No checksum for {path}, convert the checkpoint again")
+    if os.path.getsize(path) != recorded[1] or (verify and file_sha256(path) != recorded[0]):
+        raise ValueError(f"{path} does not match its checksum, convert the checkpoint again")
+
+    import torch
+
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    try:
+        (header_size,) = struct.unpack("<Q", mapped[:8])
+        header = json.loads(mapped[8 : 8 + header_size])
+    except (struct.error, ValueError):
+        raise ValueError(f"{path} is damaged, convert the checkpoint again") from None
+    header.pop("__metadata__", None)
+
+    state_dict = {}
+    for name, info in header.items():
+        dtype = getattr(torch, _DTYPES[info["dtype"]])
+        start, end = info["data_offsets"]
+        count = (end - start) // torch.tensor([], dtype=dtype).element_size()
+        tensor = torch.frombuffer(mapped, dtype=dtype, count=count, offset=8 + header_size + start)
+        tensor = tensor.reshape(info["shape"])
+        state_dict[name] = tensor if device == "cpu" else tensor.to(device)
+    return state_dict